@@ -0,0 +1,72 @@
+"""Micro-benchmark: title scoring cost vs. keyword list size.
+
+    python benchmarks/keywords.py [--sizes 10,100,1000,5000] [--titles 2000]
+
+Compares the compiled Aho-Corasick scorer used by evaluate_video_popularity
+with the previous approach (a substring scan per keyword). The automaton's
+per-title cost should stay flat as the list grows; the linear scan's grows
+with it.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teletube.keywords import TitleScorer, QUALITY_WORDS, FRESH_WORDS  # noqa: E402
+from teletube.utils import load_keywords  # noqa: E402
+
+ALPHABET = "абвгдежзиклмнопрстуфхцчшэюя"
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(4, 10)))
+
+
+def linear_score(title: str, keywords):
+    hits = sum(1 for k in keywords if k in title)
+    quality = (3 if any(w in title for w in QUALITY_WORDS) else 0) + (2 if any(w in title for w in FRESH_WORDS) else 0)
+    return hits, quality
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    parser.add_argument("--titles", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    pool = [_word(rng) for _ in range(20000)]
+    titles = [" ".join(rng.choice(pool) for _ in range(rng.randint(3, 10))) for _ in range(args.titles)]
+
+    print(f"{'keywords':>9} {'automaton us/title':>19} {'linear us/title':>16} {'compile ms':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "keywords.txt")
+        for size in (int(x) for x in args.sizes.split(",")):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(rng.sample(pool, size)) + "\n")
+            scorer = TitleScorer(path, load_keywords)
+            start = time.perf_counter()
+            scorer.automaton()
+            compile_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for t in titles:
+                scorer.score(t)
+            automaton_us = (time.perf_counter() - start) / len(titles) * 1e6
+
+            keywords = load_keywords(path)
+            start = time.perf_counter()
+            for t in titles:
+                linear_score(t, keywords)
+            linear_us = (time.perf_counter() - start) / len(titles) * 1e6
+
+            assert all(scorer.score(t) == linear_score(t, keywords) for t in titles[:200])
+            print(f"{size:>9} {automaton_us:>19.1f} {linear_us:>16.1f} {compile_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""End-to-end replay benchmark: real dispatcher, fake Telegram, deterministic updates.
+
+    python benchmarks/replay.py [--users 10000] [--updates 50000] [--concurrency 64] [--seed 1]
+    python benchmarks/replay.py --record stream.jsonl          # also save the generated updates
+    python benchmarks/replay.py --input stream.jsonl           # replay saved/recorded updates
+    python benchmarks/replay.py --db sqlite:///replay.db --http
+
+Updates (a seeded mix of /addvideo, /daily, /shop and shop purchases, /lp,
+/myprofile, charts and so on) are fed through `main.build_dispatcher()` with up
+to --concurrency in flight, the way the polling loop and shard workers feed
+them. The Bot API is a stub session, or with --http a local aiohttp server
+behind `TELEGRAM_API_SERVER` so requests also go through aiogram's HTTP client.
+The game's own `random` is seeded too, so with --concurrency 1 two runs end
+in the same state (compare the printed digest). The database and the event
+history live in a temporary directory; outgoing rate limits and per-user
+throttling are lifted unless --throttle is given.
+
+Reports updates/s, p50/p99 latency of a whole update (handlers plus their
+replies), the slowest handlers, Bot API calls and the bytes the database
+backend and the history wrote. Use it as the baseline for performance work.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:replay-benchmark"
+
+# (command template, weight)
+MIX = (
+    ("/addvideo {title}", 30), ("/daily", 10), ("/shop", 8), ("CB shop_buy:{item}", 5), ("/lp", 12),
+    ("/myprofile", 15), ("/achievements", 6), ("/leaderboard week", 5), ("/lppic", 3), ("/mystats", 2),
+    ("/help", 4),
+)
+FILLER = ("обзор", "влог", "стрим", "челлендж", "распаковка", "рецепт", "2025", "новый", "мой", "день")
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": str(user_id), "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+            "message": {"message_id": update_id, "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private"}, "text": "shop"},
+        },
+    }
+
+
+def generate(count: int, users: int, seed: int, keywords, items):
+    rnd = random.Random(seed)
+    templates = [t for t, _ in MIX]
+    weights = [w for _, w in MIX]
+    for update_id in range(1, count + 1):
+        user_id = rnd.randint(1, users)
+        template = rnd.choices(templates, weights)[0]
+        words = rnd.sample(keywords, min(2, len(keywords))) + rnd.sample(FILLER, 2)
+        rnd.shuffle(words)
+        text = template.format(title=" ".join(words), item=rnd.choice(items))
+        if text.startswith("CB "):
+            yield callback_update(update_id, user_id, text[3:])
+        else:
+            yield message_update(update_id, user_id, text)
+
+
+def percentile(ordered, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def fake_result(method: str, chat_id):
+    if method.startswith(("send", "edit")) and chat_id is not None:
+        return {"message_id": 1, "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"}}
+    return True
+
+
+async def start_fake_api(calls: Counter):
+    """Bot API stand-in on a local port: answers every method with a minimal valid result."""
+    from aiohttp import web
+
+    async def handle(request):
+        method = request.match_info["method"]
+        calls[method] += 1
+        form = await request.post()
+        return web.json_response({"ok": True, "result": fake_result(method, form.get("chat_id"))})
+
+    app = web.Application(client_max_size=64 * 2 ** 20)
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def stub_session(calls: Counter):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Message
+
+    class StubSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            name = type(method).__name__
+            name = name[0].lower() + name[1:]
+            calls[name] += 1
+            result = fake_result(name, getattr(method, "chat_id", None))
+            return Message.model_validate(result, context={"bot": bot}) if isinstance(result, dict) else result
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+
+async def replay(args, workdir: str):
+    calls: Counter = Counter()
+    api_runner = None
+    if args.http:
+        api_runner, port = await start_fake_api(calls)
+        os.environ["TELEGRAM_API_SERVER"] = f"http://127.0.0.1:{port}"
+
+    # teletube reads its settings at import, after the environment is ready
+    from aiogram import Bot
+    from aiogram.types import Update
+    import main
+    from teletube import config, metrics
+    from teletube.db import store
+    from teletube.history import history
+    from teletube.outbox import outbox
+    from teletube.scheduler import scheduler
+    from teletube.seasons import seasons
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(config.KEYWORDS_FILE, encoding="utf-8") as f:
+            keywords = [w.strip() for w in f if w.strip()]
+        raw = list(generate(args.updates, args.users, args.seed, keywords, list(config.shop_items)))
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(u, ensure_ascii=False) + "\n" for u in raw)
+
+    bot = main.make_bot(TOKEN) if args.http else Bot(token=TOKEN, session=stub_session(calls))
+    dp = main.build_dispatcher()
+    updates = [Update.model_validate(u, context={"bot": bot}) for u in raw]
+    random.seed(args.seed)
+
+    await store.start()
+    await seasons.start()
+    outbox.start()
+    scheduler.start(bot)
+    latencies = []
+    errors = Counter()
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def process(update):
+        start = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        finally:
+            latencies.append(time.perf_counter() - start)
+            slots.release()
+
+    tasks = []
+    start = time.perf_counter()
+    try:
+        for update in updates:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(process(update)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+    finally:
+        await scheduler.close()
+        await outbox.close()
+        await store.close()
+        history.close()
+        await bot.session.close()
+        if api_runner is not None:
+            await api_runner.cleanup()
+
+    # the final flush in close() counts too: that is what a run costs on disk
+    db_bytes = int(metrics.STORE_BYTES_WRITTEN.get())
+    history_bytes = dir_size(config.HISTORY_DIR) if os.path.isdir(config.HISTORY_DIR) else 0
+    ordered = sorted(latencies)
+    print(f"{len(updates)} updates from {len({u.event.from_user.id for u in updates})} users, "
+          f"concurrency {args.concurrency}, database {config.DATABASE_URL}")
+    print(f"{len(updates) / wall:.0f} updates/s ({wall:.2f} s)")
+    print(f"latency p50 {percentile(ordered, 50) * 1000:.2f} ms  p99 {percentile(ordered, 99) * 1000:.2f} ms  "
+          f"max {ordered[-1] * 1000:.2f} ms")
+    print(f"database written: {db_bytes / 2 ** 20:.2f} MiB ({db_bytes / len(updates):.0f} B/update), "
+          f"history on disk: {history_bytes / 2 ** 20:.2f} MiB")
+    if errors:
+        print("failed updates: " + ", ".join(f"{e} {n}" for e, n in errors.most_common()))
+    print("Bot API calls: " + ", ".join(f"{m} {n}" for m, n in calls.most_common()))
+    print(metrics.summary(top=args.top))
+    totals = store.totals()
+    digest = hashlib.sha256(json.dumps(sorted(totals.items())).encode()).hexdigest()[:16]
+    print(f"final totals {totals['users']} users, {totals['subscribers']} subscribers, "
+          f"{totals['currency']} currency; digest {digest}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=50000)
+    parser.add_argument("--concurrency", type=int, default=64, help="updates handled at the same time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", default="database.json", help="DATABASE_URL, relative to the temporary directory")
+    parser.add_argument("--input", help="JSONL of Update objects to replay instead of generating")
+    parser.add_argument("--record", help="write the replayed updates to this JSONL file")
+    parser.add_argument("--http", action="store_true", help="serve the fake Bot API over local HTTP")
+    parser.add_argument("--cooldown-hours", default="0", help="COOLDOWN_HOURS for the run")
+    parser.add_argument("--throttle", action="store_true", help="keep the per-user rate limits")
+    parser.add_argument("--top", type=int, default=8, help="handlers listed in the summary")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="teletube-replay-")
+    # keep the URL's scheme, move its file into the temporary directory
+    relative = args.db.partition("://")[2].lstrip("/") or args.db
+    db = args.db[:len(args.db) - len(relative)] + os.path.join(workdir, relative)
+    env = {
+        "BOT_TOKEN": TOKEN,
+        "DATABASE_URL": db,
+        "HISTORY_DIR": os.path.join(workdir, "history"),
+        "KEYWORDS_FILE": os.path.join(ROOT, "keywords.txt"),
+        "COOLDOWN_HOURS": args.cooldown_hours,
+        "OUTBOX_GLOBAL_RATE": "1000000",
+        "OUTBOX_CHAT_RATE": "1000000",
+        "OUTBOX_CHAT_BURST": "1000000",
+        "METRICS_PORT": "0",
+        "CLUSTER_WORKERS": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    if not args.throttle:
+        env.update({"THROTTLE_RATE": "1000000", "THROTTLE_BURST": "1000000",
+                    "THROTTLE_HEAVY_RATE": "1000000", "THROTTLE_HEAVY_BURST": "1000000"})
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+    print(f"working directory {workdir}")
+    asyncio.run(replay(args, workdir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Economy simulator benchmark: scalar game rules vs the vectorized path.
+
+    python benchmarks/simulator.py [--players 200000] [--days 30]
+
+Reports the per-call cost of the real scalar functions used by the handlers
+(`evaluate_video_popularity`, `get_random_event`, `daily_bonus_amount`), the
+per-player cost of the vectorized simulator, and checks that the vectorized
+popularity has the same distribution as the scalar one for a few titles and
+channel sizes (exit status 1 if they differ; tests/test_simulator.py asserts the
+same). Run it after touching either side.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("KEYWORDS_FILE", os.path.join(ROOT, "keywords.txt"))
+
+import numpy as np
+
+from teletube.simulator import Simulation, vector_popularity, volatility_table
+from teletube.utils import evaluate_video_popularity, get_random_event, daily_bonus_amount, title_score
+
+TITLES = ("мой влог", "Новый обзор 2025: лучший гайд", "хайп хайп популярное")
+SUBS = (0, 15, 500)
+
+
+def per_call(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number
+
+
+def scalar_costs():
+    print("== scalar rules (per call) ==")
+    title = TITLES[1]
+    rows = [
+        ("evaluate_video_popularity", per_call(lambda: evaluate_video_popularity(title, 0, 42), 20000)),
+        ("get_random_event", per_call(lambda: get_random_event(150), 50000)),
+        ("daily_bonus_amount", per_call(lambda: daily_bonus_amount(7), 50000)),
+    ]
+    for name, seconds in rows:
+        print(f"{name:<28} {seconds * 1e6:8.2f} us")
+    return rows[0][1]
+
+
+def vector_costs(players: int, days: int, scalar_popularity: float):
+    print(f"== vectorized ({players:,} players) ==")
+    rng = np.random.default_rng(1)
+    table = volatility_table()
+    base = np.full(players, title_score(TITLES[1]), dtype=np.int32)
+    subs = np.full(players, 42, dtype=np.int32)
+    seconds = min(timeit.repeat(lambda: vector_popularity(rng, base, subs, table), number=5, repeat=3)) / 5
+    print(f"{'vector_popularity':<28} {seconds / players * 1e9:8.2f} ns/video  "
+          f"({scalar_popularity / (seconds / players):.0f}x the scalar call)")
+
+    sim = Simulation(players, seed=1)
+    start = time.perf_counter()
+    sim.run(days)
+    seconds = time.perf_counter() - start
+    print(f"{'Simulation.step_day':<28} {seconds / (players * days) * 1e9:8.2f} ns/player-day  "
+          f"({players:,} x {days} days in {seconds:.2f} s)")
+
+
+def agreement(samples: int = 20000):
+    print("== vectorized vs scalar popularity (mean / stdev) ==")
+    rng = np.random.default_rng(2)
+    table = volatility_table()
+    worst = 0.0
+    for title in TITLES:
+        for subs in SUBS:
+            scalar = [evaluate_video_popularity(title, 0, subs) for _ in range(samples)]
+            vector = vector_popularity(rng, np.full(samples, title_score(title), dtype=np.int32),
+                                       np.full(samples, subs, dtype=np.int32), table)
+            s_mean, s_sd = statistics.fmean(scalar), statistics.pstdev(scalar)
+            v_mean, v_sd = float(vector.mean()), float(vector.std())
+            # difference of means in standard errors
+            z = abs(s_mean - v_mean) / max(1e-9, s_sd * (2 / samples) ** 0.5)
+            worst = max(worst, z)
+            print(f"subs={subs:<4} {title!r:<36} scalar {s_mean:6.2f}/{s_sd:5.2f}  vector {v_mean:6.2f}/{v_sd:5.2f}  z={z:.1f}")
+    print("OK" if worst < 4 else f"MISMATCH: worst z={worst:.1f}")
+    return worst < 4
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    random.seed(1)
+    scalar_popularity = scalar_costs()
+    print()
+    vector_costs(args.players, args.days, scalar_popularity)
+    print()
+    if not agreement():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Startup benchmark: import-time report and time-to-first-poll.
+
+    python benchmarks/startup.py [--runs 5] [--top 15]
+
+The import report runs `python -X importtime -c "import main"` and lists the
+modules with the largest cumulative import time. Time-to-first-poll starts a
+fresh interpreter running the real `main.main()` against a stub Bot API session
+and measures the wall time until the first getUpdates request, i.e. until the
+bot would start receiving updates. Run it before and after touching imports or
+startup code to see regressions.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _child_env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["BOT_TOKEN"] = "123456:startup-benchmark"
+    env["DATABASE_URL"] = os.path.join(workdir, "database.json")
+    env["KEYWORDS_FILE"] = os.path.join(ROOT, "keywords.txt")
+    env["LOG_LEVEL"] = "WARNING"
+    return env
+
+
+def import_report(top: int):
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                              cwd=workdir, env=_child_env(workdir), capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    total = next((r for r in rows if r[2].strip() == "main"), None)
+    print("== import time (python -X importtime -c 'import main') ==")
+    if total:
+        print(f"total: {total[0] / 1000:.1f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+    heavy = [r[2].strip() for r in rows if r[2].strip().split(".")[0] in ("matplotlib", "pandas", "numpy")]
+    print(f"charting modules imported at startup: {', '.join(sorted(set(heavy))) if heavy else 'none'}")
+
+
+def _child():
+    # Runs inside the measured interpreter: real main(), stubbed network.
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import GetMe, GetUpdates
+    from aiogram.types import User
+    import main
+
+    class FirstPollSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, GetMe):
+                return User(id=123456, is_bot=True, first_name="bench", username="bench_bot")
+            if isinstance(method, GetUpdates):
+                print("FIRST_POLL", flush=True)
+                raise asyncio.CancelledError
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    try:
+        asyncio.run(main.main(Bot(token=os.environ["BOT_TOKEN"], session=FirstPollSession())))
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+
+
+def time_to_first_poll(runs: int):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child"], cwd=workdir,
+                                    env=_child_env(workdir), stdout=subprocess.PIPE, text=True)
+            for line in proc.stdout:
+                if line.strip() == "FIRST_POLL":
+                    samples.append(time.perf_counter() - start)
+                    break
+            proc.kill()
+            proc.wait()
+    print(f"== time to first poll ({len(samples)}/{runs} runs) ==")
+    if samples:
+        print(f"median: {statistics.median(samples) * 1000:.0f} ms  min: {min(samples) * 1000:.0f} ms  "
+              f"max: {max(samples) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child()
+        return
+    import_report(args.top)
+    print()
+    time_to_first_poll(args.runs)
+
+
+if __name__ == "__main__":
+    main()
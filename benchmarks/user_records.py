@@ -0,0 +1,78 @@
+"""User record memory benchmark: `UserRecord` against the old per-user dicts.
+
+    python benchmarks/user_records.py [--users 1000000]
+
+Builds the same synthetic users once as 15-key dicts (the layout `get_user_data`
+used to create) and once as `UserRecord`s, and reports the memory each
+population holds (tracemalloc) and the size and encode/decode time of the
+JSON database in both layouts. Usernames and nested values are shared between
+the two runs, so only the container overhead differs.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_values(count: int, seed: int):
+    rnd = random.Random(seed)
+    now = time.time()
+    event = {"type": "event_modifier", "modifier": 15, "target": "next_video_popularity", "message": "хайп"}
+    for i in range(count):
+        yield (f"user{i}", rnd.randint(0, 5000), now - rnd.randint(0, 86400), rnd.randint(0, 200),
+               event if rnd.random() < 0.1 else None, rnd.randint(0, 3000), rnd.getrandbits(15),
+               "2025-01-01", rnd.randint(0, 30), rnd.randint(0, 6000), None,
+               now - rnd.randint(0, 10 ** 7), rnd.randint(0, 300), "2025-01-02", rnd.randint(0, 10 ** 6))
+
+
+def measure(title: str, build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    users = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{title:<12} {current / 2 ** 20:8.1f} MiB  {current / len(users):6.0f} B/user  built in {elapsed:.1f} s")
+    return users, current
+
+
+def time_json(title: str, encode, decode):
+    start = time.perf_counter()
+    text = json.dumps(encode(), ensure_ascii=False, separators=(',', ':'))
+    dumped = time.perf_counter() - start
+    start = time.perf_counter()
+    decode(json.loads(text))
+    loaded = time.perf_counter() - start
+    print(f"{title:<12} {len(text.encode()) / 2 ** 20:8.1f} MiB JSON  dump {dumped:.2f} s  load {loaded:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault("KEYWORDS_FILE", os.path.join(ROOT, "keywords.txt"))
+    sys.path.insert(0, ROOT)
+    from teletube.models import FIELDS, UserRecord, encode, decode
+
+    values = list(synthetic_values(args.users, args.seed))
+    print(f"{args.users:,} users")
+    dicts, dict_bytes = measure("dict", lambda: {uid: dict(zip(FIELDS, v)) for uid, v in enumerate(values)})
+    time_json("dict", lambda: dicts, lambda raw: {int(k): v for k, v in raw.items()})
+    del dicts
+    records, record_bytes = measure("UserRecord", lambda: {uid: UserRecord(*v) for uid, v in enumerate(values)})
+    time_json("UserRecord", lambda: {uid: encode(ud) for uid, ud in records.items()},
+              lambda raw: {int(k): decode(v) for k, v in raw.items()})
+    print(f"UserRecord holds {record_bytes / dict_bytes:.0%} of the dict layout's memory")
+
+
+if __name__ == "__main__":
+    main()
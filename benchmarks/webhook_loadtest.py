@@ -0,0 +1,185 @@
+"""Webhook load test: POST synthetic updates and report throughput and latency.
+
+    python benchmarks/webhook_loadtest.py [--updates 5000] [--concurrency 100] [--users 1000]
+    python benchmarks/webhook_loadtest.py --url http://127.0.0.1:8080/webhook --secret ...
+
+Without --url the real dispatcher runs in-process behind `WebhookServer` on a
+free local port, with a stub Bot API session (nothing leaves the machine), a
+temporary database and outgoing rate limits lifted, so the numbers measure the
+bot itself. Besides the HTTP acknowledgement latency seen by the sender it then
+reports the time each update spent in the handlers. With --url it only
+measures the HTTP side of an already running server.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "loadtest-secret"
+
+COMMANDS = ("/myprofile", "/addvideo Новый обзор 2025 топ", "/daily", "/leaderboard", "/achievements", "/help")
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}", "username": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+def percentile(samples, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report(title: str, samples, wall: float):
+    print(f"== {title} ==")
+    if not samples:
+        print("no samples")
+        return
+    print(f"{len(samples)} updates in {wall:.2f} s: {len(samples) / wall:.0f} updates/s")
+    print(f"p50: {percentile(samples, 50) * 1000:.1f} ms  p99: {percentile(samples, 99) * 1000:.1f} ms  "
+          f"max: {max(samples) * 1000:.1f} ms  mean: {statistics.mean(samples) * 1000:.1f} ms")
+
+
+async def post_all(url: str, secret: str, updates, concurrency: int):
+    import aiohttp
+
+    latencies = []
+    errors = {}
+    queue = iter(updates)
+
+    async def worker(session):
+        for payload in queue:
+            start = time.perf_counter()
+            async with session.post(url, json=payload, headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as resp:
+                await resp.read()
+                if resp.status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[resp.status] = errors.get(resp.status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def build_updates(count: int, users: int, seed: int):
+    rnd = random.Random(seed)
+    return [make_update(i + 1, rnd.randint(1, users), rnd.choice(COMMANDS)) for i in range(count)]
+
+
+async def run_local(args, updates):
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+    from aiohttp import web
+
+    import main
+    from teletube.db import store
+    from teletube.outbox import outbox
+    from teletube.scheduler import scheduler
+    from teletube.webhook import WebhookServer
+
+    class StubSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            if hasattr(method, "chat_id"):
+                return Message(message_id=1, date=int(time.time()), chat=Chat(id=method.chat_id, type="private"))
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    handled = []
+
+    class TimedServer(WebhookServer):
+        async def _process(self, update):
+            start = time.perf_counter()
+            await super()._process(update)
+            handled.append(time.perf_counter() - start)
+
+    bot = Bot(token="123456:webhook-loadtest", session=StubSession())
+    server = TimedServer(main.build_dispatcher(), bot, secret=SECRET, max_concurrency=args.pool)
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    await store.start()
+    outbox.start()
+    scheduler.start(bot)
+    try:
+        start = time.perf_counter()
+        latencies, errors, http_wall = await post_all(f"http://127.0.0.1:{port}{server.path}", SECRET, updates,
+                                                      args.concurrency)
+        await server.drain(timeout=600)
+        total_wall = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+        await scheduler.close()
+        await outbox.close()
+        await store.close()
+    report("HTTP acknowledgement", latencies, http_wall)
+    report("handler processing", handled, total_wall)
+    if errors:
+        print(f"non-200 responses: {errors}")
+
+
+async def run_remote(args, updates):
+    latencies, errors, wall = await post_all(args.url, args.secret, updates, args.concurrency)
+    report("HTTP acknowledgement", latencies, wall)
+    if errors:
+        print(f"non-200 responses: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100, help="parallel HTTP senders")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--pool", type=int, default=64, help="WEBHOOK_MAX_CONCURRENCY of the local server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="POST to a running server instead of starting one")
+    parser.add_argument("--secret", default=SECRET)
+    args = parser.parse_args()
+
+    updates = build_updates(args.updates, args.users, args.seed)
+    if args.url:
+        asyncio.run(run_remote(args, updates))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="teletube-loadtest-")
+    os.environ.update({
+        "DATABASE_URL": os.path.join(workdir, "database.json"),
+        "KEYWORDS_FILE": os.path.join(ROOT, "keywords.txt"),
+        "COOLDOWN_HOURS": "0",
+        "OUTBOX_GLOBAL_RATE": "1000000",
+        "OUTBOX_CHAT_RATE": "1000000",
+        "OUTBOX_CHAT_BURST": "1000000",
+        "LOG_LEVEL": "WARNING",
+    })
+    sys.path.insert(0, ROOT)
+    asyncio.run(run_local(args, updates))
+
+
+if __name__ == "__main__":
+    main()
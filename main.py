@@ -1,13 +1,22 @@
 import asyncio
 import logging
+from typing import Optional
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
 
-from teletube.config import BOT_TOKEN, LOG_LEVEL_STR, BOT_NAME
+from teletube.config import BOT_TOKEN, LOG_LEVEL_STR, BOT_NAME, BOT_MODE, WEBHOOK_SECRET, METRICS_HOST, METRICS_PORT, CLUSTER_WORKERS, TELEGRAM_API_SERVER
+from teletube.db import store
+from teletube.scheduler import scheduler
+from teletube.outbox import outbox
+from teletube.history import history
+from teletube.seasons import seasons
+from teletube import metrics
+from teletube.throttling import DedupMiddleware, ThrottlingMiddleware
 from teletube.handlers import (
     cmd_start, cmd_help, cmd_addvideo, cmd_leaderboard, cmd_leaderboardpic,
-    cmd_myprofile, cmd_achievements, cmd_daily, cmd_shop, cb_shop_buy,
-    admin_add_currency, admin_add_subs, admin_delete_db, admin_stats
+    cmd_myprofile, cmd_mystats, cmd_achievements, cmd_daily, cmd_shop, cb_shop_buy,
+    admin_add_currency, admin_add_subs, admin_delete_db, admin_stats,
+    admin_bulk, admin_export, admin_import
 )
 
 def _setup_logging():
@@ -16,14 +25,24 @@ def _setup_logging():
     return logger
 
 
-async def main():
-    logger = _setup_logging()
-    if not BOT_TOKEN:
-        logger.critical("BOT_TOKEN is missing. Set it in .env")
-        return
+def make_bot(token: str) -> Bot:
+    if TELEGRAM_API_SERVER:
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        return Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)))
+    return Bot(token=token)
 
-    bot = Bot(token=BOT_TOKEN)
+
+def build_dispatcher() -> Dispatcher:
     dp = Dispatcher()
+    dp.update.outer_middleware(DedupMiddleware())
+    # throttling first: refused commands never reach the handler metrics
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    handler_metrics = metrics.HandlerMetricsMiddleware()
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
 
     dp.message.register(cmd_start, Command(commands=["start"]))
     dp.message.register(cmd_help, Command(commands=["help", "info"]))
@@ -31,6 +50,7 @@ async def main():
     dp.message.register(cmd_leaderboard, Command(commands=["leaderboard", "lp"]))
     dp.message.register(cmd_leaderboardpic, Command(commands=["leaderboardpic", "lppic"]))
     dp.message.register(cmd_myprofile, Command(commands=["myprofile"]))
+    dp.message.register(cmd_mystats, Command(commands=["mystats"]))
     dp.message.register(cmd_achievements, Command(commands=["achievements"]))
     dp.message.register(cmd_daily, Command(commands=["daily"]))
     dp.message.register(cmd_shop, Command(commands=["shop"]))
@@ -38,14 +58,56 @@ async def main():
     dp.message.register(admin_add_currency, Command(commands=["CHEATaddcoins"]))
     dp.message.register(admin_add_subs, Command(commands=["CHEATaddsub"]))
     dp.message.register(admin_delete_db, Command(commands=["CHEATDeleteDatabase"]))
+    dp.message.register(admin_bulk, Command(commands=["CHEATbulk"]))
+    dp.message.register(admin_export, Command(commands=["CHEATexport"]))
+    dp.message.register(admin_import, Command(commands=["CHEATimport"]))
     dp.message.register(admin_stats, Command(commands=["botstats"]))
 
     dp.callback_query.register(cb_shop_buy, lambda c: c.data and c.data.startswith("shop_buy:"))
+    return dp
+
+
+async def main(bot: Optional[Bot] = None):
+    logger = _setup_logging()
+    if bot is None:
+        if not BOT_TOKEN:
+            logger.critical("BOT_TOKEN is missing. Set it in .env")
+            return
+        bot = make_bot(BOT_TOKEN)
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        logger.critical("WEBHOOK_SECRET is missing. Set it in .env to run in webhook mode")
+        return
+    if CLUSTER_WORKERS > 1:
+        from teletube.cluster import supervise
+        logger.info("%s is starting with %d shards...", BOT_NAME, CLUSTER_WORKERS)
+        try:
+            await supervise(bot, CLUSTER_WORKERS)
+        finally:
+            await bot.session.close()
+        return
+    dp = build_dispatcher()
+    bot.session.middleware(metrics.ApiMetricsMiddleware())
 
     logger.info("%s is starting...", BOT_NAME)
+    await store.start()
+    await seasons.start()
+    outbox.start()
+    scheduler.start(bot)
+    metrics_runner = await metrics.serve(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
     try:
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            # imported here so polling mode does not load the aiohttp server
+            from teletube.webhook import serve
+            await serve(dp, bot)
+        else:
+            await dp.start_polling(bot)
     finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await scheduler.close()
+        await outbox.close()
+        await store.close()
+        history.close()
         await bot.session.close()
 
 
@@ -0,0 +1,94 @@
+import argparse
+
+from .storage import create_backend, import_json
+
+
+def _cmd_import_json(args):
+    target = create_backend(args.target)
+    count = import_json(args.source, target)
+    target.close()
+    print(f"imported {count} users into {target.location}")
+
+
+def _cmd_export(args):
+    from .transfer import export_backend
+
+    source = create_backend(args.source)
+    count = export_backend(source, args.target)
+    source.close()
+    print(f"exported {count} users to {args.target}")
+
+
+def _cmd_import(args):
+    from .transfer import import_backend
+
+    target = create_backend(args.target)
+    count = import_backend(args.source, target)
+    target.close()
+    print(f"imported {count} users into {target.location}")
+
+
+def _cmd_split_shards(args):
+    from .cluster import shard_of, shard_url
+
+    source = create_backend(args.source)
+    data = source.load_all()
+    source.close()
+    for index in range(args.count):
+        part = {uid: ud for uid, ud in data.items() if shard_of(uid, args.count) == index}
+        target = create_backend(shard_url(args.source, index, args.count))
+        target.write(target.prepare(part, part))
+        target.close()
+        print(f"{target.location}: {len(part)} users")
+
+
+def _cmd_simulate(args):
+    from .simulator import simulate, format_report
+
+    titles = None
+    if args.titles:
+        with open(args.titles, encoding="utf-8") as f:
+            titles = [ln.strip() for ln in f if ln.strip()]
+    result = simulate(args.players, args.days, seed=args.seed, titles=titles, active=args.active, post_rate=args.post_rate)
+    print(format_report(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m teletube")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import-json", help="one-shot import of database.json into another backend")
+    p.add_argument("source", help="path to the legacy database.json")
+    p.add_argument("target", help="target DATABASE_URL, e.g. sqlite:///teletube.db")
+    p.set_defaults(func=_cmd_import_json)
+
+    p = sub.add_parser("export", help="export users as JSONL or CSV (by extension); run while the bot is stopped")
+    p.add_argument("source", help="DATABASE_URL to export")
+    p.add_argument("target", help="output file, e.g. users.jsonl or users.csv")
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser("import", help="add or overwrite users from a JSONL/CSV export; run while the bot is stopped")
+    p.add_argument("source", help="file written by export or /CHEATexport")
+    p.add_argument("target", help="DATABASE_URL to import into")
+    p.set_defaults(func=_cmd_import)
+
+    p = sub.add_parser("split-shards", help="split a database into CLUSTER_WORKERS shard databases")
+    p.add_argument("source", help="DATABASE_URL of the existing database")
+    p.add_argument("count", type=int, help="number of shards (CLUSTER_WORKERS)")
+    p.set_defaults(func=_cmd_split_shards)
+
+    p = sub.add_parser("simulate", help="simulate the game economy offline (uses the current .env settings)")
+    p.add_argument("--players", type=int, default=100000)
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--active", type=float, default=0.5, help="mean probability that a player plays on a given day")
+    p.add_argument("--post-rate", type=float, default=0.8, help="probability of publishing in each cooldown slot")
+    p.add_argument("--titles", help="file with one video title per line (default: built from keywords.txt)")
+    p.set_defaults(func=_cmd_simulate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
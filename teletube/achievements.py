@@ -1,9 +1,16 @@
-from typing import Dict, Any, List
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Any, List, Iterable, Optional, Callable, TYPE_CHECKING
 from .config import DEFAULT_CURRENCY_NAME
 from .utils import escape_html
+from aiogram.methods import SendMessage
+from .outbox import outbox, PRIORITY_NOTIFY
 import logging
 logger = logging.getLogger(__name__)
 
+if TYPE_CHECKING:
+    from .models import UserRecord
+
 achievements_definition: Dict[str, Dict[str, Any]] = {
     "newbie_blogger": {"name": "🌱 Новичок Блогер", "condition_videos": 1, "reward_coins": 5},
     "rising_star": {"name": "🌟 Восходящая Звезда", "condition_videos": 5, "reward_coins": 25},
@@ -23,24 +30,102 @@ achievements_definition: Dict[str, Dict[str, Any]] = {
 }
 
 
-async def check_and_grant_achievements(user_data: Dict[str, Any], bot, chat_id: int) -> List[str]:
+# Bit of each achievement in a user's `achievements_mask`. Bits follow definition
+# order, so new achievements must be appended to the end of the dict.
+ACHIEVEMENT_BITS: Dict[str, int] = {aid: i for i, aid in enumerate(achievements_definition)}
+
+# condition key -> current value of the metric it depends on
+METRICS: Dict[str, Callable[["UserRecord", float], float]] = {
+    "condition_videos": lambda ud, now: ud.video_count,
+    "condition_subs": lambda ud, now: ud.subscribers,
+    "condition_days_since_signup": lambda ud, now: (now - ud.created_at) / 86400,
+    "condition_days_active": lambda ud, now: ud.days_active,
+    "condition_video_views": lambda ud, now: ud.best_video_views,
+}
+
+# metrics that move with every interaction rather than with a specific action
+ACTIVITY_METRICS = ("condition_days_since_signup", "condition_days_active")
+
+
+def mask_from_ids(ids: Iterable[str]) -> int:
+    mask = 0
+    for aid in ids:
+        if aid in ACHIEVEMENT_BITS:
+            mask |= 1 << ACHIEVEMENT_BITS[aid]
+    return mask
+
+
+def unlocked_ids(mask: int) -> List[str]:
+    return [aid for aid, bit in ACHIEVEMENT_BITS.items() if mask >> bit & 1]
+
+
+class AchievementIndex:
+    """Definitions grouped by the metric they depend on.
+
+    Per metric the thresholds are sorted and `_reached[m][k]` is the bitmask of
+    the k lowest thresholds, so finding what a value newly unlocks is one
+    binary search and a mask operation, however many definitions exist.
+    """
+
+    def __init__(self, definitions: Dict[str, Dict[str, Any]]):
+        self._thresholds: Dict[str, List[float]] = {}
+        self._reached: Dict[str, List[int]] = {}
+        for cond in METRICS:
+            rules = sorted((adef[cond], ACHIEVEMENT_BITS[aid]) for aid, adef in definitions.items() if cond in adef)
+            if not rules:
+                continue
+            self._thresholds[cond] = [t for t, _ in rules]
+            masks = [0]
+            for _, bit in rules:
+                masks.append(masks[-1] | 1 << bit)
+            self._reached[cond] = masks
+
+    def newly_unlocked(self, user_data: "UserRecord", metrics: Optional[Iterable[str]] = None,
+                       now: Optional[float] = None) -> int:
+        """Bitmask of achievements reached by the given metrics but not yet unlocked."""
+        now = datetime.now().timestamp() if now is None else now
+        mask = user_data.achievements_mask
+        new = 0
+        for cond in (self._thresholds if metrics is None else metrics):
+            thresholds = self._thresholds.get(cond)
+            if not thresholds:
+                continue
+            k = bisect_right(thresholds, METRICS[cond](user_data, now))
+            new |= self._reached[cond][k] & ~mask
+        return new
+
+
+achievement_index = AchievementIndex(achievements_definition)
+
+
+def grant_achievements(user_data: "UserRecord", metrics: Optional[Iterable[str]] = None) -> List[str]:
+    """Unlock and pay out everything newly reached; the notices to send once the change is committed.
+
+    `metrics` limits the check to the condition keys that changed.
+    """
+    new = achievement_index.newly_unlocked(user_data, metrics)
+    if not new:
+        return []
+    user_data.achievements_mask |= new
     newly = []
-    for aid, adef in achievements_definition.items():
-        if aid in user_data.get('achievements_unlocked', []):
-            continue
-        unlocked = False
-        if "condition_videos" in adef and user_data.get('video_count', 0) >= adef['condition_videos']:
-            unlocked = True
-        if "condition_subs" in adef and user_data.get('subscribers', 0) >= adef['condition_subs']:
-            unlocked = True
-        if unlocked:
-            user_data.setdefault('achievements_unlocked', []).append(aid)
-            rc = adef.get('reward_coins', 0)
-            user_data['currency'] = user_data.get('currency', 0) + rc
-            text = f"🏆 Новое достижение: <b>{escape_html(adef['name'])}</b>! (+{rc} {escape_html(DEFAULT_CURRENCY_NAME)})"
-            newly.append(text)
-            try:
-                await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
-            except Exception as e:
-                logger.error("notify achievement error: %s", e)
+    for aid in unlocked_ids(new):
+        adef = achievements_definition[aid]
+        rc = adef.get('reward_coins', 0)
+        user_data.currency += rc
+        newly.append(f"🏆 Новое достижение: <b>{escape_html(adef['name'])}</b>! (+{rc} {escape_html(DEFAULT_CURRENCY_NAME)})")
+    return newly
+
+
+def notify_achievements(bot, chat_id: int, notices: List[str]):
+    for text in notices:
+        # queued, not awaited: a reply sent right after to the same chat absorbs it
+        outbox.post(SendMessage(chat_id=chat_id, text=text, parse_mode="HTML").as_(bot),
+                    priority=PRIORITY_NOTIFY, coalesce=True)
+
+
+async def check_and_grant_achievements(user_data: "UserRecord", bot, chat_id: int,
+                                       metrics: Optional[Iterable[str]] = None) -> List[str]:
+    """Grant and notify at once, for callers outside a transaction that may roll back."""
+    newly = grant_achievements(user_data, metrics)
+    notify_achievements(bot, chat_id, newly)
     return newly
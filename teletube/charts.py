@@ -0,0 +1,104 @@
+import asyncio
+import io
+import logging
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+from .config import BOT_NAME, CHART_WORKERS
+from .metrics import CHART_RENDER_SECONDS, CHART_CACHE_HITS
+
+logger = logging.getLogger(__name__)
+
+# (username, subscribers) pairs of the ranked users, highest first
+LeaderboardRows = Tuple[Tuple[str, int], ...]
+
+_executor = ThreadPoolExecutor(max_workers=CHART_WORKERS, thread_name_prefix="chart")
+_cache: Tuple[Optional[LeaderboardRows], bytes] = (None, b"")
+_inflight: Dict[LeaderboardRows, asyncio.Future] = {}
+
+
+def render_leaderboard_png(rows: LeaderboardRows) -> bytes:
+    # matplotlib is imported on first render so it costs nothing at startup;
+    # Figure/FigureCanvasAgg instead of pyplot: no global state, safe in worker threads
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    names = [n for n, _ in rows]
+    subs = [s for _, s in rows]
+    fig = Figure(figsize=(10, 7))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    wedges, texts, autotexts = ax.pie(subs, autopct=lambda p: f'{p:.1f}%' if p > 3 else '', startangle=140)
+    ax.legend(wedges, [f"{n} ({s})" for n, s in zip(names, subs)], title="Топ", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
+    ax.set_title(f"Топ {BOT_NAME}еров")
+    fig.tight_layout(rect=[0, 0, 0.75, 1])
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=150, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _timed_render(loop: asyncio.AbstractEventLoop, rows: LeaderboardRows) -> bytes:
+    start = time.perf_counter()
+    png = render_leaderboard_png(rows)
+    # metrics are only touched from the loop thread
+    loop.call_soon_threadsafe(CHART_RENDER_SECONDS.observe, time.perf_counter() - start)
+    return png
+
+
+def _on_rendered(rows: LeaderboardRows, fut: asyncio.Future):
+    global _cache
+    _inflight.pop(rows, None)
+    if not fut.cancelled() and fut.exception() is None:
+        _cache = (rows, fut.result())
+
+
+async def leaderboard_png(rows: LeaderboardRows) -> bytes:
+    """PNG for `rows`, rendered off the event loop.
+
+    The last image is cached by its rows, so repeated requests between
+    leaderboard changes are free, and concurrent requests for the same rows
+    await one shared render.
+    """
+    if _cache[0] == rows:
+        CHART_CACHE_HITS.inc()
+        return _cache[1]
+    fut = _inflight.get(rows)
+    if fut is None:
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(_executor, _timed_render, loop, rows)
+        _inflight[rows] = fut
+        fut.add_done_callback(lambda f: _on_rendered(rows, f))
+    # shield: one cancelled requester must not cancel the render the others wait for
+    return await asyncio.shield(fut)
+
+
+def render_growth_png(title: str, ts: Sequence[float], subscribers: Sequence[int]) -> bytes:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.step([datetime.fromtimestamp(t) for t in ts], subscribers, where="post", marker="o", markersize=3)
+    ax.set_title(title)
+    ax.set_ylabel("Пдп")
+    ax.grid(alpha=0.3)
+    fig.autofmt_xdate()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=120, bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _timed_growth(loop: asyncio.AbstractEventLoop, title: str, ts: Sequence[float], subscribers: Sequence[int]) -> bytes:
+    start = time.perf_counter()
+    png = render_growth_png(title, ts, subscribers)
+    loop.call_soon_threadsafe(CHART_RENDER_SECONDS.observe, time.perf_counter() - start)
+    return png
+
+
+async def growth_png(title: str, ts: Sequence[float], subscribers: Sequence[int]) -> bytes:
+    """Subscriber growth chart, rendered on the chart workers like the leaderboard."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed_growth, loop, title, ts, subscribers)
@@ -0,0 +1,442 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+from .config import (
+    DATABASE_URL, HISTORY_DIR, BOT_MODE, CREATOR_ID, CLUSTER_SUMMARY_INTERVAL, CLUSTER_TOP_N, CLUSTER_CALL_TIMEOUT,
+    OUTBOX_GLOBAL_RATE, METRICS_PORT, WEBHOOK_MAX_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT
+)
+from .db import NameIndex
+
+logger = logging.getLogger(__name__)
+
+_ADMIN_TARGETED = re.compile(r"^/CHEATadd(?:coins|sub)(?:@\w+)?\s+(\S+)")
+_POLL_TIMEOUT = 30
+
+
+def shard_of(user_id: int, count: int) -> int:
+    return user_id % count
+
+
+def shard_url(url: str, index: int, count: int) -> str:
+    """`database.json` -> `database.shard1-of-4.json` (the same for sqlite:/// and json:// URLs)."""
+    root, ext = os.path.splitext(url)
+    return f"{root}.shard{index}-of-{count}{ext}"
+
+
+@contextmanager
+def _shard_env(index: int, count: int):
+    # Children are spawned and read teletube.config at import, so per-shard
+    # settings are handed over through the environment they inherit.
+    overrides = {
+        "DATABASE_URL": shard_url(DATABASE_URL, index, count),
+        "HISTORY_DIR": shard_url(HISTORY_DIR, index, count),
+        # the Bot API limit is per bot, so the workers split it
+        "OUTBOX_GLOBAL_RATE": str(OUTBOX_GLOBAL_RATE / count),
+        "METRICS_PORT": str(METRICS_PORT + index if METRICS_PORT else 0),
+        "CLUSTER_WORKERS": "0",
+    }
+    saved = {k: os.environ.get(k) for k in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _update_user_id(update: Update) -> Optional[int]:
+    user = getattr(update.event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(update.event, "chat", None)
+    return chat.id if chat is not None else None
+
+
+class Router:
+    """Supervisor side: owns the worker processes and sends each update to its shard.
+
+    Every worker keeps the users with `user_id % count == index`. Workers report
+    a leaderboard/totals summary (see `UserStore.summary`) every few seconds and
+    the username changes they saw; summaries are relayed to the other workers,
+    usernames are kept here to route `/CHEATadd... @username` to the owner.
+    Records a worker imported for users of other shards are relayed to their owners,
+    and calls of one worker to all the others (see `ShardLink`) and their answers are relayed too.
+    """
+
+    def __init__(self, count: int):
+        self.count = count
+        self._ctx = multiprocessing.get_context("spawn")
+        self.inboxes = [self._ctx.Queue() for _ in range(count)]
+        self.reports = self._ctx.Queue()
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * count
+        self.usernames = NameIndex()
+        # user_id -> the name last reported, to move the user out of its old name
+        self._names: Dict[int, Optional[str]] = {}
+        self.summaries: Dict[int, Dict[str, Any]] = {}
+        self.offset: Optional[int] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _spawn(self, index: int):
+        p = self._ctx.Process(target=_worker_main, args=(index, self.count, self.inboxes[index], self.reports),
+                              name=f"teletube-shard{index}", daemon=True)
+        with _shard_env(index, self.count):
+            p.start()
+        self.processes[index] = p
+        # a restarted worker would otherwise wait for the others' next change
+        for i, summary in self.summaries.items():
+            if i != index:
+                self.inboxes[index].put(("peer", i, summary))
+        logger.info("shard %d started (pid %s)", index, p.pid)
+
+    def start(self):
+        for i in range(self.count):
+            self._spawn(i)
+        self._reader = asyncio.create_task(self._read_reports())
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(1)
+            for i, p in enumerate(self.processes):
+                if p is not None and not p.is_alive():
+                    logger.error("shard %d exited with %s, restarting", i, p.exitcode)
+                    self._spawn(i)
+
+    def shard_for(self, update: Update) -> int:
+        uid = _update_user_id(update)
+        text = getattr(update.message, "text", None) if update.message else None
+        if text and uid == CREATOR_ID:
+            m = _ADMIN_TARGETED.match(text)
+            if m:
+                target = m.group(1)
+                if target.startswith("@"):
+                    owner = self.usernames.find(target)
+                    if owner is not None:
+                        return shard_of(owner, self.count)
+                elif target.lstrip("-").isdigit():
+                    return shard_of(int(target), self.count)
+            elif text.split("@")[0].strip() == "/CHEATDeleteDatabase":
+                for i in range(self.count):
+                    if i != shard_of(uid, self.count):
+                        self.inboxes[i].put(("clear",))
+        return shard_of(uid or 0, self.count)
+
+    def route(self, update: Update):
+        self.inboxes[self.shard_for(update)].put(("update", update.model_dump_json(exclude_unset=True)))
+
+    async def poll(self, bot: Bot, allowed_updates: List[str]):
+        while True:
+            try:
+                updates = await bot(GetUpdates(offset=self.offset, timeout=_POLL_TIMEOUT, allowed_updates=allowed_updates))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.route(update)
+                self.offset = update.update_id + 1
+
+    async def confirm(self, bot: Bot):
+        """Acknowledge the routed updates so Telegram does not redeliver them after a restart."""
+        if self.offset is not None:
+            try:
+                await bot(GetUpdates(offset=self.offset, timeout=0, limit=1))
+            except Exception as e:
+                logger.warning("could not confirm updates: %s", e)
+
+    async def _read_reports(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            kind, index, payload = await loop.run_in_executor(None, self.reports.get)
+            if kind == "summary":
+                self.summaries[index] = payload
+                for i, inbox in enumerate(self.inboxes):
+                    if i != index:
+                        inbox.put(("peer", index, payload))
+            elif kind == "names":
+                for uid, name in payload:
+                    self.usernames.rename(uid, self._names.pop(uid, None), name)
+                    if name:
+                        self._names[uid] = name
+            elif kind == "forward":
+                # imported records of users another shard owns
+                owners: Dict[int, list] = {}
+                for uid, raw in payload:
+                    owners.setdefault(shard_of(uid, self.count), []).append((uid, raw))
+                for i, rows in owners.items():
+                    self.inboxes[i].put(("put", rows))
+            elif kind == "call":
+                for i, inbox in enumerate(self.inboxes):
+                    if i != index:
+                        inbox.put(("call", index, payload))
+            elif kind == "answer":
+                caller, call_id, status, part = payload
+                self.inboxes[caller].put(("answer", index, call_id, status, part))
+
+    async def close(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        # "stop" is queued behind the routed updates, so workers finish those first
+        for inbox in self.inboxes:
+            inbox.put(("stop",))
+        loop = asyncio.get_running_loop()
+        for i, p in enumerate(self.processes):
+            if p is None:
+                continue
+            await loop.run_in_executor(None, p.join, timeout + 5)
+            if p.is_alive():
+                logger.warning("shard %d did not stop, terminating", i)
+                p.terminate()
+        if self._reader is not None:
+            self._reader.cancel()
+            self.reports.put(("stopped", -1, None))
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+
+
+async def supervise(bot: Bot, count: int):
+    """Run `count` shard workers fed by one poller or one webhook front."""
+    # imported here: the dispatcher is only needed for its update types
+    from main import build_dispatcher
+    from .webhook import WebhookServer, serve
+
+    dp = build_dispatcher()
+    router = Router(count)
+    router.start()
+    try:
+        if BOT_MODE == "webhook":
+            class RoutingServer(WebhookServer):
+                async def _process(self, update: Update):
+                    try:
+                        router.route(update)
+                    finally:
+                        self._slots.release()
+
+            await serve(dp, bot, server=RoutingServer(dp, bot))
+        else:
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except (NotImplementedError, RuntimeError):
+                    pass
+            await bot.delete_webhook()
+            poller = asyncio.create_task(router.poll(bot, dp.resolve_used_update_types()))
+            waiter = asyncio.create_task(stop.wait())
+            try:
+                await asyncio.wait({poller, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in (poller, waiter):
+                    task.cancel()
+                await asyncio.gather(poller, waiter, return_exceptions=True)
+                await router.confirm(bot)
+                for sig in (signal.SIGINT, signal.SIGTERM):
+                    try:
+                        loop.remove_signal_handler(sig)
+                    except (NotImplementedError, RuntimeError):
+                        pass
+    finally:
+        await router.close()
+
+
+class ShardLink:
+    """Worker side of calls to all the other shards, relayed by the supervisor.
+
+    `parts(op, arg)` asks every other worker to run `handlers[op](arg)`, an
+    async generator, and yields the parts of their answers as they arrive; a
+    dump of all users comes in many parts, a count in one. A failed handler
+    fails the call, and so does a shard that stays silent for `timeout` seconds.
+    """
+
+    def __init__(self, index: int, count: int, reports, timeout: float = CLUSTER_CALL_TIMEOUT):
+        self.index = index
+        self.count = count
+        self.reports = reports
+        self.timeout = timeout
+        self.handlers: Dict[str, Callable[[Any], AsyncIterator[Any]]] = {}
+        self._ids = itertools.count(1)
+        # call id -> answers of the other shards: (shard, status, part)
+        self._calls: Dict[int, asyncio.Queue] = {}
+
+    async def parts(self, op: str, arg: Any = None) -> AsyncIterator[Any]:
+        call_id = next(self._ids)
+        answers = self._calls[call_id] = asyncio.Queue()
+        self.reports.put(("call", self.index, (call_id, op, arg)))
+        waiting = self.count - 1
+        try:
+            while waiting:
+                try:
+                    shard, status, part = await asyncio.wait_for(answers.get(), self.timeout)
+                except asyncio.TimeoutError:
+                    raise RuntimeError(f"{waiting} shard(s) did not answer {op!r} in {self.timeout:g} s") from None
+                if status == "error":
+                    raise RuntimeError(f"shard {shard}: {part}")
+                if status == "done":
+                    waiting -= 1
+                else:
+                    yield part
+        finally:
+            del self._calls[call_id]
+
+    async def call(self, op: str, arg: Any = None) -> List[Any]:
+        """All parts of all the other shards' answers."""
+        return [part async for part in self.parts(op, arg)]
+
+    def answered(self, shard: int, call_id: int, status: str, part: Any):
+        answers = self._calls.get(call_id)
+        # answers after a timeout have nobody waiting
+        if answers is not None:
+            answers.put_nowait((shard, status, part))
+
+    async def serve(self, caller: int, call_id: int, op: str, arg: Any):
+        try:
+            async for part in self.handlers[op](arg):
+                self.reports.put(("answer", self.index, (caller, call_id, "part", part)))
+        except Exception as e:
+            logger.exception("call %r from shard %d failed", op, caller)
+            self.reports.put(("answer", self.index, (caller, call_id, "error", f"{type(e).__name__}: {e}")))
+        else:
+            self.reports.put(("answer", self.index, (caller, call_id, "done", None)))
+
+
+def _worker_main(index: int, count: int, inbox, reports):
+    # the supervisor handles Ctrl+C and stops workers through their inbox
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format=f"%(asctime)s | shard{index} | %(levelname)s | %(message)s")
+    asyncio.run(_worker(index, count, inbox, reports))
+
+
+async def _worker(index: int, count: int, inbox, reports):
+    from main import build_dispatcher, make_bot
+    from .config import BOT_TOKEN
+    from .db import store
+    from .models import encode, decode
+    from .history import history
+    from .seasons import seasons
+    from .outbox import outbox
+    from .scheduler import scheduler
+    from .handlers import bulk_update
+    from .transfer import dump_store
+    from . import metrics
+
+    bot = make_bot(BOT_TOKEN)
+    bot.session.middleware(metrics.ApiMetricsMiddleware())
+    dp = build_dispatcher()
+    renamed: Dict[int, Any] = {}
+    store.on_rename = renamed.__setitem__
+    store.shard = (index, count)
+    store.forward = lambda rows: reports.put(("forward", index, [(uid, encode(ud)) for uid, ud in rows]))
+
+    # what the other shards may ask of this one, see ShardLink
+    async def top(limit: int):
+        yield store.leaderboard.top(limit)
+
+    async def bulk(arg):
+        yield await bulk_update(*arg)
+
+    link = store.remote = ShardLink(index, count, reports)
+    link.handlers.update(dump=lambda chunk_size: dump_store(store, chunk_size), top=top, bulk=bulk)
+
+    await store.start()
+    await seasons.start()
+    outbox.start()
+    scheduler.start(bot)
+    metrics_runner = await metrics.serve("127.0.0.1", METRICS_PORT) if METRICS_PORT else None
+    renamed.update((uid, ud.username) for uid, ud in store.users())
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+
+    slots = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+    tasks = set()
+
+    async def process(update: Update):
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error("update %s failed: %s", update.update_id, e)
+        finally:
+            slots.release()
+
+    async def publish():
+        last = None
+        while True:
+            try:
+                if renamed:
+                    names = list(renamed.items())
+                    renamed.clear()
+                    reports.put(("names", index, names))
+                summary = store.summary(CLUSTER_TOP_N)
+                summary.update(seasons.summary(CLUSTER_TOP_N))
+                if summary != last:
+                    reports.put(("summary", index, summary))
+                    last = summary
+            except Exception as e:
+                logger.error("shard summary failed: %s", e)
+            await asyncio.sleep(CLUSTER_SUMMARY_INTERVAL)
+
+    publisher = asyncio.create_task(publish())
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                msg = await loop.run_in_executor(None, inbox.get, True, 1.0)
+            except queue.Empty:
+                continue
+            kind = msg[0]
+            if kind == "update":
+                await slots.acquire()
+                task = asyncio.create_task(process(Update.model_validate_json(msg[1], context={"bot": bot})))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif kind == "peer":
+                store.peers[msg[1]] = msg[2]
+            elif kind == "put":
+                for uid, raw in msg[1]:
+                    await store.put(uid, decode(raw))
+            elif kind == "call":
+                # a dump yields to the loop between chunks, so it is served alongside the updates
+                call = asyncio.create_task(link.serve(msg[1], *msg[2]))
+                tasks.add(call)
+                call.add_done_callback(tasks.discard)
+            elif kind == "answer":
+                link.answered(*msg[1:])
+            elif kind == "clear":
+                await store.clear()
+                history.clear()
+                seasons.clear()
+            elif kind == "stop":
+                break
+    finally:
+        publisher.cancel()
+        if tasks:
+            await asyncio.wait(set(tasks), timeout=WEBHOOK_DRAIN_TIMEOUT)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await scheduler.close()
+        await outbox.close()
+        await store.close()
+        history.close()
+        await bot.session.close()
+        logger.info("shard %d stopped", index)
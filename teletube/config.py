@@ -8,24 +8,84 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 CREATOR_ID = int(os.getenv("CREATOR_ID", "0") or 0)
 CHANNEL_ID = os.getenv("CHANNEL_ID")
 BOT_NAME = os.getenv("BOT_NAME", "Мой Бот")
+# own Bot API server (e.g. http://localhost:8081); empty means api.telegram.org
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER", "")
 
 DATABASE_FILE = os.getenv("DATABASE_FILE", "database.json")
+# sqlite:///teletube.db, json://database.json or journal://database.json; defaults to DATABASE_FILE (backend picked by extension)
+DATABASE_URL = os.getenv("DATABASE_URL") or DATABASE_FILE
 KEYWORDS_FILE = os.getenv("KEYWORDS_FILE", "keywords.txt")
-LEADERBOARD_IMAGE_FILE = os.getenv("LEADERBOARD_IMAGE_FILE", "leaderboard_pic.png")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 1))
+# per-user event history for /mystats (see teletube.history)
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+HISTORY_CHUNK_ROWS = int(os.getenv("HISTORY_CHUNK_ROWS", 65536))
+# season leaderboard length in days (whole weeks keep seasons starting on Mondays) and archived places
+SEASON_DAYS = int(os.getenv("SEASON_DAYS", 28))
+SEASON_ARCHIVE_TOP = int(os.getenv("SEASON_ARCHIVE_TOP", 100))
+
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 5))
+DB_FLUSH_DIRTY_THRESHOLD = int(os.getenv("DB_FLUSH_DIRTY_THRESHOLD", 100))
+# journal:// backend: fold the journal into the snapshot once it is larger than this and the snapshot
+DB_JOURNAL_COMPACT_BYTES = int(os.getenv("DB_JOURNAL_COMPACT_BYTES", 4 * 1024 * 1024))
+# users per step of bulk admin operations and exports/imports; the event loop runs between steps
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+# seconds between recounts of the /botstats totals from all users (0 = never)
+STATS_CHECK_INTERVAL = float(os.getenv("STATS_CHECK_INTERVAL", 0))
 
 COOLDOWN_HOURS = float(os.getenv("COOLDOWN_HOURS", 12))
+COOLDOWN_NOTIFY_BATCH = int(os.getenv("COOLDOWN_NOTIFY_BATCH", 100))
 POPULARITY_THRESHOLD_BONUS = int(os.getenv("POPULARITY_THRESHOLD_BONUS", 7))
 KEYWORD_BONUS_POINTS = int(os.getenv("KEYWORD_BONUS_POINTS", 2))
 POPULARITY_RANDOM_MIN = int(os.getenv("POPULARITY_RANDOM_MIN", -10))
 POPULARITY_RANDOM_MAX = int(os.getenv("POPULARITY_RANDOM_MAX", 20))
 BONUS_SUBSCRIBERS_MIN = int(os.getenv("BONUS_SUBSCRIBERS_MIN", 1))
-BONUS_SUBSCRIBERS_MAX = int(os.getenv("BONUS_SUBSCRIBERS_MAX", 5))
+BONUS_SUBSCRIBERS_MAX = int(os.getenv("BONUS_SUBSCRIBERS_MAX", 3))
 NEGATIVE_POPULARITY_THRESHOLD = int(os.getenv("NEGATIVE_POPULARITY_THRESHOLD", -5))
+VIEWS_PER_POPULARITY_POINT = int(os.getenv("VIEWS_PER_POPULARITY_POINT", 10))
 
 DEFAULT_CURRENCY_NAME = os.getenv("DEFAULT_CURRENCY_NAME", "TeleCoin")
 DAILY_BONUS_AMOUNT = int(os.getenv("DAILY_BONUS_AMOUNT", 10))
 DAILY_BONUS_STREAK_MULTIPLIER = float(os.getenv("DAILY_BONUS_STREAK_MULTIPLIER", 1.2))
 
+# Telegram flood limits: ~30 messages/s overall and about one message/s per chat
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", 25))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", 1))
+OUTBOX_CHAT_BURST = int(os.getenv("OUTBOX_CHAT_BURST", 3))
+OUTBOX_MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", 3))
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", 10))
+
+# incoming spam: per user and command, THROTTLE_BURST commands at once, then THROTTLE_RATE per second;
+# charts and exports use the HEAVY pair. Repeated updates/button taps within DEDUP_TTL seconds are dropped
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", 0.5))
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", 4))
+THROTTLE_HEAVY_RATE = float(os.getenv("THROTTLE_HEAVY_RATE", 0.1))
+THROTTLE_HEAVY_BURST = int(os.getenv("THROTTLE_HEAVY_BURST", 2))
+THROTTLE_MAX_BUCKETS = int(os.getenv("THROTTLE_MAX_BUCKETS", 100000))
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", 2))
+
+# polling (default) or webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# public base URL Telegram should call, e.g. https://bot.example.com; leave empty when the webhook is set elsewhere
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 8080))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 64))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 10))
+
+# >1: a supervisor process receives updates and routes them to this many worker processes,
+# each owning the users with user_id % CLUSTER_WORKERS == its index and its own database shard
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", 0))
+CLUSTER_SUMMARY_INTERVAL = float(os.getenv("CLUSTER_SUMMARY_INTERVAL", 2))
+CLUSTER_TOP_N = int(os.getenv("CLUSTER_TOP_N", 50))
+# seconds a worker waits for the next answer of another shard (cluster-wide exports and bulk changes)
+CLUSTER_CALL_TIMEOUT = float(os.getenv("CLUSTER_CALL_TIMEOUT", 60))
+
+# standalone Prometheus /metrics endpoint; 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
 LOG_LEVEL_STR = os.getenv("LOG_LEVEL", "INFO").upper()
 
 shop_items = {
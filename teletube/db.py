@@ -1,90 +1,405 @@
-import os
-import json
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Dict, Any, Callable, Iterable, Optional, Set, List, Tuple
 
-from .config import DATABASE_FILE, COOLDOWN_HOURS
+from .config import (
+    DATABASE_URL, DB_FLUSH_INTERVAL, DB_FLUSH_DIRTY_THRESHOLD, BULK_CHUNK_SIZE, STATS_CHECK_INTERVAL
+)
+from .storage import StorageBackend, create_backend
+from .leaderboard import LeaderboardIndex, count_above
+from .models import UserRecord
+from .stats import Aggregates, adjustment, values_of
+from .metrics import (
+    STORE_LOAD_SECONDS, STORE_FLUSH_SECONDS, STORE_FLUSHED_USERS, STORE_FLUSH_ERRORS, STORE_BYTES_WRITTEN,
+    STORE_CHANGES, current_handler
+)
 
-_db_lock = asyncio.Lock()
-_inmemory_tasks: Dict[int, asyncio.Task] = {}
+logger = logging.getLogger(__name__)
 
 
-def load_data() -> Dict[int, Dict[str, Any]]:
-    if not os.path.exists(DATABASE_FILE):
-        return {}
-    try:
-        with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
-        return {int(k): v for k, v in raw.items()}
-    except Exception:
-        return {}
+def normalize_username(name: Optional[str]) -> str:
+    return (name or '').lstrip('@').lower()
 
 
-async def save_data_async(data: Dict[int, Dict[str, Any]]):
-    async with _db_lock:
-        tmp = DATABASE_FILE + ".tmp"
+class NameIndex:
+    """Normalized username -> ids of the users holding it, earliest holder first.
+
+    Stored usernames fall back to first names, so a name is often shared; a
+    lookup gives the earliest holder still using it, like a scan in load order.
+    """
+
+    def __init__(self):
+        # dicts as insertion-ordered sets: a holder leaves in O(1)
+        self._ids: Dict[str, Dict[int, None]] = {}
+
+    def rename(self, user_id: int, old: Optional[str], new: Optional[str]):
+        key = normalize_username(old)
+        holders = self._ids.get(key)
+        if holders is not None:
+            holders.pop(user_id, None)
+            if not holders:
+                del self._ids[key]
+        key = normalize_username(new)
+        if key:
+            self._ids.setdefault(key, {})[user_id] = None
+
+    def find(self, name: str) -> Optional[int]:
+        holders = self._ids.get(normalize_username(name))
+        return next(iter(holders)) if holders else None
+
+    def clear(self):
+        self._ids.clear()
+
+
+def get_user_data(user_id: int, data: Dict[int, UserRecord], username: str) -> UserRecord:
+    ud = data.get(user_id)
+    if ud is None:
+        ud = data[user_id] = UserRecord(username)
+    if ud.username != username:
+        ud.username = username
+    today_s = date.today().isoformat()
+    if ud.last_active_date != today_s:
+        ud.last_active_date = today_s
+        ud.days_active += 1
+    return ud
+
+
+class UserStore:
+    """Process-wide user store.
+
+    The backend is read once by `start()`; afterwards every read is served from
+    memory and changed users are only marked dirty. A background task hands dirty
+    users to the backend when `flush_interval` seconds pass or `flush_threshold`
+    users are dirty, and `close()` performs the final flush on shutdown.
+    `stats` holds the totals and activity counters, updated with every change.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend] = None, flush_interval: float = DB_FLUSH_INTERVAL,
+                 flush_threshold: int = DB_FLUSH_DIRTY_THRESHOLD, check_interval: float = STATS_CHECK_INTERVAL):
+        self._backend = backend
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.check_interval = check_interval
+        self.data: Dict[int, UserRecord] = {}
+        self._dirty: Set[int] = set()
+        self._loaded = False
+        self.leaderboard = LeaderboardIndex()
+        self.stats = Aggregates()
+        self._by_name = NameIndex()
+        # user_id -> [lock, holders+waiters]; entries are dropped once nobody uses them
+        self._user_locks: Dict[int, list] = {}
+        # user_id -> snapshot at entry of the transaction running on it
+        self._in_flight: Dict[int, tuple] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # cluster mode: summaries of the other shards (see teletube.cluster), a username change hook,
+        # this shard's (index, count), where records of users owned by other shards are sent
+        # and the calls that reach all the other shards (cluster.ShardLink)
+        self.peers: Dict[int, Dict[str, Any]] = {}
+        self.on_rename: Optional[Callable[[int, str], None]] = None
+        self.shard: Optional[Tuple[int, int]] = None
+        self.forward: Optional[Callable[[List[Tuple[int, UserRecord]]], None]] = None
+        self.remote: Optional[Any] = None
+
+    @property
+    def backend(self) -> StorageBackend:
+        if self._backend is None:
+            self._backend = create_backend(DATABASE_URL)
+        return self._backend
+
+    def load(self):
+        with STORE_LOAD_SECONDS.time():
+            self.data = self.backend.load_all()
+        self._dirty.clear()
+        self.leaderboard.rebuild((uid, ud.subscribers) for uid, ud in self.data.items())
+        self.stats.rebuild(self.data.values())
+        self._by_name = NameIndex()
+        for uid, ud in self.data.items():
+            self._by_name.rename(uid, None, ud.username)
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self.data)
+
+    def users(self):
+        self._ensure_loaded()
+        return self.data.items()
+
+    def peek(self, user_id: int) -> Optional[UserRecord]:
+        self._ensure_loaded()
+        return self.data.get(user_id)
+
+    def get_user(self, user_id: int, username: str) -> UserRecord:
+        ud, touched = self._get_user(user_id, username)
+        if touched:
+            self.mark_dirty(user_id)
+        return ud
+
+    def _get_user(self, user_id: int, username: str) -> Tuple[UserRecord, bool]:
+        """The user, created, renamed or marked active today as needed; True if that changed it."""
+        self._ensure_loaded()
+        before = self.data.get(user_id)
+        old = (before.username, before.last_active_date) if before is not None else None
+        ud = get_user_data(user_id, self.data, username)
+        if before is None:
+            self.leaderboard.update(user_id, ud.subscribers)
+            self.stats.change(None, values_of(ud))
+        if old == (ud.username, ud.last_active_date):
+            return ud, False
+        if old is None or old[1] != ud.last_active_date:
+            self.stats.activity()
+        if old is None or old[0] != ud.username:
+            self._rename(user_id, old[0] if old is not None else None, ud.username)
+        return ud, True
+
+    def _rename(self, user_id: int, old: Optional[str], new: Optional[str]):
+        self._by_name.rename(user_id, old, new)
+        if self.on_rename is not None:
+            self.on_rename(user_id, new)
+
+    def find_username(self, username: str) -> Optional[int]:
+        """user_id by username, case-insensitive and with or without '@'."""
+        self._ensure_loaded()
+        return self._by_name.find(username)
+
+    def resolve(self, target: str) -> Optional[int]:
+        """A local user from `@username` or a numeric id, as typed in commands; None if unknown."""
+        if target.startswith('@'):
+            return self.find_username(target)
         try:
-            with open(tmp, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            os.replace(tmp, DATABASE_FILE)
-        except Exception:
-            if os.path.exists(tmp):
-                try: os.remove(tmp)
-                except: pass
-
-
-def get_user_data(user_id: int, data: Dict[int, Dict[str, Any]], username: str) -> Dict[str, Any]:
-    if user_id not in data:
-        now_ts = datetime.now().timestamp()
-        data[user_id] = {
-            'username': username,
-            'subscribers': 0,
-            'last_used_timestamp': 0.0,
-            'video_count': 0,
-            'active_event': None,
-            'currency': 0,
-            'achievements_unlocked': [],
-            'last_daily_bonus_date': None,
-            'daily_bonus_streak': 0,
-            'total_subs_from_videos': 0,
-            'cooldown_notification_task': None,
-            'created_at': now_ts,
-        }
-    if data[user_id].get('username') != username:
-        data[user_id]['username'] = username
-    return data[user_id]
-
-
-async def _cooldown_notify_task(bot, user_id: int, chat_id: int, when_ts: float):
-    now = datetime.now().timestamp()
-    delay = max(0, when_ts - now)
-    try:
-        await asyncio.sleep(delay)
-        data = load_data()
-        u = data.get(user_id)
-        if not u:
-            return
-        last_ts = u.get('last_used_timestamp', 0.0)
-        next_allowed = last_ts + COOLDOWN_HOURS * 3600
-        if datetime.now().timestamp() >= next_allowed:
-            await bot.send_message(chat_id=chat_id, text=f"⏰ Ваш кулдаун завершён! Можете добавить новое видео: /addvideo")
-            u['cooldown_notification_task'] = None
-            await save_data_async(data)
-    except asyncio.CancelledError:
-        return
-    except Exception:
-        return
-
-
-def schedule_cooldown_notification(bot, user_id: int, chat_id: int, cooldown_end_time: datetime):
-    prev = _inmemory_tasks.get(user_id)
-    if prev and not prev.done():
-        prev.cancel()
-    task = asyncio.create_task(_cooldown_notify_task(bot, user_id, chat_id, cooldown_end_time.timestamp()))
-    _inmemory_tasks[user_id] = task
-    data = load_data()
-    u = data.get(user_id)
-    if u:
-        u['cooldown_notification_task'] = {'ends_at': cooldown_end_time.timestamp()}
-        asyncio.create_task(save_data_async(data))
+            user_id = int(target)
+        except ValueError:
+            return None
+        return user_id if self.peek(user_id) is not None else None
+
+    @asynccontextmanager
+    async def user(self, user_id: int, username: Optional[str] = None):
+        """Atomic read-modify-write of one user.
+
+        Transactions on the same user are serialized by a per-user lock while
+        different users proceed in parallel. With `username` the user is created
+        if missing; without it the body receives None for unknown users. If the
+        body raises, the record is rolled back to its state at entry. A flush
+        while the body is suspended writes the user as it was at entry.
+        """
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            entry = self._user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                ud, touched = self._get_user(user_id, username) if username is not None else (self.peek(user_id), False)
+                if ud is None:
+                    yield None
+                    return
+                snapshot = ud.snapshot()
+                values = values_of(ud)
+                self._in_flight[user_id] = snapshot
+                try:
+                    yield ud
+                except BaseException:
+                    ud.restore(snapshot)
+                    # creating or touching the user is not rolled back
+                    if touched:
+                        self.mark_dirty(user_id)
+                    raise
+                finally:
+                    del self._in_flight[user_id]
+                changed = ud.snapshot() != snapshot
+                # one change per transaction, however many fields it touched
+                if changed or touched:
+                    self.mark_dirty(user_id)
+                if changed:
+                    if ud.subscribers != values[0]:
+                        self.leaderboard.update(user_id, ud.subscribers)
+                    self.stats.change(values, values_of(ud))
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_locks.pop(user_id, None)
+
+    def in_transaction(self, user_id: int) -> bool:
+        """True while a `user()` transaction on this user is running; its commit saves the changes."""
+        return user_id in self._in_flight
+
+    async def put(self, user_id: int, record: UserRecord):
+        """Insert a user or overwrite all of its fields (imports)."""
+        with adjustment():
+            async with self.user(user_id) as ud:
+                if ud is None:
+                    self.data[user_id] = record
+                    self.leaderboard.update(user_id, record.subscribers)
+                    self.stats.change(None, values_of(record))
+                    self.mark_dirty(user_id)
+                    self._rename(user_id, None, record.username)
+                    return
+                # in place: a handler holding the record keeps seeing the live one
+                old = ud.username
+                ud.restore(record.snapshot())
+                if old != ud.username:
+                    self._rename(user_id, old, ud.username)
+
+    async def update_many(self, user_ids: Iterable[int], apply: Callable[[int, UserRecord], None],
+                          chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """Run `apply(user_id, record)` on each existing user, in chunks so other updates are served in between.
+
+        Every user is changed in its own `user()` transaction, so a failing
+        `apply` rolls back that user only and stops the operation.
+        """
+        count = 0
+        for i, user_id in enumerate(user_ids, 1):
+            async with self.user(user_id) as ud:
+                if ud is not None:
+                    apply(user_id, ud)
+                    count += 1
+            if i % chunk_size == 0:
+                await asyncio.sleep(0)
+        return count
+
+    def mark_dirty(self, user_id: int):
+        # every caller has seen an actual change (new user, new day, differing snapshot),
+        # so a read-only command shows up here with zero changes
+        STORE_CHANGES.inc(handler=current_handler.get())
+        self._dirty.add(user_id)
+        if self._wakeup is not None and len(self._dirty) >= self.flush_threshold:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            # Serialize on the loop thread so handlers can't mutate records mid-dump;
+            # only the disk write is moved off the event loop.
+            dirty = self._dirty
+            self._dirty = set()
+            # half-done transactions must not reach the disk: their users are
+            # swapped for their state at entry while the payload is built
+            live = {}
+            for uid, snapshot in self._in_flight.items():
+                if uid in self.data:
+                    live[uid] = self.data[uid]
+                    committed = self.data[uid] = UserRecord.__new__(UserRecord)
+                    committed.restore(snapshot)
+            try:
+                changed = {uid: self.data[uid] for uid in dirty if uid in self.data}
+                with STORE_FLUSH_SECONDS.time(stage="prepare"):
+                    payload = self.backend.prepare(changed, self.data)
+            finally:
+                self.data.update(live)
+            loop = asyncio.get_running_loop()
+            try:
+                with STORE_FLUSH_SECONDS.time(stage="write"):
+                    written = await loop.run_in_executor(None, self.backend.write, payload)
+            except Exception as e:
+                self._dirty |= dirty
+                STORE_FLUSH_ERRORS.inc()
+                logger.error("database flush error: %s", e)
+            else:
+                STORE_FLUSHED_USERS.inc(len(changed))
+                STORE_BYTES_WRITTEN.inc(written or 0)
+
+    async def clear(self):
+        async with self._flush_lock:
+            self.data = {}
+            self._dirty.clear()
+            self._loaded = True
+            self.leaderboard.clear()
+            self.stats = Aggregates()
+            self._by_name.clear()
+            self.backend.clear()
+
+    def user_count(self) -> int:
+        """Users in the whole bot, including the other shards in cluster mode."""
+        return len(self) + sum(p['size'] for p in self.peers.values())
+
+    def _local_totals(self) -> Dict[str, int]:
+        self._ensure_loaded()
+        return self.stats.totals()
+
+    def totals(self) -> Dict[str, int]:
+        out = self._local_totals()
+        for p in self.peers.values():
+            for k in out:
+                # shards running an older version report fewer keys
+                out[k] += p['totals'].get(k, 0)
+        return out
+
+    def check_stats(self) -> bool:
+        """Compare the running totals with a full recount, fixing drift; True if they matched."""
+        self._ensure_loaded()
+        return self.stats.check(self.data.values())
+
+    def top_users(self, limit: int) -> List[Tuple[int, UserRecord]]:
+        self._ensure_loaded()
+        top = [(uid, self.data[uid]) for uid, _ in self.leaderboard.top(limit)]
+        if not self.peers:
+            return top
+        for p in self.peers.values():
+            top.extend((uid, UserRecord(name, subscribers=subs, video_count=videos))
+                       for (uid, subs), (name, videos) in zip(p['top'], p['names']))
+        top.sort(key=lambda e: (-e[1].subscribers, e[0]))
+        return top[:limit]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        self._ensure_loaded()
+        rank = self.leaderboard.rank(user_id)
+        if rank is not None and self.peers:
+            # below a peer's top the count is estimated from its ladder, see count_above
+            subs = self.data[user_id].subscribers
+            rank += sum(count_above(p, subs) for p in self.peers.values())
+        return rank
+
+    def summary(self, limit: int) -> Dict[str, Any]:
+        """This store's leaderboard summary plus totals, as merged by the other shards."""
+        self._ensure_loaded()
+        out = self.leaderboard.summary(limit)
+        out['names'] = [(self.data[uid].username, self.data[uid].video_count) for uid, _ in out['top']]
+        out['totals'] = self._local_totals()
+        return out
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        next_check = loop.time() + self.check_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.check_interval > 0 and loop.time() >= next_check:
+                self.check_stats()
+                next_check = loop.time() + self.check_interval
+
+    async def start(self):
+        self._ensure_loaded()
+        if self._flush_task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+            self._wakeup = None
+        await self.flush()
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+            self._loaded = False
+
+
+store = UserStore()
+
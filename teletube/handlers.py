@@ -1,80 +1,77 @@
 import logging
 import random
-from typing import Dict, Any
+import re
+import tempfile
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from datetime import datetime, timedelta, date
 import os
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
 from aiogram import Bot, types
-from aiogram.types import (
-    ReplyKeyboardMarkup, KeyboardButton,
-    InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
-)
+from aiogram.types import BufferedInputFile, FSInputFile
 # Note: Command filter isn't needed inside handlers, it's used in `main.py` to register handlers
 
-from .config import BOT_NAME, COOLDOWN_HOURS, POPULARITY_THRESHOLD_BONUS, NEGATIVE_POPULARITY_THRESHOLD, DEFAULT_CURRENCY_NAME, LEADERBOARD_IMAGE_FILE, CREATOR_ID, shop_items, DAILY_BONUS_AMOUNT, DAILY_BONUS_STREAK_MULTIPLIER, DATABASE_FILE
-from .db import load_data, save_data_async, get_user_data, schedule_cooldown_notification, _inmemory_tasks
-from .utils import evaluate_video_popularity, get_random_event, escape_html
-from .achievements import check_and_grant_achievements
+from .config import BOT_NAME, COOLDOWN_HOURS, POPULARITY_THRESHOLD_BONUS, NEGATIVE_POPULARITY_THRESHOLD, DEFAULT_CURRENCY_NAME, CREATOR_ID, shop_items
+from .db import store
+from .scheduler import schedule_cooldown_notification, cancel_cooldown_notification, reminder_task
+from .utils import evaluate_video_popularity, estimate_video_views, get_random_event, daily_bonus_amount, escape_html, VIDEO_BONUS_SUBS_RANGE
+from .achievements import grant_achievements, notify_achievements, achievements_definition, unlocked_ids, ACTIVITY_METRICS
+from .charts import leaderboard_png, growth_png
+from .history import history, VIDEO, DAILY, PURCHASE, ADMIN
+from .seasons import seasons
+from .stats import adjustment
+from .outbox import answer, answer_photo, answer_document, edit_text
+from .transfer import export_store, import_store
+from . import templates
+from .metrics import summary as metrics_summary
 from .config import BOT_TOKEN
 
 logger = logging.getLogger(__name__)
 
 
 async def cmd_start(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-    if ud.get('video_count', 0) == 0:
-        await check_and_grant_achievements(ud, bot, message.chat.id)
-        await save_data_async(data)
-    kb = ReplyKeyboardMarkup(keyboard=[
-        [KeyboardButton(text="/addvideo Название Видео")],
-        [KeyboardButton(text="/myprofile"), KeyboardButton(text="/shop")],
-        [KeyboardButton(text="/leaderboard"), KeyboardButton(text="/achievements")],
-        [KeyboardButton(text="/daily"), KeyboardButton(text="/help")]
-    ], resize_keyboard=True)
-    await message.answer(f"🚀 Привет, {escape_html(message.from_user.first_name or '')}! Ты в игре <b>{escape_html(BOT_NAME)}</b>!\nИспользуй /help или кнопки.", reply_markup=kb, parse_mode="HTML")
-
-
-async def cmd_addvideo(message: types.Message, bot: Bot, **kwargs):
-    args = message.text.split(maxsplit=1)
-    if len(args) < 2:
-        await message.answer("Укажи название: /addvideo Название")
-        return
-    video_title = args[1].strip()
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-
-    last_used = datetime.fromtimestamp(ud.get('last_used_timestamp', 0.0))
-    next_allowed = last_used + timedelta(hours=COOLDOWN_HOURS)
-    if datetime.now() < next_allowed:
-        rem = next_allowed - datetime.now()
-        hours = rem.seconds // 3600
-        minutes = (rem.seconds % 3600) // 60
-        await message.answer(f"⏳ Кулдаун! Через {hours} ч {minutes} мин.")
-        return
-
+    async with store.user(message.from_user.id, message.from_user.username or message.from_user.first_name) as ud:
+        notices = grant_achievements(ud) if ud.video_count == 0 else []
+    notify_achievements(bot, message.chat.id, notices)
+    text, kb = templates.start(message.from_user.first_name)
+    await answer(message, text, reply_markup=kb, parse_mode="HTML")
+
+
+def _cooldown_left(ud) -> Optional[str]:
+    """The refusal for a user still on cooldown, None if they may publish."""
+    next_allowed = datetime.fromtimestamp(ud.last_used_timestamp) + timedelta(hours=COOLDOWN_HOURS)
+    if datetime.now() >= next_allowed:
+        return None
+    rem = next_allowed - datetime.now()
+    hours = rem.seconds // 3600
+    minutes = (rem.seconds % 3600) // 60
+    return f"⏳ Кулдаун! Через {hours} ч {minutes} мин."
+
+
+def _publish_video(ud, user_id: int, chat_id: int, video_title: str) -> Tuple[str, Callable[[Bot], None]]:
+    """Apply one published video to `ud` (inside its transaction); the reply text and what to run after the commit.
+
+    The reminder, the history row, the season scores and the achievement notices
+    are not rolled back with the record, so they wait until it is committed.
+    """
     event_mod = 0
     msgs = []
-    ae = ud.get('active_event')
+    ae = ud.active_event
     if ae:
         msgs.append(f"✨ Активное событие: {ae.get('message')}")
         if ae.get('target') == 'next_video_popularity' and 'modifier' in ae:
             event_mod = ae['modifier']
-        ud['active_event'] = None
+        ud.active_event = None
 
-    pop_score = evaluate_video_popularity(video_title, base_popularity_modifier=event_mod, user_subs=ud.get('subscribers', 0))
+    subs_before, currency_before = ud.subscribers, ud.currency
+    pop_score = evaluate_video_popularity(video_title, base_popularity_modifier=event_mod, user_subs=ud.subscribers)
+    views = estimate_video_views(pop_score, ud.subscribers)
     subs_change = pop_score
     bonus_subs = 0
-    msg_parts = [f"🎬 <b>{escape_html(ud.get('username',''))}</b>, «<b>{escape_html(video_title)}</b>» опубликовано!"]
+    msg_parts = [f"🎬 <b>{escape_html(ud.username)}</b>, «<b>{escape_html(video_title)}</b>» опубликовано!"]
     if msgs:
         msg_parts.extend(msgs)
 
     if pop_score > POPULARITY_THRESHOLD_BONUS:
-        bonus_subs = random.randint(1, 3)
+        bonus_subs = random.randint(*VIDEO_BONUS_SUBS_RANGE)
         subs_change += bonus_subs
         msg_parts.append(f"🌟 Супер! +{bonus_subs} бонус пдп.")
     elif pop_score < NEGATIVE_POPULARITY_THRESHOLD:
@@ -84,10 +81,11 @@ async def cmd_addvideo(message: types.Message, bot: Bot, **kwargs):
     else:
         msg_parts.append("👍 Неплохо!")
 
-    ud['subscribers'] = max(0, ud.get('subscribers', 0) + subs_change)
-    ud['last_used_timestamp'] = datetime.now().timestamp()
-    ud['video_count'] = ud.get('video_count', 0) + 1
-    ud['total_subs_from_videos'] = ud.get('total_subs_from_videos', 0) + (subs_change if subs_change > 0 else 0)
+    ud.subscribers = max(0, ud.subscribers + subs_change)
+    ud.last_used_timestamp = datetime.now().timestamp()
+    ud.video_count += 1
+    ud.total_subs_from_videos += subs_change if subs_change > 0 else 0
+    ud.best_video_views = max(ud.best_video_views, views)
 
     if subs_change > 0:
         msg_parts.append(f"📈 +{subs_change} пдп.")
@@ -95,102 +93,145 @@ async def cmd_addvideo(message: types.Message, bot: Bot, **kwargs):
         msg_parts.append(f"📉 {subs_change} пдп.")
     else:
         msg_parts.append("🤷 Пдп не изменились.")
-    msg_parts.append(f"Итого: {ud['subscribers']} пдп. (Видео: {ud['video_count']})")
+    msg_parts.append(f"👀 Просмотры: {views}")
+    msg_parts.append(f"Итого: {ud.subscribers} пдп. (Видео: {ud.video_count})")
 
-    cooldown_end = datetime.fromtimestamp(ud['last_used_timestamp']) + timedelta(hours=COOLDOWN_HOURS)
-    schedule_cooldown_notification(bot, message.from_user.id, message.chat.id, cooldown_end)
-
-    new_ev = get_random_event(ud.get('subscribers', 0))
+    new_ev = get_random_event(ud.subscribers)
     if new_ev:
         if new_ev['type'] == 'currency_bonus':
             bonus_amount = new_ev['amount']
-            ud['currency'] = ud.get('currency', 0) + bonus_amount
+            ud.currency += bonus_amount
             msg_parts.append(f"\n🔔 Событие: {escape_html(new_ev['message'])}")
         elif new_ev['type'] == 'cooldown_reduction':
             reduction_hours = new_ev['hours']
-            current_cooldown = ud.get('last_used_timestamp', 0.0)
+            current_cooldown = ud.last_used_timestamp
             if current_cooldown > 0:
                 new_cooldown = current_cooldown - (reduction_hours * 3600)
-                ud['last_used_timestamp'] = max(0, new_cooldown)
+                ud.last_used_timestamp = max(0, new_cooldown)
             msg_parts.append(f"\n🔔 Событие: {new_ev['message']}")
         else:
-            ud['active_event'] = new_ev
+            ud.active_event = new_ev
             msg_parts.append(f"\n🔔 Событие: {new_ev['message']}")
 
-    ach_msgs = await check_and_grant_achievements(ud, bot, message.chat.id)
-    if ach_msgs:
-        # achievements messages already may contain HTML formatting, extend as-is
-        msg_parts.extend(ach_msgs)
+    # after the event: a cooldown_reduction moves the reminder earlier
+    cooldown_end = datetime.fromtimestamp(ud.last_used_timestamp) + timedelta(hours=COOLDOWN_HOURS)
+    ud.cooldown_notification_task = reminder_task(chat_id, cooldown_end.timestamp())
+    notices = grant_achievements(ud)
+    subscribers, subs_delta, currency_delta = ud.subscribers, ud.subscribers - subs_before, ud.currency - currency_before
+
+    def committed(bot: Bot):
+        schedule_cooldown_notification(user_id, chat_id, cooldown_end)
+        # achievement notices are queued as coalescable and get merged into the reply
+        notify_achievements(bot, chat_id, notices)
+        history.record(user_id, VIDEO, subscribers, subs_delta, currency_delta, score=pop_score)
+        seasons.add(user_id, subs_delta)
 
-    await save_data_async(data)
-    await message.answer("\n".join(msg_parts), parse_mode="HTML")
+    return "\n".join(msg_parts), committed
+
+
+async def cmd_addvideo(message: types.Message, bot: Bot, **kwargs):
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        await answer(message, "Укажи название: /addvideo Название")
+        return
+    video_title = args[1].strip()
+    # replies are sent after the transaction: waiting out a flood limit must not hold the user's lock
+    async with store.user(message.from_user.id, message.from_user.username or message.from_user.first_name) as ud:
+        refusal = _cooldown_left(ud)
+        if refusal is None:
+            reply, committed = _publish_video(ud, message.from_user.id, message.chat.id, video_title)
+    if refusal is not None:
+        await answer(message, refusal)
+        return
+    committed(bot)
+    await answer(message, reply, parse_mode="HTML", coalesce=True)
+
+
+_WINDOW_ARGS = {'day': 'day', 'today': 'day', 'день': 'day', 'week': 'week', 'неделя': 'week',
+                'season': 'season', 'сезон': 'season'}
+_WINDOW_TITLES = {'day': "за сегодня", 'week': "за неделю", 'season': "сезона"}
 
 
 async def cmd_leaderboard(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    if not data:
-        await message.answer("🏆 В боте пока нет данных.")
+    args = message.text.split()[1:]
+    arg = args[0].lower() if args else ''
+    if arg in ('last', 'прошлый'):
+        await _last_season(message)
         return
-    users = sorted(data.values(), key=lambda u: u.get('subscribers', 0), reverse=True)
+    if arg in _WINDOW_ARGS:
+        await _window_leaderboard(message, _WINDOW_ARGS[arg])
+        return
+    if not store.user_count():
+        await answer(message, "🏆 В боте пока нет данных.")
+        return
+    users = [u for _, u in store.top_users(15)]
     msg = "🏆 <b>Топеры:</b>\n\n"
     shown = 0
     for u in users:
-        if shown >= 15: break
-        msg += f"{shown+1}. {escape_html(u.get('username','N/A'))} - {escape_html(u.get('subscribers',0))} пдп. (видео: {escape_html(u.get('video_count',0))})\n"
+        msg += f"{shown+1}. {escape_html(u.username)} - {escape_html(u.subscribers)} пдп. (видео: {escape_html(u.video_count)})\n"
         shown += 1
-    await message.answer(msg, parse_mode="HTML")
+    await answer(message, msg, parse_mode="HTML")
 
 
-async def cmd_leaderboardpic(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    if not data:
-        await message.answer("📊 Данных нет.")
+async def _window_leaderboard(message: types.Message, window: str):
+    top = seasons.top(window, 15)
+    title = _WINDOW_TITLES[window]
+    if window == 'season':
+        title += f" (до конца {seasons.days_left('season')} дн.)"
+    if not top:
+        await answer(message, f"🏆 Топ {title}: пока никто не публиковал видео.")
+        return
+    msg = f"🏆 <b>Топ {escape_html(title)}:</b>\n\n"
+    for place, (_, name, score) in enumerate(top, 1):
+        msg += f"{place}. {escape_html(name)} - {score:+} пдп.\n"
+    await answer(message, msg, parse_mode="HTML")
+
+
+async def _last_season(message: types.Message):
+    archived = seasons.archive(1)
+    if not archived:
+        await answer(message, "🏆 Завершённых сезонов пока нет.")
         return
-    df = pd.DataFrame.from_dict(data, orient='index')
-    if 'subscribers' not in df.columns or df['subscribers'].isnull().all():
-        await message.answer("📊 Проблема с данными пдп.")
+    last = archived[0]
+    msg = f"🏆 <b>Итоги сезона {escape_html(last['start'])} — {escape_html(last['end'])}</b> (игроков: {last['players']})\n\n"
+    for place, (_, name, score) in enumerate(last['top'][:15], 1):
+        msg += f"{place}. {escape_html(name)} - {score:+} пдп.\n"
+    await answer(message, msg, parse_mode="HTML")
+
+
+async def cmd_leaderboardpic(message: types.Message, bot: Bot, **kwargs):
+    if not store.user_count():
+        await answer(message, "📊 Данных нет.")
         return
-    df_valid = df[df['subscribers'] > 0].sort_values(by='subscribers', ascending=False)
-    if df_valid.empty:
-        await message.answer("📊 Нет юзеров с пдп > 0.")
+    rows = tuple((str(u.username), int(u.subscribers))
+                 for _, u in store.top_users(15) if u.subscribers > 0)
+    if not rows:
+        await answer(message, "📊 Нет юзеров с пдп > 0.")
         return
-    top = df_valid.head(15)
-    names = top['username'].astype(str).values
-    subs = top['subscribers'].astype(int).values
-    fig, ax = plt.subplots(figsize=(10, 7))
-    wedges, texts, autotexts = ax.pie(subs, autopct=lambda p: f'{p:.1f}%' if p > 3 else '', startangle=140)
-    ax.legend(wedges, [f"{n} ({s})" for n, s in zip(names, subs)], title="Топ", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
-    ax.set_title(f"Топ {BOT_NAME}еров")
-    plt.tight_layout(rect=[0, 0, 0.75, 1])
     try:
-        plt.savefig(LEADERBOARD_IMAGE_FILE, dpi=150, bbox_inches='tight')
-        plt.close(fig)
-        await message.answer_photo(photo=FSInputFile(LEADERBOARD_IMAGE_FILE))
+        png = await leaderboard_png(rows)
+        await answer_photo(message, BufferedInputFile(png, filename="leaderboard.png"))
     except Exception as e:
         logger.exception("leaderboard pic error: %s", e)
-        await message.answer("Ошибка генерации картинки.")
-    finally:
-        if os.path.exists(LEADERBOARD_IMAGE_FILE):
-            try: os.remove(LEADERBOARD_IMAGE_FILE)
-            except: pass
+        await answer(message, "Ошибка генерации картинки.")
 
 
 async def cmd_myprofile(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-    uname = ud.get('username', message.from_user.first_name)
-    subs = ud.get('subscribers', 0)
-    vids = ud.get('video_count', 0)
-    curr = ud.get('currency', 0)
-    tot = ud.get('total_subs_from_videos', 0)
+    ud = store.get_user(message.from_user.id, message.from_user.username or message.from_user.first_name)
+    uname = ud.username
+    subs = ud.subscribers
+    vids = ud.video_count
+    curr = ud.currency
+    tot = ud.total_subs_from_videos
     avg = (tot / vids) if vids > 0 else 0.0
     out = [f"👤 <b>Твой профиль, {escape_html(uname)}:</b>",
            f"👥 Пдп: {subs}",
+           f"🏅 Место в топе: {store.rank(message.from_user.id)} из {store.user_count()}",
            f"💰 {DEFAULT_CURRENCY_NAME}: {curr}",
            f"📹 Видео: {vids}"]
     if vids > 0:
         out.append(f"📈 Сред. пдп/видео: {avg:.2f}")
-    luts = ud.get('last_used_timestamp', 0)
+    luts = ud.last_used_timestamp
     if luts == 0:
         out.append("🕓 Посл. видео: — (опубликуй что-нибудь /addvideo Название)")
     else:
@@ -204,246 +245,345 @@ async def cmd_myprofile(message: types.Message, bot: Bot, **kwargs):
             out.append(f"⏳ Сл. видео через: {h}ч {m}м")
         else:
             out.append("✅ Можно публиковать новое!")
-    if ud.get('active_event'):
-        out.append(f"\n✨ <b>Активное событие:</b> {escape_html(ud['active_event']['message'])}")
-    await save_data_async(data)
-    await message.answer("\n".join(out), parse_mode="HTML")
+    if ud.active_event:
+        out.append(f"\n✨ <b>Активное событие:</b> {escape_html(ud.active_event['message'])}")
+    await answer(message, "\n".join(out), parse_mode="HTML")
+
+
+async def cmd_mystats(message: types.Message, bot: Bot, **kwargs):
+    ud = store.get_user(message.from_user.id, message.from_user.username or message.from_user.first_name)
+    events = history.user_events(message.from_user.id)
+    if not len(events):
+        await answer(message, "📈 История пока пуста. Опубликуй видео: /addvideo Название")
+        return
+    # the count before the first recorded change, then after each one, then now
+    ts = [float(events['ts'][0])] + events['ts'].tolist() + [datetime.now().timestamp()]
+    subs = [int(events['subscribers'][0] - events['subs_delta'][0])] + events['subscribers'].tolist() + [ud.subscribers]
+    videos = events[events['kind'] == VIDEO]
+    currency = events['currency_delta']
+    caption = (f"📈 Рост пдп: {subs[0]} → {ud.subscribers}\n"
+               f"📹 Видео в истории: {len(videos)}")
+    if len(videos):
+        caption += f", лучшая оценка: {int(videos['score'].max())}, пдп с видео: {int(videos['subs_delta'].sum()):+}"
+    caption += (f"\n💰 {DEFAULT_CURRENCY_NAME}: +{int(currency[currency > 0].sum())} / "
+                f"{int(currency[currency < 0].sum())}")
+    try:
+        png = await growth_png(f"Пдп {ud.username}", ts, subs)
+        await answer_photo(message, BufferedInputFile(png, filename="mystats.png"), caption=caption)
+    except Exception as e:
+        logger.exception("mystats chart error: %s", e)
+        await answer(message, caption)
 
 
 async def cmd_achievements(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-    unlocked = ud.get('achievements_unlocked', [])
+    ud = store.get_user(message.from_user.id, message.from_user.username or message.from_user.first_name)
+    unlocked = unlocked_ids(ud.achievements_mask)
     if not unlocked:
-        await message.answer("Пока нет достижений.")
-        await save_data_async(data)
+        await answer(message, "Пока нет достижений.")
         return
     txt = "🏆 <b>Ваши достижения:</b>\n\n"
-    from .achievements import achievements_definition
     for aid in unlocked:
-        if aid in achievements_definition:
-            txt += f"- {escape_html(achievements_definition[aid]['name'])}\n"
+        txt += f"- {escape_html(achievements_definition[aid]['name'])}\n"
     txt += "\n🔍 <i>Неразблокированные (первые 3):</i>\n"
     cnt = 0
     # find first 3 locked
-    from .achievements import achievements_definition
     for aid, ad in achievements_definition.items():
         if aid not in unlocked:
             txt += f"- ❓ {escape_html(ad['name'])}\n"
             cnt += 1
             if cnt >= 3:
                 break
-    await save_data_async(data)
-    await message.answer(txt, parse_mode="HTML")
+    await answer(message, txt, parse_mode="HTML")
 
 
 async def cmd_daily(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-    today_s = date.today().isoformat()
-    last = ud.get('last_daily_bonus_date')
-    streak = ud.get('daily_bonus_streak', 0)
-    if last == today_s:
-        await message.answer("Уже получили бонус сегодня. Приходи завтра!")
-        await save_data_async(data)
+    async with store.user(message.from_user.id, message.from_user.username or message.from_user.first_name) as ud:
+        today_s = date.today().isoformat()
+        last = ud.last_daily_bonus_date
+        streak = ud.daily_bonus_streak
+        claimed = last == today_s
+        if not claimed:
+            if last:
+                prev = date.fromisoformat(last)
+                if (date.today() - prev).days == 1:
+                    streak = streak + 1
+                else:
+                    streak = 1
+            else:
+                streak = 1
+            bonus = daily_bonus_amount(streak)
+            currency_before = ud.currency
+            ud.currency += bonus
+            ud.last_daily_bonus_date = today_s
+            ud.daily_bonus_streak = streak
+            notices = grant_achievements(ud, metrics=ACTIVITY_METRICS)
+            subscribers, currency_delta = ud.subscribers, ud.currency - currency_before
+    # side effects and replies come after the transaction, see cmd_addvideo
+    if claimed:
+        await answer(message, "Уже получили бонус сегодня. Приходи завтра!")
         return
-    if last:
-        prev = date.fromisoformat(last)
-        if (date.today() - prev).days == 1:
-            streak = streak + 1
-        else:
-            streak = 1
-    else:
-        streak = 1
-    bonus = int(DAILY_BONUS_AMOUNT * (DAILY_BONUS_STREAK_MULTIPLIER ** (streak - 1)))
-    ud['currency'] = ud.get('currency', 0) + bonus
-    ud['last_daily_bonus_date'] = today_s
-    ud['daily_bonus_streak'] = streak
-    ach = await check_and_grant_achievements(ud, bot, message.chat.id)
-    await save_data_async(data)
+    notify_achievements(bot, message.chat.id, notices)
+    history.record(message.from_user.id, DAILY, subscribers, currency_delta=currency_delta)
     res = f"🎁 Ежедневный бонус: +{bonus} {DEFAULT_CURRENCY_NAME}!\n🔥 Ваш стрик: {streak} дн."
-    if ach:
-        res += "\n" + "\n".join(ach)
-    await message.answer(res, parse_mode="HTML")
+    await answer(message, res, parse_mode="HTML", coalesce=True)
 
 
 async def cmd_shop(message: types.Message, bot: Bot, **kwargs):
-    data = load_data()
-    ud = get_user_data(message.from_user.id, data, message.from_user.username or message.from_user.first_name)
-    bal = ud.get('currency', 0)
-    txt = f"🛍️ <b>Магазин {escape_html(BOT_NAME)}</b>\nБаланс: {escape_html(bal)} {escape_html(DEFAULT_CURRENCY_NAME)}\n\n"
-    kb_rows = []
-    from .config import shop_items
-    for item_id, item in shop_items.items():
-        txt += f"🔹 <b>{escape_html(item['name'])}</b> - {escape_html(item['price'])} {escape_html(DEFAULT_CURRENCY_NAME)}\n   <i>{escape_html(item['description'])}</i>\n\n"
-        kb_rows.append([InlineKeyboardButton(text=f"Купить {item['name']} ({item['price']})", callback_data=f"shop_buy:{item_id}")])
-    markup = InlineKeyboardMarkup(inline_keyboard=kb_rows) if kb_rows else None
-    await save_data_async(data)
-    await message.answer(txt, parse_mode="HTML", reply_markup=markup)
+    # read-only: the balance of an unknown user is 0, no need to register them here
+    ud = store.peek(message.from_user.id)
+    txt, markup = templates.shop(ud.currency if ud is not None else 0)
+    await answer(message, txt, parse_mode="HTML", reply_markup=markup)
+
+
+def _buy(ud, user_id: int, item: Dict[str, Any]) -> str:
+    """Charge `ud` for `item` and apply its effect (inside the user's transaction); the reply text."""
+    price = item['price']
+    ud.currency -= price
+    effect = item['effect']
+    app_msg = f"✅ Куплено «{escape_html(item['name'])}» за {escape_html(price)} {escape_html(DEFAULT_CURRENCY_NAME)}.\n"
+    if effect['type'] == 'event_modifier' and effect.get('target') == 'next_video_popularity':
+        ud.active_event = {
+            "type": "event_modifier",
+            "modifier": effect['modifier'],
+            "target": "next_video_popularity",
+            "message": f"Использован «{item['name']}» ({effect['modifier']:+})"
+        }
+        app_msg += "Эффект применён к следующему видео."
+    elif effect['type'] == 'cooldown_reset':
+        ud.last_used_timestamp = 0.0
+        # the pending reminder is dropped by cancel_cooldown_notification after the commit
+        ud.cooldown_notification_task = None
+        app_msg += "Кулдаун сброшен!"
+    return app_msg
 
 
 async def cb_shop_buy(query: types.CallbackQuery, bot: Bot, **kwargs):
     await query.answer()
-    data = load_data()
     user_id = query.from_user.id
-    ud = get_user_data(user_id, data, query.from_user.username or query.from_user.first_name)
     payload = query.data.split(":", 1)
     if len(payload) != 2:
-        await query.message.edit_text("Ошибка формата.")
+        await edit_text(query.message, "Ошибка формата.")
         return
     item_id = payload[1]
     from .config import shop_items
     if item_id not in shop_items:
-        await query.message.edit_text("Товар не найден.")
-        await save_data_async(data)
+        store.get_user(user_id, query.from_user.username or query.from_user.first_name)
+        await edit_text(query.message, "Товар не найден.")
         return
     item = shop_items[item_id]
     price = item['price']
-    if ud.get('currency', 0) < price:
-        await query.message.edit_text(f"Мало средств! Нужно {price}, у вас {ud.get('currency', 0)}.")
-        await save_data_async(data)
+    async with store.user(user_id, query.from_user.username or query.from_user.first_name) as ud:
+        balance = ud.currency
+        if balance >= price:
+            app_msg = _buy(ud, user_id, item)
+            notices = grant_achievements(ud, metrics=ACTIVITY_METRICS)
+            subscribers, currency_delta = ud.subscribers, ud.currency - balance
+    # side effects and the edit come after the transaction, see cmd_addvideo
+    if balance < price:
+        await edit_text(query.message, f"Мало средств! Нужно {price}, у вас {balance}.")
         return
-    ud['currency'] -= price
-    effect = item['effect']
-    app_msg = f"✅ Куплено «{escape_html(item['name'])}» за {escape_html(price)} {escape_html(DEFAULT_CURRENCY_NAME)}.\n"
-    if effect['type'] == 'event_modifier' and effect.get('target') == 'next_video_popularity':
-        ud['active_event'] = {
-            "type": "event_modifier",
-            "modifier": effect['modifier'],
-            "target": "next_video_popularity",
-            "message": f"Использован «{item['name']}» ({effect['modifier']:+})"
-        }
-        app_msg += "Эффект применён к следующему видео."
-    elif effect['type'] == 'cooldown_reset':
-        ud['last_used_timestamp'] = 0.0
-        app_msg += "Кулдаун сброшен!"
-        t = _inmemory_tasks.get(user_id)
-        if t and not t.done():
-            t.cancel()
-            _inmemory_tasks.pop(user_id, None)
-        ud['cooldown_notification_task'] = None
-    await check_and_grant_achievements(ud, bot, query.message.chat.id)
-    await save_data_async(data)
-    await query.message.edit_text(app_msg, parse_mode="HTML")
+    if item['effect']['type'] == 'cooldown_reset':
+        cancel_cooldown_notification(user_id)
+    notify_achievements(bot, query.message.chat.id, notices)
+    history.record(user_id, PURCHASE, subscribers, currency_delta=currency_delta)
+    await edit_text(query.message, app_msg, parse_mode="HTML")
 
 
 async def cmd_help(message: types.Message, bot: Bot, **kwargs):
-    text = (
-        f"🌟 <b>{escape_html(BOT_NAME)}!</b>\n\n"
-        "Публикуй видео, копи валюту и прокачивайся!\n\n"
-        "<b>Команды:</b>\n"
-        f"🎬 <code>/addvideo {escape_html('<название>')}</code>\n"
-        f"🏆 <code>/leaderboard</code>  <code>/leaderboardpic</code>\n"
-        f"👤 <code>/myprofile</code>\n"
-        f"🛍️ <code>/shop</code>\n"
-        f"🎁 <code>/daily</code>\n"
-        f"🏅 <code>/achievements</code>\n"
-        f"❓ <code>/help</code>\n\n"
-        f"Механика: публикация раз в {COOLDOWN_HOURS:.1f} ч. Популярность зависит от заголовка, слов-ключей и удачи. Есть события и магазин.\n\n"
-    )
-    await message.answer(text, parse_mode="HTML")
+    await answer(message, templates.help_text(), parse_mode="HTML")
 
 
 # Admin commands
 async def admin_check_and_get(message: types.Message) -> bool:
     if message.from_user.id != CREATOR_ID:
-        await message.answer("⛔ Только для админа.")
+        await answer(message, "⛔ Только для админа.")
         return False
     return True
 
-async def admin_add_currency(message: types.Message, bot: Bot, **kwargs):
-    ok = await admin_check_and_get(message)
-    if not ok: return
+async def _admin_target(message: types.Message, usage: str):
+    """(user_id, amount) from `/command <id/@usr> <amount>`, or None after replying why not."""
     parts = message.text.split()
     if len(parts) < 3:
-        await message.answer("Исп: /CHEATaddcoins <id/@usr> <кол-во>")
-        return
-    target = parts[1]
+        await answer(message, usage)
+        return None
     try:
         amount = int(parts[2])
-    except:
-        await message.answer("кол-во должно быть числом")
-        return
-    data = load_data()
-    found = None
-    if target.startswith('@'):
-        uname = target[1:].lower()
-        for uid, info in data.items():
-            if (info.get('username') or '').lstrip('@').lower() == uname:
-                found = uid
-                break
-    else:
-        try:
-            uid = int(target)
-            if uid in data:
-                found = uid
-        except:
-            pass
-    if not found:
-        await message.answer("Юзер не найден.")
+    except ValueError:
+        await answer(message, "кол-во должно быть числом")
+        return None
+    found = store.resolve(parts[1])
+    if found is None:
+        await answer(message, "Юзер не найден.")
+        return None
+    return found, amount
+
+
+async def admin_add_currency(message: types.Message, bot: Bot, **kwargs):
+    ok = await admin_check_and_get(message)
+    if not ok: return
+    target = await _admin_target(message, "Исп: /CHEATaddcoins <id/@usr> <кол-во>")
+    if target is None:
         return
-    data[found]['currency'] = max(0, data[found].get('currency', 0) + amount)
-    await save_data_async(data)
-    await message.answer(f"Баланс юзера обновлён: {data[found]['currency']} {DEFAULT_CURRENCY_NAME}")
+    found, amount = target
+    with adjustment():
+        async with store.user(found) as target_ud:
+            balance = max(0, target_ud.currency + amount)
+            subscribers, delta = target_ud.subscribers, balance - target_ud.currency
+            target_ud.currency = balance
+    history.record(found, ADMIN, subscribers, currency_delta=delta)
+    await answer(message, f"Баланс юзера обновлён: {balance} {DEFAULT_CURRENCY_NAME}")
 
 
 async def admin_add_subs(message: types.Message, bot: Bot, **kwargs):
     ok = await admin_check_and_get(message)
     if not ok: return
-    parts = message.text.split()
-    if len(parts) < 3:
-        await message.answer("Исп: /CHEATaddsub <id/@usr> <кол-во>")
+    target = await _admin_target(message, "Исп: /CHEATaddsub <id/@usr> <кол-во>")
+    if target is None:
         return
-    target = parts[1]
+    found, amount = target
+    with adjustment():
+        async with store.user(found) as target_ud:
+            subs = max(0, target_ud.subscribers + amount)
+            delta = subs - target_ud.subscribers
+            target_ud.subscribers = subs
+    history.record(found, ADMIN, subs, subs_delta=delta)
+    await answer(message, f"Пдп юзера обновлены: {subs}")
+
+
+_BULK_COMMAND = re.compile(r"^\S+\s+(all|top(\d+))\s+(subscribers|currency)\s+([+=-])(\d+)\s*$", re.IGNORECASE)
+_BULK_OPS = {
+    '+': lambda current, value: current + value,
+    '-': lambda current, value: current - value,
+    '=': lambda current, value: value,
+}
+
+
+async def bulk_update(field: str, sign: str, value: int, user_ids: Optional[List[int]] = None) -> int:
+    """Change `field` of this process's users (all, or those of `user_ids` it has); users changed.
+
+    In cluster mode every shard runs it for the /CHEATbulk of one of them.
+    """
+    op = _BULK_OPS[sign]
+    targets = [uid for uid, _ in store.users()] if user_ids is None else user_ids
+
+    def apply(user_id, ud):
+        before = getattr(ud, field)
+        after = max(0, op(before, value))
+        setattr(ud, field, after)
+        if after == before:
+            return
+        if field == 'subscribers':
+            history.record(user_id, ADMIN, after, subs_delta=after - before)
+        else:
+            history.record(user_id, ADMIN, ud.subscribers, currency_delta=after - before)
+
+    with adjustment():
+        return await store.update_many(targets, apply)
+
+
+async def _top_ids(limit: int) -> List[int]:
+    """The first `limit` users of the whole bot, ordered like `store.top_users`."""
+    top = list(store.leaderboard.top(limit))
+    if store.remote is not None:
+        # the peers' summaries only hold their first CLUSTER_TOP_N: ask the shards themselves
+        for part in await store.remote.call("top", limit):
+            top.extend(map(tuple, part))
+        top.sort(key=lambda e: (-e[1], e[0]))
+    return [uid for uid, _ in top[:limit]]
+
+
+async def admin_bulk(message: types.Message, bot: Bot, **kwargs):
+    ok = await admin_check_and_get(message)
+    if not ok: return
+    m = _BULK_COMMAND.match(message.text)
+    if not m:
+        await answer(message, "Исп: /CHEATbulk <all|topN> <subscribers|currency> <+N|-N|=N>\n"
+                              "Напр. сброс сезона: /CHEATbulk all subscribers =0")
+        return
+    top, field, sign, value = m.group(2), m.group(3).lower(), m.group(4), int(m.group(5))
     try:
-        amount = int(parts[2])
-    except:
-        await message.answer("кол-во должно быть числом")
+        targets = None if top is None else await _top_ids(int(top))
+        count = await bulk_update(field, sign, value, targets)
+        if store.remote is not None:
+            count += sum(await store.remote.call("bulk", (field, sign, value, targets)))
+    except Exception as e:
+        logger.exception("bulk error: %s", e)
+        await answer(message, f"Ошибка: {e}")
         return
-    data = load_data()
-    found = None
-    if target.startswith('@'):
-        uname = target[1:].lower()
-        for uid, info in data.items():
-            if (info.get('username') or '').lstrip('@').lower() == uname:
-                found = uid
-                break
-    else:
-        try:
-            uid = int(target)
-            if uid in data:
-                found = uid
-        except:
-            pass
-    if not found:
-        await message.answer("Юзер не найден.")
+    await answer(message, f"Изменено юзеров: {count}")
+
+
+async def admin_export(message: types.Message, bot: Bot, **kwargs):
+    ok = await admin_check_and_get(message)
+    if not ok: return
+    ext = 'csv' if 'csv' in message.text.lower().split()[1:] else 'jsonl'
+    fd, path = tempfile.mkstemp(prefix="teletube-export-", suffix=f".{ext}")
+    os.close(fd)
+    try:
+        count = await export_store(store, path)
+        await answer_document(message, FSInputFile(path, filename=f"users-{date.today().isoformat()}.{ext}"),
+                              caption=f"Юзеров: {count}")
+    except Exception as e:
+        logger.exception("export error: %s", e)
+        await answer(message, f"Ошибка экспорта: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def admin_import(message: types.Message, bot: Bot, **kwargs):
+    ok = await admin_check_and_get(message)
+    if not ok: return
+    doc = message.document
+    if doc is None or not (doc.file_name or '').lower().endswith(('.jsonl', '.csv')):
+        await answer(message, "Пришлите файл .jsonl или .csv с подписью /CHEATimport")
         return
-    data[found]['subscribers'] = max(0, data[found].get('subscribers', 0) + amount)
-    await save_data_async(data)
-    await message.answer(f"Пдп юзера обновлены: {data[found]['subscribers']}")
+    ext = 'csv' if doc.file_name.lower().endswith('.csv') else 'jsonl'
+    fd, path = tempfile.mkstemp(prefix="teletube-import-", suffix=f".{ext}")
+    os.close(fd)
+    try:
+        await bot.download(doc, destination=path)
+        count, forwarded, skipped = await import_store(store, path)
+        text = f"Импортировано юзеров: {count}"
+        if forwarded:
+            text += f"\nПередано другим процессам: {forwarded}"
+        if skipped:
+            text += f"\nПропущено (чужой шард): {skipped}"
+        await answer(message, text)
+    except Exception as e:
+        logger.exception("import error: %s", e)
+        await answer(message, f"Ошибка импорта: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
 
 
 async def admin_delete_db(message: types.Message, bot: Bot, **kwargs):
     ok = await admin_check_and_get(message)
     if not ok: return
-    if os.path.exists(DATABASE_FILE):
+    if len(store) or os.path.exists(store.backend.location):
         try:
-            os.remove(DATABASE_FILE)
-            await message.answer(f"{DATABASE_FILE} удалён.")
+            await store.clear()
+            history.clear()
+            seasons.clear()
+            await answer(message, f"База {store.backend.location} очищена.")
         except Exception as e:
-            await message.answer(f"Ошибка: {e}")
+            await answer(message, f"Ошибка: {e}")
     else:
-        await message.answer("Файл БД не найден.")
+        await answer(message, "Файл БД не найден.")
 
 
 async def admin_stats(message: types.Message, bot: Bot, **kwargs):
     ok = await admin_check_and_get(message)
     if not ok: return
-    data = load_data()
-    tu = len(data)
-    ts = sum(i.get('subscribers', 0) for i in data.values())
-    tv = sum(i.get('video_count', 0) for i in data.values())
-    tc = sum(i.get('currency', 0) for i in data.values())
+    totals = store.totals()
+    tu, ts, tv, tc = totals['users'], totals['subscribers'], totals['video_count'], totals['currency']
     txt = (f"📊 <b>Стата {escape_html(BOT_NAME)}:</b>\n\n"
-           f"👥 Юзеров: {tu}\n▶️ Видео: {tv}\n📈 Сумма пдп: {ts}\n💰 Сумма валюты: {tc} {DEFAULT_CURRENCY_NAME}")
-    await message.answer(txt, parse_mode="HTML")
+           f"👥 Юзеров: {tu} (активны сегодня: {totals['active_today']})\n"
+           f"▶️ Видео: {tv} (за час: {totals['videos_1h']}, за сутки: {totals['videos_24h']})\n"
+           f"📈 Сумма пдп: {ts}\n💰 Сумма валюты: {tc} {DEFAULT_CURRENCY_NAME}\n"
+           f"💸 За сутки: +{totals['minted_24h']} / -{totals['spent_24h']} {DEFAULT_CURRENCY_NAME}")
+    perf = metrics_summary()
+    if perf:
+        txt += f"\n\n⏱ <b>Производительность:</b>\n{escape_html(perf)}"
+    await answer(message, txt, parse_mode="HTML")
@@ -0,0 +1,279 @@
+"""Append-only per-user event history in memory-mappable columnar chunks.
+
+Every change worth charting (a published video, the daily bonus, a purchase,
+an admin adjustment) is one row: time, user, kind, video score, subscriber and
+currency deltas and the subscriber count after the change.
+
+Layout of `HISTORY_DIR`:
+
+    chunk-000001/ts.npy, user_id.npy, ...   sealed chunks, one .npy per column,
+                                            rows sorted by (user_id, ts)
+    active-000002.bin                       rows of the chunk being filled,
+                                            packed records in arrival order
+
+New rows are appended to the active file (by a writer thread) and kept in
+memory; once it holds `HISTORY_CHUNK_ROWS` rows it is sorted and sealed as the
+next chunk. Sealed chunks are opened with `mmap_mode='r'`, so a per-user query
+binary-searches the `user_id` column and reads only that user's rows of the
+other columns. numpy is imported when the history is first opened, not with the bot.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .config import HISTORY_DIR, HISTORY_CHUNK_ROWS
+
+logger = logging.getLogger(__name__)
+
+# event kinds
+VIDEO, DAILY, PURCHASE, ADMIN = 1, 2, 3, 4
+
+_FIELDS = (
+    ('ts', '<f8'), ('user_id', '<i8'), ('kind', 'u1'), ('score', '<i4'),
+    ('subs_delta', '<i8'), ('currency_delta', '<i8'), ('subscribers', '<i8'),
+)
+COLUMNS = tuple(name for name, _ in _FIELDS)
+_event = None
+
+
+def event_dtype() -> Any:
+    """numpy dtype of a row; importing numpy is put off until the first use."""
+    global _event
+    if _event is None:
+        import numpy as np
+        _event = np.dtype(list(_FIELDS))
+    return _event
+
+
+class _Chunk:
+    def __init__(self, path: str):
+        self.path = path
+        self._columns: Dict[str, Any] = {}
+
+    def column(self, name: str):
+        col = self._columns.get(name)
+        if col is None:
+            import numpy as np
+            col = self._columns[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return col
+
+    def rows(self, user_id: int):
+        import numpy as np
+
+        ids = self.column('user_id')
+        lo = int(np.searchsorted(ids, user_id, 'left'))
+        hi = int(np.searchsorted(ids, user_id, 'right'))
+        out = np.empty(hi - lo, dtype=event_dtype())
+        if hi > lo:
+            for name in COLUMNS:
+                out[name] = self.column(name)[lo:hi]
+        return out
+
+
+def _fsync_dir(path: str):
+    # makes a rename durable; directories can't be opened this way on Windows
+    if os.name == 'posix':
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class History:
+    """The event history of this process.
+
+    `record()` only queues the row: appending it to the active file and
+    sealing full chunks happen on one writer thread, so the event loop (and
+    the store transaction that records the event) never waits for the disk.
+    Queries see queued rows as well. `close()` writes what is still queued;
+    a crash loses at most the rows queued at that moment.
+    """
+
+    def __init__(self, path: str = HISTORY_DIR, chunk_rows: int = HISTORY_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._chunks: List[_Chunk] = []
+        # allocated by open()
+        self._active = None
+        self._active_len = 0
+        self._seq = 1
+        self._file = None
+        # rows recorded but not yet taken by the writer
+        self._pending: List[tuple] = []
+        self._scheduled = False
+        # guards the rows in memory (_pending, _active, _chunks) between the loop and the writer
+        self._lock = threading.RLock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+
+    def _name(self, kind: str, seq: int) -> str:
+        return os.path.join(self.path, f"{kind}-{seq:06d}")
+
+    def open(self):
+        import numpy as np
+
+        with self._lock:
+            event = event_dtype()
+            self._active = np.empty(self.chunk_rows, dtype=event)
+            os.makedirs(self.path, exist_ok=True)
+            sealed = sorted(int(n[6:]) for n in os.listdir(self.path) if n.startswith('chunk-') and '.' not in n)
+            self._chunks = [_Chunk(self._name('chunk', seq)) for seq in sealed]
+            self._seq = sealed[-1] + 1 if sealed else 1
+            for n in os.listdir(self.path):
+                # leftovers of a seal interrupted before or after the chunk's rename
+                if n.startswith('active-') and int(n[7:13]) < self._seq or n.endswith('.tmp'):
+                    full = os.path.join(self.path, n)
+                    shutil.rmtree(full) if os.path.isdir(full) else os.remove(full)
+            active = self._name('active', self._seq) + '.bin'
+            self._active_len = 0
+            if os.path.exists(active):
+                with open(active, 'rb') as f:
+                    raw = f.read()
+                whole = len(raw) // event.itemsize
+                if whole * event.itemsize != len(raw):
+                    logger.warning("history: dropping a torn record at the end of %s", active)
+                rows = np.frombuffer(raw[:whole * event.itemsize], dtype=event)
+                self._active[:whole] = rows
+                self._active_len = whole
+            self._file = open(active, 'ab')
+            self._file.truncate(self._active_len * event.itemsize)
+            if self._active_len >= self.chunk_rows:
+                self._seal()
+
+    def _ensure_open(self):
+        if self._file is None:
+            with self._lock:
+                if self._file is None:
+                    self.open()
+
+    def record(self, user_id: int, kind: int, subscribers: int, subs_delta: int = 0, currency_delta: int = 0,
+               score: int = 0, ts: Optional[float] = None):
+        row = (time.time() if ts is None else ts, user_id, kind, score, subs_delta, currency_delta, subscribers)
+        with self._lock:
+            self._pending.append(row)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._writer.submit(self._write_pending)
+
+    def _write_pending(self):
+        # writer thread: the only one that appends to the active rows and files
+        try:
+            self._ensure_open()
+            while True:
+                with self._lock:
+                    rows = self._pending[:self.chunk_rows - self._active_len]
+                    if not rows:
+                        self._scheduled = False
+                        return
+                    del self._pending[:len(rows)]
+                    i = self._active_len
+                    self._active[i:i + len(rows)] = rows
+                    self._active_len += len(rows)
+                    raw = self._active[i:self._active_len].tobytes()
+                self._file.write(raw)
+                self._file.flush()
+                if self._active_len >= self.chunk_rows:
+                    self._seal()
+        except Exception:
+            logger.exception("history: writing events failed")
+            with self._lock:
+                self._scheduled = False
+
+    def _seal(self):
+        """Write the active rows as the next sorted chunk and start a new active file (writer thread)."""
+        import numpy as np
+
+        if not self._active_len:
+            return
+        # only the writer changes the active rows, so they are read without the lock
+        rows = self._active[:self._active_len]
+        rows = rows[np.lexsort((rows['ts'], rows['user_id']))]
+        final = self._name('chunk', self._seq)
+        tmp = final + '.tmp'
+        os.makedirs(tmp, exist_ok=True)
+        for name in COLUMNS:
+            with open(os.path.join(tmp, name + '.npy'), 'wb') as f:
+                np.save(f, np.ascontiguousarray(rows[name]))
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, final)
+        _fsync_dir(self.path)
+        self._file.close()
+        os.remove(self._name('active', self._seq) + '.bin')
+        next_file = open(self._name('active', self._seq + 1) + '.bin', 'ab')
+        # queries see the rows either in the active part or in the chunk, never in both
+        with self._lock:
+            self._chunks.append(_Chunk(final))
+            self._seq += 1
+            self._active_len = 0
+            self._file = next_file
+
+    def flush(self):
+        """Block until the rows recorded so far are written."""
+        self._writer.submit(self._write_pending).result()
+
+    def user_events(self, user_id: int):
+        """All events of one user, oldest first."""
+        import numpy as np
+
+        self._ensure_open()
+        with self._lock:
+            chunks = list(self._chunks)
+            active = self._active[:self._active_len]
+            active = active[active['user_id'] == user_id]
+            pending = np.array([r for r in self._pending if r[1] == user_id], dtype=event_dtype())
+        # chunks are sealed in time order and each is sorted by time within a user
+        return np.concatenate([chunk.rows(user_id) for chunk in chunks] + [active, pending])
+
+    def events_since(self, ts: float):
+        """Events of all users at or after `ts` (in no particular order)."""
+        import numpy as np
+
+        self._ensure_open()
+        with self._lock:
+            chunks = list(self._chunks)
+            active = self._active[:self._active_len]
+            parts = [active[active['ts'] >= ts], np.array([r for r in self._pending if r[0] >= ts], dtype=event_dtype())]
+        # chunks are sealed in time order: stop at the first one that ends before `ts`
+        for chunk in reversed(chunks):
+            times = chunk.column('ts')
+            keep = np.flatnonzero(times >= ts)
+            if not len(keep):
+                break
+            part = np.empty(len(keep), dtype=event_dtype())
+            for name in COLUMNS:
+                part[name] = chunk.column(name)[keep]
+            parts.append(part)
+        return np.concatenate(parts)
+
+    def __len__(self) -> int:
+        self._ensure_open()
+        with self._lock:
+            return sum(len(c.column('user_id')) for c in self._chunks) + self._active_len + len(self._pending)
+
+    def clear(self):
+        self.close()
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        self.open()
+
+    def close(self):
+        # queued rows go to the files this history has open (or opens now)
+        if self._pending:
+            self.flush()
+        else:
+            # wait for a write still in progress
+            self._writer.submit(int).result()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._chunks = []
+
+
+history = History()
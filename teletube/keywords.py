@@ -0,0 +1,124 @@
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# title quality words, folded into the same automaton as the keywords
+QUALITY_WORDS = ('новый', 'лучший', 'топ', 'обзор', 'туториал', 'гайд')
+QUALITY_BONUS = 3
+FRESH_WORDS = ('2024', '2025', 'новинка', 'эксклюзив')
+FRESH_BONUS = 2
+
+_QUALITY = 1
+_FRESH = 2
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher.
+
+    Built once from `(pattern, payload)` pairs; `matches(text)` returns the
+    payloads of all patterns occurring in `text` in one pass over the text,
+    independent of the number of patterns.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # patterns ending at a node, and the nearest proper suffix node that ends a pattern
+        self._out: List[List[object]] = [[]]
+        self._dict_link: List[int] = [-1]
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._dict_link.append(-1)
+                node = nxt
+            self._out[node].append(payload)
+        self._build_links()
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail = self._goto[f].get(ch, 0)
+                self._fail[child] = fail if fail != child else 0
+                self._dict_link[child] = fail if self._out[fail] else self._dict_link[fail]
+                queue.append(child)
+
+    def matches(self, text: str) -> List[object]:
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        seen = set()
+        found = []
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] else dict_link[node]
+            while hit > 0 and hit not in seen:
+                seen.add(hit)
+                found.extend(out[hit])
+                hit = dict_link[hit]
+        return found
+
+
+class TitleScorer:
+    """Keyword and title-quality scoring backed by one compiled automaton.
+
+    The automaton is rebuilt only when the keywords file's mtime or size
+    changes, so editing keywords.txt takes effect without a restart.
+    """
+
+    def __init__(self, filename: str, loader):
+        self.filename = filename
+        self._loader = loader
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._automaton: Optional[AhoCorasick] = None
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _compile(self, keywords: List[str]) -> AhoCorasick:
+        # payload: (keyword occurrences in the list, quality flags)
+        payloads: Dict[str, List[int]] = {}
+        for k in keywords:
+            payloads.setdefault(k, [0, 0])[0] += 1
+        for w in QUALITY_WORDS:
+            payloads.setdefault(w, [0, 0])[1] |= _QUALITY
+        for w in FRESH_WORDS:
+            payloads.setdefault(w, [0, 0])[1] |= _FRESH
+        return AhoCorasick((w, tuple(p)) for w, p in payloads.items())
+
+    def automaton(self) -> AhoCorasick:
+        stamp = self._file_stamp()
+        if self._automaton is None or stamp != self._stamp:
+            keywords = self._loader(self.filename)
+            # the loader may have just created the file
+            self._stamp = self._file_stamp()
+            self._automaton = self._compile(keywords)
+        return self._automaton
+
+    def score(self, title: str) -> Tuple[int, int]:
+        """(number of keyword hits, quality bonus) for an already lowercased title."""
+        hits = 0
+        flags = 0
+        for count, flag in self.automaton().matches(title):
+            hits += count
+            flags |= flag
+        quality = (QUALITY_BONUS if flags & _QUALITY else 0) + (FRESH_BONUS if flags & _FRESH else 0)
+        return hits, quality
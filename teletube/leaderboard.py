@@ -0,0 +1,79 @@
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class LeaderboardIndex:
+    """Users ordered by subscribers, kept up to date one user at a time.
+
+    Entries are `(-subscribers, user_id)` in a sorted list, so the top-N is a
+    slice and a rank is one binary search. `version` changes whenever the order
+    may have changed and can be used as a cache key.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = []
+        self._subs: Dict[int, int] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def rebuild(self, users: Iterable[Tuple[int, int]]):
+        self._subs = {uid: subs for uid, subs in users}
+        self._keys = sorted((-subs, uid) for uid, subs in self._subs.items())
+        self.version += 1
+
+    def clear(self):
+        self.rebuild(())
+
+    def update(self, user_id: int, subscribers: int):
+        old = self._subs.get(user_id)
+        if old == subscribers:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, user_id))]
+        self._subs[user_id] = subscribers
+        insort(self._keys, (-subscribers, user_id))
+        self.version += 1
+
+    def remove(self, user_id: int):
+        old = self._subs.pop(user_id, None)
+        if old is None:
+            return
+        del self._keys[bisect_left(self._keys, (-old, user_id))]
+        self.version += 1
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        return [(uid, -neg) for neg, uid in self._keys[:limit]]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank; users with equal subscribers share a rank."""
+        subs = self._subs.get(user_id)
+        if subs is None:
+            return None
+        return bisect_left(self._keys, (-subs,)) + 1
+
+    def summary(self, limit: int, ladder_size: int = 256) -> Dict[str, Any]:
+        """Compact picture of this index for merging with other shards.
+
+        `top` is exact; `ladder` holds the subscriber count at every `step`-th
+        rank, which is enough to estimate how many users are above any value.
+        """
+        step = max(1, -(-len(self._keys) // ladder_size))
+        return {'size': len(self._keys), 'top': self.top(limit), 'step': step,
+                'ladder': [-neg for neg, _ in self._keys[::step]]}
+
+
+def count_above(summary: Dict[str, Any], subscribers: int) -> int:
+    """Users in a summarized index with strictly more subscribers.
+
+    Exact within its top; below it the result is a lower bound that misses at
+    most `step - 1` users. A rank summed over the other shards can therefore be
+    off by up to (shards - 1) * (step - 1).
+    """
+    top = summary['top']
+    if not top or len(top) == summary['size'] or top[-1][1] <= subscribers:
+        return sum(1 for _, subs in top if subs > subscribers)
+    # ladder is descending: entries 0..k-1 are above, so between (k-1)*step+1 and k*step users are
+    k = bisect_left([-s for s in summary['ladder']], -subscribers)
+    return max(len(top), (k - 1) * summary['step'] + 1)
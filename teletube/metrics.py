@@ -0,0 +1,287 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+# seconds; Telegram API calls and handlers sit in the 10 ms - 1 s range, chart renders and big flushes above
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+# name of the handler running in the current task, for metrics recorded deeper down
+current_handler: ContextVar[str] = ContextVar("current_handler", default="background")
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def expose(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    """Counter that can go down; with `func` the value is read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), func: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.func = func
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.func is not None:
+            try:
+                return [f"{self.name} {self.func()}"]
+            except Exception as e:
+                logger.error("gauge %s failed: %s", self.name, e)
+                return []
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def mean(self, **labels) -> float:
+        series = self.series.get(self._key(labels))
+        return series[1] / series[2] if series and series[2] else 0.0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf past the last bucket)."""
+        series = self.series.get(self._key(labels))
+        if not series or not series[2]:
+            return 0.0
+        rank = q * series[2]
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), series[0]):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.series.items()):
+            seen = 0
+            for bound, n in zip(self.buckets, counts):
+                seen += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {seen}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = (), func=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, func))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def expose(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram("teletube_handler_seconds", "Handler latency.", ("handler",))
+HANDLER_ERRORS = registry.counter("teletube_handler_errors_total", "Handlers that raised.", ("handler",))
+HANDLER_IN_FLIGHT = registry.gauge("teletube_handler_in_flight", "Handlers currently running.", ("handler",))
+STORE_LOAD_SECONDS = registry.histogram("teletube_store_load_seconds", "Time to read and parse the database.")
+STORE_FLUSH_SECONDS = registry.histogram("teletube_store_flush_seconds", "Flush time by stage: prepare (serialize on the loop) and write (disk, in a thread).", ("stage",))
+STORE_FLUSHED_USERS = registry.counter("teletube_store_flushed_users_total", "Changed user records flushed to the database.")
+STORE_FLUSH_ERRORS = registry.counter("teletube_store_flush_errors_total", "Failed database flushes.")
+STORE_BYTES_WRITTEN = registry.counter("teletube_store_bytes_written_total", "Bytes the database backend wrote (JSON rewrites, journal appends and compactions, SQLite row data).")
+STORE_CHANGES = registry.counter("teletube_store_changes_total", "User records changed and queued for saving, by handler (background: scheduler, bulk jobs).", ("handler",))
+CHART_RENDER_SECONDS = registry.histogram("teletube_chart_render_seconds", "Chart render time (leaderboard and /mystats).")
+CHART_CACHE_HITS = registry.counter("teletube_chart_cache_hits_total", "Leaderboard charts served without rendering.")
+API_SECONDS = registry.histogram("teletube_telegram_api_seconds", "Bot API call latency.", ("method",))
+API_ERRORS = registry.counter("teletube_telegram_api_errors_total", "Failed Bot API calls.", ("method",))
+THROTTLED = registry.counter("teletube_throttled_total", "Commands refused by the per-user rate limit.", ("handler",))
+DUPLICATE_UPDATES = registry.counter("teletube_duplicate_updates_total", "Redelivered updates and repeated button taps dropped.")
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: latency, errors and in-flight count per handler function."""
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        HANDLER_IN_FLIGHT.inc(handler=name)
+        token = current_handler.set(name)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name)
+            HANDLER_IN_FLIGHT.dec(handler=name)
+            current_handler.reset(token)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: latency and errors per Bot API method."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        if name == "GetUpdates":
+            # long polling: the duration is the poll timeout, not API latency
+            return await make_request(bot, method)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.inc(method=name)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, method=name)
+
+
+def summary(top: int = 10) -> str:
+    """Short human-readable digest for /botstats."""
+    def ms(seconds: float) -> str:
+        return "∞" if seconds == float("inf") else f"{seconds * 1000:.0f}"
+
+    lines = []
+    handlers = sorted(HANDLER_SECONDS.series, key=lambda k: -HANDLER_SECONDS.series[k][2])[:top]
+    for (name,) in handlers:
+        errors = int(HANDLER_ERRORS.get(handler=name))
+        changes = int(STORE_CHANGES.get(handler=name))
+        lines.append(f"{name}: {HANDLER_SECONDS.count(handler=name)} выз., ср. {ms(HANDLER_SECONDS.mean(handler=name))} мс, "
+                     f"p99 ≤ {ms(HANDLER_SECONDS.quantile(0.99, handler=name))} мс, изменений БД {changes}"
+                     + (f", ошибок {errors}" if errors else ""))
+    api_calls = sum(s[2] for s in API_SECONDS.series.values())
+    api_time = sum(s[1] for s in API_SECONDS.series.values())
+    api_errors = int(sum(API_ERRORS.values.values()))
+    if api_calls:
+        lines.append(f"Telegram API: {api_calls} выз., ср. {ms(api_time / api_calls)} мс, ошибок {api_errors}")
+    for stage in ("prepare", "write"):
+        if STORE_FLUSH_SECONDS.count(stage=stage):
+            lines.append(f"Сохранение БД ({stage}): {STORE_FLUSH_SECONDS.count(stage=stage)} раз, ср. {ms(STORE_FLUSH_SECONDS.mean(stage=stage))} мс")
+    if STORE_BYTES_WRITTEN.get():
+        lines.append(f"Записано в БД: {STORE_BYTES_WRITTEN.get() / 2 ** 20:.1f} МиБ")
+    if STORE_LOAD_SECONDS.count():
+        lines.append(f"Загрузка БД: {ms(STORE_LOAD_SECONDS.mean())} мс")
+    if CHART_RENDER_SECONDS.count() or CHART_CACHE_HITS.get():
+        lines.append(f"Графики: {CHART_RENDER_SECONDS.count()} отрисовок, ср. {ms(CHART_RENDER_SECONDS.mean())} мс, "
+                     f"из кеша {int(CHART_CACHE_HITS.get())}")
+    throttled = int(sum(THROTTLED.values.values()))
+    if throttled or DUPLICATE_UPDATES.get():
+        lines.append(f"Антиспам: отклонено {throttled}, дублей {int(DUPLICATE_UPDATES.get())}")
+    return "\n".join(lines)
+
+
+async def serve(host: str, port: int):
+    """Start a standalone /metrics endpoint; returns the aiohttp runner to clean up on shutdown."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.expose(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("metrics endpoint on %s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,116 @@
+"""User records and their storage codec.
+
+In memory a user is a `UserRecord`: a slotted object, so a million users do not
+carry a million copies of the same key strings in per-record dicts. On disk a
+record is a positional list `[schema_version, *values]` in `FIELDS` order
+(see `encode`/`decode`); older layouts are upgraded by `MIGRATIONS` on load.
+
+Adding a field: append it to `FIELDS`, `UserRecord.__init__` and `__slots__`,
+bump `SCHEMA_VERSION` and add a migration that inserts its default after the
+last value (a trailing dict, if any, is `UserRecord.extra`).
+"""
+import copy
+from datetime import datetime
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .achievements import mask_from_ids
+
+SCHEMA_VERSION = 2
+
+# storage order of the values; never reorder, only append
+FIELDS: Tuple[str, ...] = (
+    'username', 'subscribers', 'last_used_timestamp', 'video_count', 'active_event', 'currency',
+    'achievements_mask', 'last_daily_bonus_date', 'daily_bonus_streak', 'total_subs_from_videos',
+    'cooldown_notification_task', 'created_at', 'days_active', 'last_active_date', 'best_video_views',
+)
+
+
+class UserRecord:
+    # `extra` keeps keys of legacy records that have no field, so they survive a rewrite
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, username: Optional[str] = None, subscribers: int = 0, last_used_timestamp: float = 0.0,
+                 video_count: int = 0, active_event: Optional[Dict[str, Any]] = None, currency: int = 0,
+                 achievements_mask: int = 0, last_daily_bonus_date: Optional[str] = None,
+                 daily_bonus_streak: int = 0, total_subs_from_videos: int = 0,
+                 cooldown_notification_task: Optional[Dict[str, Any]] = None, created_at: Optional[float] = None,
+                 days_active: int = 0, last_active_date: Optional[str] = None, best_video_views: int = 0):
+        self.username = username
+        self.subscribers = subscribers
+        self.last_used_timestamp = last_used_timestamp
+        self.video_count = video_count
+        self.active_event = active_event
+        self.currency = currency
+        self.achievements_mask = achievements_mask
+        self.last_daily_bonus_date = last_daily_bonus_date
+        self.daily_bonus_streak = daily_bonus_streak
+        self.total_subs_from_videos = total_subs_from_videos
+        self.cooldown_notification_task = cooldown_notification_task
+        self.created_at = datetime.now().timestamp() if created_at is None else created_at
+        self.days_active = days_active
+        self.last_active_date = last_active_date
+        self.best_video_views = best_video_views
+        self.extra: Optional[Dict[str, Any]] = None
+
+    def __repr__(self) -> str:
+        return f"UserRecord(username={self.username!r}, subscribers={self.subscribers}, video_count={self.video_count})"
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, UserRecord):
+            return NotImplemented
+        return self.snapshot() == other.snapshot()
+
+    def snapshot(self) -> tuple:
+        """All values (nested dicts copied), for `restore()` and change detection."""
+        return tuple(copy.deepcopy(v) if isinstance(v, (dict, list)) else v
+                     for v in (getattr(self, name) for name in self.__slots__))
+
+    def restore(self, snapshot: tuple):
+        for name, value in zip(self.__slots__, snapshot):
+            setattr(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The pre-schema dict layout, e.g. for exports."""
+        out = dict(self.extra) if self.extra else {}
+        out.update((name, getattr(self, name)) for name in FIELDS)
+        return out
+
+
+def _migrate_v1(raw: Dict[str, Any]) -> List[Any]:
+    # v1: one free-form dict per user; achievements used to be a list of ids
+    raw = dict(raw)
+    if 'achievements_unlocked' in raw:
+        raw['achievements_mask'] = raw.get('achievements_mask', 0) | mask_from_ids(raw.pop('achievements_unlocked') or [])
+    defaults = UserRecord()
+    values = [raw.pop(name, getattr(defaults, name)) for name in FIELDS]
+    return [2, *values, raw] if raw else [2, *values]
+
+
+# version -> upgrade of a stored record to the next version
+MIGRATIONS: Dict[int, Callable[[Any], List[Any]]] = {
+    1: _migrate_v1,
+}
+
+
+_values = attrgetter(*FIELDS)
+
+
+def encode(record: UserRecord) -> List[Any]:
+    values = [SCHEMA_VERSION, *_values(record)]
+    if record.extra:
+        values.append(record.extra)
+    return values
+
+
+def decode(raw: Any) -> UserRecord:
+    version = 1 if isinstance(raw, dict) else raw[0]
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"user record has schema {version}, this version of the bot reads up to {SCHEMA_VERSION}")
+    while version < SCHEMA_VERSION:
+        raw = MIGRATIONS[version](raw)
+        version = raw[0]
+    record = UserRecord(*raw[1:len(FIELDS) + 1])
+    if len(raw) > len(FIELDS) + 1:
+        record.extra = raw[len(FIELDS) + 1]
+    return record
@@ -0,0 +1,278 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage, TelegramMethod
+
+from .config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST,
+    OUTBOX_MAX_RETRIES, OUTBOX_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# lower value is sent first
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFY = 1
+PRIORITY_REMINDER = 2
+
+# Telegram counts UTF-16 code units: an emoji outside the BMP is two
+_MAX_MESSAGE_LENGTH = 4096
+_MAX_CHAT_BUCKETS = 50000
+
+
+def _message_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = 0.0
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available (0 if it is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class _Outgoing:
+    def __init__(self, method: TelegramMethod, priority: int, coalesce: bool, future: asyncio.Future):
+        self.method = method
+        self.priority = priority
+        self.coalesce = coalesce and isinstance(method, SendMessage)
+        self.chat_id = getattr(method, 'chat_id', None)
+        self.futures = [future]
+        self.attempts = 0
+
+
+class Outbox:
+    """Central dispatcher for outgoing Bot API calls.
+
+    Calls are queued by priority (command replies before achievement notices
+    before cooldown reminders) and released under a global and a per-chat token
+    bucket. A flood-wait (`TelegramRetryAfter`) blocks that chat for the
+    requested time and requeues the call. Queued `SendMessage`s marked
+    `coalesce` for the same chat are merged into one message when the first of
+    them is released.
+    """
+
+    def __init__(self, global_rate: float = OUTBOX_GLOBAL_RATE, chat_rate: float = OUTBOX_CHAT_RATE,
+                 chat_burst: int = OUTBOX_CHAT_BURST, max_retries: int = OUTBOX_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._seq = itertools.count()
+        self._ready: List[Tuple[int, int, _Outgoing]] = []
+        self._delayed: List[Tuple[float, int, _Outgoing]] = []
+        self._coalescable: Dict[Any, int] = {}
+        self._inflight: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._ready) + len(self._delayed)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > _MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _enqueue(self, item: _Outgoing):
+        self._ensure_started()
+        heapq.heappush(self._ready, (item.priority, next(self._seq), item))
+        if item.coalesce:
+            self._coalescable[item.chat_id] = self._coalescable.get(item.chat_id, 0) + 1
+        self._wakeup.set()
+
+    def post(self, method: TelegramMethod, priority: int = PRIORITY_NOTIFY, coalesce: bool = False) -> asyncio.Future:
+        """Queue `method` without waiting for it; failures are logged."""
+        fut = asyncio.get_running_loop().create_future()
+        fut.add_done_callback(_log_failure)
+        self._enqueue(_Outgoing(method, priority, coalesce, fut))
+        return fut
+
+    async def send(self, method: TelegramMethod, priority: int = PRIORITY_REPLY, coalesce: bool = False):
+        """Queue `method` and wait for its result (or its error)."""
+        fut = asyncio.get_running_loop().create_future()
+        self._enqueue(_Outgoing(method, priority, coalesce, fut))
+        return await fut
+
+    def _take_coalescable(self, item: _Outgoing) -> List[_Outgoing]:
+        if self._coalescable.get(item.chat_id, 0) <= 0:
+            return []
+        taken = []
+
+        def matches(other: _Outgoing) -> bool:
+            return (other.coalesce and other.chat_id == item.chat_id
+                    and other.method.parse_mode == item.method.parse_mode
+                    and other.method.reply_markup is None)
+
+        for name in ('_ready', '_delayed'):
+            heap = getattr(self, name)
+            keep = []
+            for entry in heap:
+                (taken if matches(entry[2]) else keep).append(entry)
+            if len(keep) != len(heap):
+                heapq.heapify(keep)
+                setattr(self, name, keep)
+        return [entry[2] for entry in sorted(taken, key=lambda e: (e[2].priority, e[1]))]
+
+    def _coalesce(self, item: _Outgoing) -> _Outgoing:
+        item.coalesce = False
+        self._coalescable[item.chat_id] -= 1
+        extra = self._take_coalescable(item)
+        if not extra:
+            return item
+        text = item.method.text
+        length = _message_length(text)
+        leftover = []
+        for other in extra:
+            self._coalescable[item.chat_id] -= 1
+            other_length = _message_length(other.method.text)
+            if length + 1 + other_length > _MAX_MESSAGE_LENGTH:
+                leftover.append(other)
+                continue
+            text += "\n" + other.method.text
+            length += 1 + other_length
+            item.futures.extend(other.futures)
+        if self._coalescable[item.chat_id] <= 0:
+            self._coalescable.pop(item.chat_id, None)
+        for other in leftover:
+            self._enqueue(other)
+        item.method = item.method.model_copy(update={'text': text}).as_(item.method.bot)
+        return item
+
+    async def _deliver(self, item: _Outgoing):
+        try:
+            result = await item.method
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            if item.attempts > self.max_retries:
+                _fail(item, e)
+                return
+            loop = asyncio.get_running_loop()
+            self._chat_bucket(item.chat_id).blocked_until = loop.time() + e.retry_after
+            logger.warning("flood wait %ss for chat %s, retry %d", e.retry_after, item.chat_id, item.attempts)
+            heapq.heappush(self._delayed, (loop.time() + e.retry_after, next(self._seq), item))
+            self._wakeup.set()
+        except Exception as e:
+            _fail(item, e)
+        else:
+            for fut in item.futures:
+                if not fut.done():
+                    fut.set_result(result)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, item = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (item.priority, seq, item))
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            priority, seq, item = self._ready[0]
+            chat = self._chat_bucket(item.chat_id)
+            wait = chat.delay(now)
+            if wait > 0:
+                heapq.heappop(self._ready)
+                heapq.heappush(self._delayed, (now + wait, seq, item))
+                continue
+            wait = self._global.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._ready)
+            chat.consume()
+            self._global.consume()
+            if item.coalesce:
+                item = self._coalesce(item)
+            task = asyncio.create_task(self._deliver(item))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def start(self):
+        self._ensure_started()
+
+    async def close(self, timeout: float = OUTBOX_DRAIN_TIMEOUT):
+        if self._task is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (len(self) or self._inflight) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
+        for heap in (self._ready, self._delayed):
+            for entry in heap:
+                for fut in entry[2].futures:
+                    fut.cancel()
+            heap.clear()
+        self._coalescable.clear()
+
+
+def _fail(item: _Outgoing, exc: BaseException):
+    for fut in item.futures:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+def _log_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.error("outgoing message error: %s", fut.exception())
+
+
+outbox = Outbox()
+
+
+async def answer(message, text: str, coalesce: bool = False, **kwargs):
+    return await outbox.send(message.answer(text, **kwargs), coalesce=coalesce)
+
+
+async def answer_photo(message, photo, **kwargs):
+    return await outbox.send(message.answer_photo(photo=photo, **kwargs))
+
+
+async def answer_document(message, document, **kwargs):
+    return await outbox.send(message.answer_document(document=document, **kwargs))
+
+
+async def edit_text(message, text: str, **kwargs):
+    return await outbox.send(message.edit_text(text, **kwargs))
@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.methods import SendMessage
+
+from .config import COOLDOWN_HOURS, COOLDOWN_NOTIFY_BATCH
+from .db import store
+from .outbox import outbox, PRIORITY_REMINDER
+
+logger = logging.getLogger(__name__)
+
+
+class CooldownScheduler:
+    """Single task that delivers every pending "cooldown is over" reminder.
+
+    Reminders live in a min-heap of `(ends_at, user_id)`; `_pending` holds the
+    current reminder per user, so rescheduling or cancelling just replaces the
+    dict entry and outdated heap entries are skipped when they surface. The
+    user record keeps `cooldown_notification_task = {'ends_at', 'chat_id'}`, and
+    `start()` rebuilds the heap from it, so reminders survive restarts.
+    """
+
+    def __init__(self, batch_size: int = COOLDOWN_NOTIFY_BATCH):
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, int]] = []
+        self._pending: Dict[int, Tuple[float, int]] = {}
+        self._bot = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _push(self, user_id: int, chat_id: int, ends_at: float):
+        self._pending[user_id] = (ends_at, chat_id)
+        heapq.heappush(self._heap, (ends_at, user_id))
+        # drop outdated entries once they dominate the heap
+        if len(self._heap) > 2 * len(self._pending) + 1024:
+            self._heap = [(when, uid) for uid, (when, _) in self._pending.items()]
+            heapq.heapify(self._heap)
+        if self._wakeup is not None and self._heap[0] == (ends_at, user_id):
+            self._wakeup.set()
+
+    def schedule(self, user_id: int, chat_id: int, ends_at: float):
+        self._push(user_id, chat_id, ends_at)
+        u = store.peek(user_id)
+        task = reminder_task(chat_id, ends_at)
+        # /addvideo records the task in its transaction and schedules after the commit: saved once
+        if u is not None and u.cooldown_notification_task != task:
+            u.cooldown_notification_task = task
+            if not store.in_transaction(user_id):
+                store.mark_dirty(user_id)
+
+    def cancel(self, user_id: int):
+        self._pending.pop(user_id, None)
+        u = store.peek(user_id)
+        if u is not None and u.cooldown_notification_task is not None:
+            u.cooldown_notification_task = None
+            if not store.in_transaction(user_id):
+                store.mark_dirty(user_id)
+
+    def rehydrate(self):
+        self._heap = []
+        self._pending = {}
+        for uid, ud in store.users():
+            task = ud.cooldown_notification_task
+            if task and task.get('ends_at'):
+                # records written before chat_id was stored: private chat id == user id
+                self._push(uid, task.get('chat_id', uid), task['ends_at'])
+
+    def _pop_due(self, now: float) -> List[Tuple[int, int, float]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            when, uid = heapq.heappop(self._heap)
+            current = self._pending.get(uid)
+            if current is None or current[0] != when:
+                continue
+            del self._pending[uid]
+            due.append((uid, current[1], when))
+        return due
+
+    async def _notify(self, user_id: int, chat_id: int, ends_at: float):
+        try:
+            async with store.user(user_id) as u:
+                if not u:
+                    return
+                task = u.cooldown_notification_task
+                if not task or task.get('ends_at') != ends_at:
+                    return
+                u.cooldown_notification_task = None
+                if datetime.now().timestamp() < u.last_used_timestamp + COOLDOWN_HOURS * 3600:
+                    return
+            await outbox.send(SendMessage(chat_id=chat_id, text=f"⏰ Ваш кулдаун завершён! Можете добавить новое видео: /addvideo").as_(self._bot),
+                              priority=PRIORITY_REMINDER, coalesce=True)
+        except Exception as e:
+            logger.error("cooldown notification error: %s", e)
+
+    async def _run(self):
+        while True:
+            now = datetime.now().timestamp()
+            due = self._pop_due(now)
+            if due:
+                await asyncio.gather(*(self._notify(uid, chat_id, when) for uid, chat_id, when in due))
+                continue
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot):
+        self._bot = bot
+        if self._task is None:
+            self.rehydrate()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+
+scheduler = CooldownScheduler()
+
+
+def reminder_task(chat_id: int, ends_at: float) -> Dict[str, float]:
+    """The `cooldown_notification_task` of a user with a reminder pending."""
+    return {'ends_at': ends_at, 'chat_id': chat_id}
+
+
+def schedule_cooldown_notification(user_id: int, chat_id: int, cooldown_end_time: datetime):
+    scheduler.schedule(user_id, chat_id, cooldown_end_time.timestamp())
+
+
+def cancel_cooldown_notification(user_id: int):
+    scheduler.cancel(user_id)
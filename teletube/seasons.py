@@ -0,0 +1,216 @@
+"""Daily, weekly and season leaderboards.
+
+Each window keeps only the users that published videos in it: their summed
+subscriber deltas and a `LeaderboardIndex` over those sums, so a top-N is a
+slice no matter how many users the bot has. Windows are numbered by day
+(`date.toordinal()`); when the number changes the window is replaced by an
+empty one, which costs as much as the users it held. A finished season's top
+`SEASON_ARCHIVE_TOP` is first appended to `seasons.jsonl` in `HISTORY_DIR`
+(a season nobody played is archived too, with no players, so it is never
+replayed again).
+
+Nothing else is stored: `start()` replays the current windows (and a previous
+season missing from the archive) from the event history in a worker thread.
+In cluster mode every shard archives its own players; the shards' last
+seasons are merged through their summaries like the live windows.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import SEASON_DAYS, SEASON_ARCHIVE_TOP
+from .db import store
+from .history import History, history, VIDEO
+from .leaderboard import LeaderboardIndex
+
+logger = logging.getLogger(__name__)
+
+# (user_id, username, score), best first
+Standings = List[Tuple[int, Optional[str], int]]
+
+
+def _day_start(day: int) -> float:
+    return datetime.combine(date.fromordinal(day), time()).timestamp()
+
+
+class Window:
+    def __init__(self, name: str, days: int):
+        self.name = name
+        self.days = days
+        self.id: Optional[int] = None
+        self.scores: Dict[int, int] = {}
+        self.index = LeaderboardIndex()
+
+    def id_of(self, day: int) -> int:
+        # ordinal 1 is a Monday, so weeks (and seasons of whole weeks) start on Mondays
+        return (day - 1) // self.days
+
+    def first_day(self, window_id: int) -> int:
+        return window_id * self.days + 1
+
+    def reset(self, window_id: int):
+        self.id = window_id
+        self.scores = {}
+        self.index = LeaderboardIndex()
+
+    def add(self, user_id: int, delta: int):
+        score = self.scores.get(user_id, 0) + delta
+        self.scores[user_id] = score
+        self.index.update(user_id, score)
+
+
+class Seasons:
+    def __init__(self, events: History = history, season_days: int = SEASON_DAYS,
+                 archive_top: int = SEASON_ARCHIVE_TOP):
+        self.history = events
+        self.archive_top = archive_top
+        self.windows = {'day': Window('day', 1), 'week': Window('week', 7), 'season': Window('season', season_days)}
+        # this shard's archive, oldest first
+        self._archived: List[Dict[str, Any]] = []
+        self._loaded = False
+
+    @property
+    def archive_path(self) -> str:
+        return os.path.join(self.history.path, 'seasons.jsonl')
+
+    def load(self):
+        """Replay the current windows from the history and archive a season that ended while stopped."""
+        today = date.today().toordinal()
+        season = self.windows['season']
+        current = season.id_of(today)
+        self._archived = self._read_archive()
+        missing = self._archived[-1]['season'] < current - 1 if self._archived else True
+        replay_from = season.first_day(current - 1 if missing else current)
+        for w in self.windows.values():
+            replay_from = min(replay_from, w.first_day(w.id_of(today)))
+            w.reset(w.id_of(today))
+        events = self.history.events_since(_day_start(replay_from))
+        events = events[(events['kind'] == VIDEO) & (events['subs_delta'] != 0)]
+        previous = Window('season', season.days)
+        previous.reset(current - 1)
+        for ts, user_id, delta in zip(events['ts'].tolist(), events['user_id'].tolist(), events['subs_delta'].tolist()):
+            day = date.fromtimestamp(ts).toordinal()
+            for w in self.windows.values():
+                if w.id_of(day) == w.id:
+                    w.add(user_id, delta)
+            if missing and previous.id_of(day) == previous.id:
+                previous.add(user_id, delta)
+        if missing:
+            self._archive(previous)
+        self._loaded = True
+
+    async def start(self):
+        """Load the windows before the bot takes updates, without blocking the event loop."""
+        if not self._loaded:
+            await asyncio.get_running_loop().run_in_executor(None, self.load)
+
+    def _ensure_loaded(self):
+        # for callers that never ran start(), such as scripts and tests
+        if not self._loaded:
+            self.load()
+
+    def rotate(self):
+        """Start new windows after a day/week/season boundary; a finished season is archived first."""
+        self._ensure_loaded()
+        today = date.today().toordinal()
+        for w in self.windows.values():
+            window_id = w.id_of(today)
+            if w.id != window_id:
+                if w.name == 'season' and w.id is not None:
+                    self._archive(w)
+                w.reset(window_id)
+
+    def add(self, user_id: int, delta: int):
+        """Subscribers a user gained (or lost) with a video."""
+        if not delta:
+            return
+        self.rotate()
+        for w in self.windows.values():
+            w.add(user_id, delta)
+
+    def _name(self, user_id: int) -> Optional[str]:
+        ud = store.peek(user_id)
+        return ud.username if ud is not None else None
+
+    def _archive(self, w: Window):
+        entry = {
+            'season': w.id, 'start': date.fromordinal(w.first_day(w.id)).isoformat(),
+            'end': date.fromordinal(w.first_day(w.id + 1) - 1).isoformat(), 'players': len(w.scores),
+            'top': [[uid, self._name(uid), score] for uid, score in w.index.top(self.archive_top)],
+        }
+        os.makedirs(os.path.dirname(self.archive_path) or '.', exist_ok=True)
+        with open(self.archive_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._archived.append(entry)
+        logger.info("season %d archived: %d players", w.id, len(w.scores))
+
+    def _read_archive(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.archive_path):
+            return []
+        with open(self.archive_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _last_played(self, limit: int) -> List[Dict[str, Any]]:
+        return [e for e in self._archived if e['players']][-limit:]
+
+    def archive(self, limit: int) -> List[Dict[str, Any]]:
+        """The last `limit` finished seasons anybody played, newest first.
+
+        In cluster mode the other shards' last played seasons are merged in:
+        players are summed and the tops interleaved.
+        """
+        self._ensure_loaded()
+        merged: Dict[int, Dict[str, Any]] = {}
+        peers = [p['archive'] for p in store.peers.values() if p.get('archive')]
+        for e in self._last_played(limit) + peers:
+            m = merged.get(e['season'])
+            if m is None:
+                merged[e['season']] = dict(e, top=list(e['top']))
+            else:
+                m['players'] += e['players']
+                m['top'].extend(e['top'])
+        for m in merged.values():
+            m['top'].sort(key=lambda e: (-e[2], e[0]))
+            del m['top'][self.archive_top:]
+        return sorted(merged.values(), key=lambda e: -e['season'])[:limit]
+
+    def top(self, name: str, limit: int) -> Standings:
+        """Top of a window, merged with the other shards' summaries in cluster mode."""
+        self.rotate()
+        w = self.windows[name]
+        top = [(uid, self._name(uid), score) for uid, score in w.index.top(limit)]
+        for p in store.peers.values():
+            window_id, entries = p.get('windows', {}).get(name, (None, []))
+            if window_id == w.id:
+                top.extend(tuple(e) for e in entries)
+        top.sort(key=lambda e: (-e[2], e[0]))
+        return top[:limit]
+
+    def days_left(self, name: str) -> int:
+        self.rotate()
+        w = self.windows[name]
+        return w.first_day(w.id + 1) - date.today().toordinal()
+
+    def summary(self, limit: int) -> Dict[str, Any]:
+        """Window tops and the last played season of this shard, for the others to merge."""
+        self.rotate()
+        last = self._last_played(1)
+        return {
+            'windows': {name: (w.id, [(uid, self._name(uid), score) for uid, score in w.index.top(limit)])
+                        for name, w in self.windows.items()},
+            'archive': dict(last[0], top=last[0]['top'][:limit]) if last else None,
+        }
+
+    def clear(self):
+        # the history (and the archive in it) was cleared: the windows start empty
+        today = date.today().toordinal()
+        for w in self.windows.values():
+            w.reset(w.id_of(today))
+        self._archived = []
+        self._loaded = True
+
+
+seasons = Seasons()
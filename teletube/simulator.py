@@ -0,0 +1,221 @@
+"""Offline game-economy simulator.
+
+Plays the game for many players at once with NumPy arrays instead of bots and
+handlers, so the effect of POPULARITY_RANDOM_MIN/MAX, KEYWORD_BONUS_POINTS, the
+event table or the daily streak multiplier can be seen before changing them:
+
+    python -m teletube simulate --players 1000000 --days 90
+
+The rules are not re-typed here. Scalar functions over a small discrete domain
+(`popularity_volatility`, `daily_bonus_amount`, `title_score`) are tabulated by
+calling the real ones, the events come from `RANDOM_EVENTS` and the
+achievements from `achievements_definition`; only the arithmetic that
+combines them per video mirrors `evaluate_video_popularity` and `cmd_addvideo`.
+
+Model: everybody signs up on day 0; each player has a fixed daily activity
+probability (Beta-distributed around `active`). An active day claims /daily
+and publishes a video in each cooldown slot with probability `post_rate`.
+Shop purchases and cooldown reductions are not modelled (the latter is counted).
+"""
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .achievements import achievements_definition, ACHIEVEMENT_BITS
+from .config import (
+    COOLDOWN_HOURS, POPULARITY_RANDOM_MIN, POPULARITY_RANDOM_MAX, POPULARITY_THRESHOLD_BONUS,
+    VIEWS_PER_POPULARITY_POINT
+)
+from .utils import (
+    title_score, popularity_volatility, daily_bonus_amount, load_keywords,
+    RANDOM_EVENTS, POPULARITY_FLOOR, POPULARITY_CEIL, VIDEO_BONUS_SUBS_RANGE
+)
+
+_VOLATILITY_CAP = 200  # popularity_volatility is constant above this many subscribers
+
+# condition key -> name of the per-player array holding that metric
+_METRIC_ARRAYS = {
+    "condition_videos": "videos",
+    "condition_subs": "subs",
+    "condition_days_since_signup": None,  # everybody signs up on day 0: it is the current day
+    "condition_days_active": "days_active",
+    "condition_video_views": "best_views",
+}
+
+
+def default_titles() -> List[str]:
+    """Title pool: every keyword alone, dressed up with quality words, and a few plain titles."""
+    keywords = load_keywords()
+    titles = ["мой влог", "видео дня", "просто видео", "что я сегодня ел"]
+    for kw in keywords:
+        titles.append(kw)
+        titles.append(f"лучший обзор: {kw} 2025")
+    return titles
+
+
+def volatility_table() -> np.ndarray:
+    return np.array([popularity_volatility(s) for s in range(_VOLATILITY_CAP + 1)])
+
+
+def vector_popularity(rng: np.random.Generator, base: np.ndarray, subs: np.ndarray,
+                      volatility: np.ndarray) -> np.ndarray:
+    """`evaluate_video_popularity` for many videos; `base` is title_score() plus the event modifier."""
+    raw = base + rng.integers(POPULARITY_RANDOM_MIN, POPULARITY_RANDOM_MAX + 1, len(base), dtype=np.int32)
+    # np.rint rounds half to even, like round()
+    adjusted = np.rint(raw * volatility[np.minimum(subs, _VOLATILITY_CAP)]).astype(np.int32)
+    return np.clip(adjusted, POPULARITY_FLOOR, POPULARITY_CEIL)
+
+
+class Simulation:
+    def __init__(self, players: int, seed: Optional[int] = None, titles: Optional[Sequence[str]] = None,
+                 active: float = 0.5, post_rate: float = 0.8):
+        self.n = players
+        self.rng = np.random.default_rng(seed)
+        self.post_rate = post_rate
+        self.slots = max(1, int(24 // COOLDOWN_HOURS)) if COOLDOWN_HOURS > 0 else 24
+        self.day = 0
+
+        titles = list(titles) if titles else default_titles()
+        self.title_scores = np.array([title_score(t) for t in titles], dtype=np.int64)
+        self.volatility = volatility_table()
+        self.bonus_table = np.array([0.0])
+
+        # per-player propensity to play on a given day, mean `active`
+        active = min(max(active, 0.01), 0.99)
+        self.activity = self.rng.beta(2.0, 2.0 * (1 - active) / active, players)
+        self.subs = np.zeros(players, dtype=np.int32)
+        self.currency = np.zeros(players)  # float: the streak bonus grows geometrically
+        self.videos = np.zeros(players, dtype=np.int32)
+        self.best_views = np.zeros(players, dtype=np.int64)
+        self.days_active = np.zeros(players, dtype=np.int32)
+        self.streak = np.zeros(players, dtype=np.int32)
+        self.last_claim = np.full(players, -2, dtype=np.int32)
+        self.pending_modifier = np.zeros(players, dtype=np.int32)
+        self.achievements = np.zeros(players, dtype=np.int64)
+        self.event_counts: Dict[str, int] = {ev["message"]: 0 for ev in RANDOM_EVENTS}
+
+        self._rules = {}
+        self._reached = {}
+        for cond in _METRIC_ARRAYS:
+            rules = sorted((adef[cond], ACHIEVEMENT_BITS[aid], adef.get("reward_coins", 0))
+                           for aid, adef in achievements_definition.items() if cond in adef)
+            if not rules:
+                continue
+            masks, rewards = [0], [0]
+            for _, bit, reward in rules:
+                masks.append(masks[-1] | 1 << bit)
+                rewards.append(rewards[-1] + reward)
+            self._rules[cond] = (np.array([t for t, _, _ in rules]), np.array(masks, dtype=np.int64), np.array(rewards))
+            self._reached[cond] = np.zeros(players, dtype=np.int8)
+
+    def _daily_bonus(self, streak: np.ndarray) -> np.ndarray:
+        longest = int(streak.max()) if streak.size else 0
+        if longest >= len(self.bonus_table):
+            # extend the table with the real function, one entry per streak length
+            self.bonus_table = np.array([0.0] + [float(daily_bonus_amount(s)) for s in range(1, longest + 1)])
+        return self.bonus_table[streak]
+
+    def _publish(self, idx: np.ndarray):
+        # `idx`: the players publishing now; everything is computed for them only
+        rng = self.rng
+        n = len(idx)
+        subs = self.subs[idx]
+        base = self.title_scores[rng.integers(0, len(self.title_scores), n)] + self.pending_modifier[idx]
+        pop = vector_popularity(rng, base, subs, self.volatility)
+
+        views = np.maximum(0, pop).astype(np.int64) * (subs + 50) * VIEWS_PER_POPULARITY_POINT
+        lucky = pop > POPULARITY_THRESHOLD_BONUS
+        pop[lucky] += rng.integers(VIDEO_BONUS_SUBS_RANGE[0], VIDEO_BONUS_SUBS_RANGE[1] + 1, int(lucky.sum()), dtype=np.int32)
+        subs = np.maximum(0, subs + pop)
+        self.subs[idx] = subs
+        self.videos[idx] += 1
+        self.best_views[idx] = np.maximum(self.best_views[idx], views)
+        self.pending_modifier[idx] = 0
+
+        r = rng.random(n)
+        for ev in RANDOM_EVENTS:
+            start, end = ev["band"]
+            hit = idx[(r >= start) & (r < end) & (subs >= ev["min_subs"])]
+            if not len(hit):
+                continue
+            self.event_counts[ev["message"]] += len(hit)
+            low, high = ev["range"]
+            value = rng.integers(low, high + 1, len(hit), dtype=np.int32)
+            if ev["type"] == "event_modifier":
+                self.pending_modifier[hit] = value
+            elif ev["type"] == "currency_bonus":
+                self.currency[hit] += value
+
+    def _grant_achievements(self, idx: np.ndarray):
+        # Same layout as AchievementIndex: per metric the sorted thresholds, the
+        # mask and the total reward of the k lowest. Achievements are never taken
+        # back, so each player keeps the highest k reached per metric. Like the
+        # bot, only players who did something (`idx`) are checked.
+        for cond, (thresholds, masks, rewards) in self._rules.items():
+            array = _METRIC_ARRAYS[cond]
+            value = self.day if array is None else getattr(self, array)[idx]
+            reached = np.broadcast_to(np.searchsorted(thresholds, value, side="right"), idx.shape)
+            best = self._reached[cond]
+            up = reached > best[idx]
+            players, reached = idx[up], reached[up]
+            if not len(players):
+                continue
+            self.currency[players] += rewards[reached] - rewards[best[players]]
+            best[players] = reached
+            self.achievements[players] |= masks[reached]
+
+    def step_day(self):
+        active = np.flatnonzero(self.rng.random(self.n) < self.activity)
+        self.days_active[active] += 1
+        streak = np.where(self.last_claim[active] == self.day - 1, self.streak[active] + 1, 1)
+        self.streak[active] = streak
+        self.last_claim[active] = self.day
+        self.currency[active] += self._daily_bonus(streak)
+        for _ in range(self.slots):
+            self._publish(active[self.rng.random(len(active)) < self.post_rate])
+        self.day += 1
+        self._grant_achievements(active)
+
+    def run(self, days: int) -> "Simulation":
+        for _ in range(days):
+            self.step_day()
+        return self
+
+    def report(self) -> Dict[str, Any]:
+        q = (50, 90, 99, 99.9, 100)
+        unlocked = {achievements_definition[aid]["name"]: float(((self.achievements >> bit) & 1).mean())
+                    for aid, bit in ACHIEVEMENT_BITS.items()}
+        return {
+            "players": self.n,
+            "days": self.day,
+            "subscribers": dict(zip(q, np.percentile(self.subs, q).tolist()), mean=float(self.subs.mean())),
+            "currency": dict(zip(q, np.percentile(self.currency, q).tolist()), mean=float(self.currency.mean())),
+            "videos_mean": float(self.videos.mean()),
+            "achievements": unlocked,
+            "events": dict(self.event_counts),
+        }
+
+
+def simulate(players: int, days: int, seed: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result = Simulation(players, seed=seed, **kwargs).run(days).report()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    def row(title, dist):
+        cells = "  ".join(f"p{k}={v:,.0f}" for k, v in dist.items() if k != "mean")
+        return f"{title:<12} mean={dist['mean']:,.1f}  {cells}"
+
+    lines = [f"{result['players']:,} players x {result['days']} days in {result.get('seconds', 0):.1f} s",
+             row("subscribers", result["subscribers"]),
+             row("currency", result["currency"]),
+             f"{'videos':<12} mean={result['videos_mean']:.1f}",
+             "", "achievement unlock rate:"]
+    lines += [f"  {rate * 100:6.2f}%  {name}" for name, rate in result["achievements"].items()]
+    total_videos = result["videos_mean"] * result["players"] or 1
+    lines += ["", "events per 100 videos:"]
+    lines += [f"  {count / total_videos * 100:6.2f}  {message}" for message, count in result["events"].items()]
+    return "\n".join(lines)
@@ -0,0 +1,148 @@
+"""Running aggregates over all users, kept up to date by `UserStore`.
+
+Totals (users, subscribers, videos, currency) are adjusted by the difference
+a change makes, so /botstats and the cluster summaries don't walk every user.
+Activity over time lives in fixed-size rings of per-hour/per-day slots:
+videos published, currency minted and spent, and users active per day.
+Changes made inside `adjustment()` (imports, admin grants) move the totals
+but are left out of those rings: they are not players' activity.
+`check()` recounts the totals from the records and repairs drift.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (subscribers, video_count, currency) of one user
+Values = Tuple[int, int, int]
+
+HOURS_KEPT = 48
+DAYS_KEPT = 30
+
+# set while an import or an admin command changes records
+_adjusting: ContextVar[bool] = ContextVar("stats_adjusting", default=False)
+
+
+def values_of(ud) -> Values:
+    return ud.subscribers, ud.video_count, ud.currency
+
+
+def current_hour() -> int:
+    return int(time.time() // 3600)
+
+
+def current_day() -> int:
+    return date.today().toordinal()
+
+
+@contextmanager
+def adjustment():
+    """Changes committed inside count in the totals only, not as videos, minted or spent currency."""
+    token = _adjusting.set(True)
+    try:
+        yield
+    finally:
+        _adjusting.reset(token)
+
+
+class RingCounter:
+    """Sums per slot (hour or day number) for the last `size` slots; older slots are overwritten."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots = [None] * size
+        self._values = [0] * size
+
+    def add(self, slot: int, value: int = 1):
+        i = slot % self.size
+        if self._slots[i] != slot:
+            self._slots[i] = slot
+            self._values[i] = 0
+        self._values[i] += value
+
+    def get(self, slot: int) -> int:
+        i = slot % self.size
+        return self._values[i] if self._slots[i] == slot else 0
+
+    def sum(self, last_slot: int, count: int) -> int:
+        return sum(self.get(s) for s in range(last_slot - min(count, self.size) + 1, last_slot + 1))
+
+    def clear(self):
+        self._slots = [None] * self.size
+        self._values = [0] * self.size
+
+
+class Aggregates:
+    def __init__(self):
+        self.users = 0
+        self.subscribers = 0
+        self.video_count = 0
+        self.currency = 0
+        self.videos = RingCounter(HOURS_KEPT)
+        self.minted = RingCounter(HOURS_KEPT)
+        self.spent = RingCounter(HOURS_KEPT)
+        self.active = RingCounter(DAYS_KEPT)
+
+    def change(self, before: Optional[Values], after: Optional[Values]):
+        """One user went from `before` to `after`; None means the user doesn't exist (on that side)."""
+        b = before or (0, 0, 0)
+        a = after or (0, 0, 0)
+        self.users += (after is not None) - (before is not None)
+        self.subscribers += a[0] - b[0]
+        self.video_count += a[1] - b[1]
+        self.currency += a[2] - b[2]
+        if _adjusting.get():
+            return
+        hour = current_hour()
+        if a[1] > b[1]:
+            self.videos.add(hour, a[1] - b[1])
+        if a[2] > b[2]:
+            self.minted.add(hour, a[2] - b[2])
+        elif a[2] < b[2]:
+            self.spent.add(hour, b[2] - a[2])
+
+    def activity(self):
+        """A user's first interaction today."""
+        self.active.add(current_day())
+
+    def rebuild(self, records: Iterable):
+        """Totals from scratch (on load); of the rings only today's active users can be recovered."""
+        self.users = self.subscribers = self.video_count = self.currency = 0
+        for ring in (self.videos, self.minted, self.spent, self.active):
+            ring.clear()
+        today = date.today().isoformat()
+        active = 0
+        for ud in records:
+            self.users += 1
+            self.subscribers += ud.subscribers
+            self.video_count += ud.video_count
+            self.currency += ud.currency
+            active += ud.last_active_date == today
+        if active:
+            self.active.add(current_day(), active)
+
+    def totals(self) -> Dict[str, int]:
+        hour = current_hour()
+        return {
+            'users': self.users, 'subscribers': self.subscribers,
+            'video_count': self.video_count, 'currency': self.currency,
+            'active_today': self.active.get(current_day()),
+            'videos_1h': self.videos.get(hour), 'videos_24h': self.videos.sum(hour, 24),
+            'minted_24h': self.minted.sum(hour, 24), 'spent_24h': self.spent.sum(hour, 24),
+        }
+
+    def check(self, records: Iterable) -> bool:
+        """Recount the totals from `records`; log and fix any drift. True if they matched."""
+        counted = Aggregates()
+        counted.rebuild(records)
+        drift = {name: (getattr(self, name), getattr(counted, name))
+                 for name in ('users', 'subscribers', 'video_count', 'currency')
+                 if getattr(self, name) != getattr(counted, name)}
+        for name, (kept, actual) in drift.items():
+            logger.warning("aggregate %s drifted: %s kept, %s counted", name, kept, actual)
+            setattr(self, name, actual)
+        return not drift
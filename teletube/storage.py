@@ -0,0 +1,276 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, List, Tuple
+
+from .config import DATABASE_URL, DB_JOURNAL_COMPACT_BYTES
+from .models import UserRecord, encode, decode
+
+try:
+    import orjson
+except ImportError:  # optional: about 10x faster dumps/loads, same JSON output
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _replace(tmp: str, path: str, payload: bytes):
+    # write-to-temp + fsync + rename: a crash leaves either the old or the new file
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            try: os.remove(tmp)
+            except: pass
+        raise
+
+
+class StorageBackend:
+    """Persistence interface used by `teletube.db.UserStore`.
+
+    `prepare()` runs on the event loop thread and turns the changed records into a
+    plain payload; `write()` receives that payload in a worker thread, so records
+    are never read while handlers may be mutating them. The payload may share the
+    nested dicts of records (`active_event` and the like): handlers replace those,
+    never change them in place. Records are stored in
+    the `teletube.models` format and decoded (migrated) by `load_all()`.
+    `write()` returns the number of bytes it handed to the storage.
+    `incremental` backends write only `changed` and never look at `data`.
+    """
+
+    location = ""
+    incremental = True
+
+    def load_all(self) -> Dict[int, UserRecord]:
+        raise NotImplementedError
+
+    def prepare(self, changed: Dict[int, UserRecord], data: Dict[int, UserRecord]) -> Any:
+        raise NotImplementedError
+
+    def write(self, payload: Any) -> int:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonBackend(StorageBackend):
+    incremental = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.location = path
+
+    def load_all(self) -> Dict[int, UserRecord]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'rb') as f:
+                raw = loads(f.read())
+        except Exception:
+            return {}
+        # a record from a newer schema raises here instead of being overwritten later
+        return {int(k): decode(v) for k, v in raw.items()}
+
+    def prepare(self, changed, data) -> Dict[int, List[Any]]:
+        # a single JSON document can only be rewritten as a whole; encoding copies
+        # the values, the expensive dumps runs in write()
+        return {uid: encode(ud) for uid, ud in data.items()}
+
+    def write(self, payload: Dict[int, List[Any]]) -> int:
+        raw = dumps(payload)
+        _replace(self.path + ".tmp", self.path, raw)
+        return len(raw)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class JournalBackend(StorageBackend):
+    """JSON snapshot plus an append-only journal of changed records.
+
+    A flush appends one line `[user_id, record]` per changed user to
+    `<path>.journal` and fsyncs it, so its cost depends on what changed, not on
+    the size of the database. When the journal outgrows the snapshot (and
+    `compact_bytes`), `write()` folds it into a new snapshot, still in the
+    worker thread: snapshot and journal are merged from disk, so the event loop
+    never serializes the whole database. The snapshot has the `database.json`
+    layout, so `journal://database.json` takes over an existing JSON database.
+
+    Loading reads the snapshot and replays the journal; a torn last line from
+    a crash mid-append is dropped, so at most the flush in progress is lost.
+    """
+
+    def __init__(self, path: str, compact_bytes: int = DB_JOURNAL_COMPACT_BYTES):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.location = path
+        self.compact_bytes = compact_bytes
+        self._journal = None
+
+    def _read_raw(self) -> Dict[str, Any]:
+        raw: Dict[str, Any] = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                raw = loads(f.read())
+        if not os.path.exists(self.journal_path):
+            return raw
+        good = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("no newline")
+                    uid, record = loads(line)
+                except (ValueError, TypeError):
+                    logger.warning("%s: dropping a torn record at byte %d", self.journal_path, good)
+                    break
+                raw[str(uid)] = record
+                good += len(line)
+        if good != os.path.getsize(self.journal_path):
+            # later appends must not land behind the garbage
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good)
+        return raw
+
+    def load_all(self) -> Dict[int, UserRecord]:
+        return {int(k): decode(v) for k, v in self._read_raw().items()}
+
+    def prepare(self, changed, data) -> bytes:
+        return b"".join(dumps([uid, encode(ud)]) + b"\n" for uid, ud in changed.items())
+
+    def write(self, payload: bytes) -> int:
+        if not payload:
+            return 0
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        self._journal.write(payload)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        size = self._journal.tell()
+        snapshot_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size > max(self.compact_bytes, snapshot_size):
+            return len(payload) + self.compact()
+        return len(payload)
+
+    def compact(self) -> int:
+        """Fold the journal into the snapshot (callers serialize this with `write()`); returns its size."""
+        snapshot = dumps(self._read_raw())
+        _replace(self.path + ".tmp", self.path, snapshot)
+        # a crash before the truncate only replays records the snapshot already has
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'wb')
+        return len(snapshot)
+
+    def clear(self):
+        self.close()
+        for path in (self.path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    subscribers INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+-- the leaderboard and username lookups are served from memory; these only slowed every upsert down
+DROP INDEX IF EXISTS idx_users_subscribers;
+DROP INDEX IF EXISTS idx_users_username;
+"""
+
+
+class SqliteBackend(StorageBackend):
+    """One row per user: a flush only touches the rows of changed users.
+
+    `subscribers` and `username` are duplicated out of the JSON `data` column for
+    ad-hoc SQL queries; the bot itself only reads `data`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.location = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        self._conn.commit()
+
+    def load_all(self) -> Dict[int, UserRecord]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM users").fetchall()
+        return {uid: decode(json.loads(raw)) for uid, raw in rows}
+
+    def prepare(self, changed, data) -> List[Tuple[int, str, int, str]]:
+        return [(uid, ud.username, ud.subscribers, json.dumps(encode(ud), ensure_ascii=False, separators=(',', ':')))
+                for uid, ud in changed.items()]
+
+    def write(self, payload: List[Tuple[int, str, int, str]]) -> int:
+        if not payload:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO users (user_id, username, subscribers, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET username=excluded.username, "
+                "subscribers=excluded.subscribers, data=excluded.data",
+                payload)
+        # row contents; page and WAL overhead are SQLite's own
+        return sum(len(data) + len((username or '').encode()) + 16 for _, username, _, data in payload)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM users")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_backend(url: str = DATABASE_URL) -> StorageBackend:
+    """Build a backend from `sqlite:///path.db`, `json://path.json`, `journal://path.json` or a bare file name."""
+    if url.startswith("sqlite:///"):
+        return SqliteBackend(url[len("sqlite:///"):])
+    if url.startswith("json://"):
+        return JsonBackend(url[len("json://"):])
+    if url.startswith("journal://"):
+        return JournalBackend(url[len("journal://"):])
+    if url.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteBackend(url)
+    return JsonBackend(url)
+
+
+def import_json(json_path: str, backend: StorageBackend) -> int:
+    """One-shot import of a legacy database.json into `backend`."""
+    data = JsonBackend(json_path).load_all()
+    backend.write(backend.prepare(data, data))
+    return len(data)
+
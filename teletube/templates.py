@@ -0,0 +1,77 @@
+"""Prebuilt texts and keyboards of the static replies.
+
+/start, /help and /shop used to rebuild the same HTML and keyboard objects and
+escape constant strings on every call. Here each piece is built on first use
+and reused; only per-user values (name, balance) are filled in per reply.
+Call `invalidate()` after changing `shop_items` or the settings they use.
+"""
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+
+from . import config
+from .utils import escape_html
+
+_cache: Dict[str, Any] = {}
+
+
+def invalidate():
+    _cache.clear()
+
+
+def _cached(key: str, build: Callable[[], Any]) -> Any:
+    if key not in _cache:
+        _cache[key] = build()
+    return _cache[key]
+
+
+def _build_start_keyboard() -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(keyboard=[
+        [KeyboardButton(text="/addvideo Название Видео")],
+        [KeyboardButton(text="/myprofile"), KeyboardButton(text="/shop")],
+        [KeyboardButton(text="/leaderboard"), KeyboardButton(text="/achievements")],
+        [KeyboardButton(text="/daily"), KeyboardButton(text="/help")]
+    ], resize_keyboard=True)
+
+
+def start(first_name: Optional[str]) -> Tuple[str, ReplyKeyboardMarkup]:
+    tail = _cached("start_tail", lambda: f"! Ты в игре <b>{escape_html(config.BOT_NAME)}</b>!\nИспользуй /help или кнопки.")
+    return f"🚀 Привет, {escape_html(first_name or '')}{tail}", _cached("start_keyboard", _build_start_keyboard)
+
+
+def _build_help() -> str:
+    return (
+        f"🌟 <b>{escape_html(config.BOT_NAME)}!</b>\n\n"
+        "Публикуй видео, копи валюту и прокачивайся!\n\n"
+        "<b>Команды:</b>\n"
+        f"🎬 <code>/addvideo {escape_html('<название>')}</code>\n"
+        f"🏆 <code>/leaderboard</code>  <code>/leaderboardpic</code>\n"
+        f"📅 <code>/leaderboard day|week|season|last</code>\n"
+        f"👤 <code>/myprofile</code>  <code>/mystats</code>\n"
+        f"🛍️ <code>/shop</code>\n"
+        f"🎁 <code>/daily</code>\n"
+        f"🏅 <code>/achievements</code>\n"
+        f"❓ <code>/help</code>\n\n"
+        f"Механика: публикация раз в {config.COOLDOWN_HOURS:.1f} ч. Популярность зависит от заголовка, слов-ключей и удачи. Есть события и магазин.\n\n"
+    )
+
+
+def help_text() -> str:
+    return _cached("help", _build_help)
+
+
+def _build_shop() -> Tuple[str, str, Optional[InlineKeyboardMarkup]]:
+    currency = escape_html(config.DEFAULT_CURRENCY_NAME)
+    head = f"🛍️ <b>Магазин {escape_html(config.BOT_NAME)}</b>\nБаланс: "
+    items = ""
+    kb_rows = []
+    for item_id, item in config.shop_items.items():
+        items += f"🔹 <b>{escape_html(item['name'])}</b> - {escape_html(item['price'])} {currency}\n   <i>{escape_html(item['description'])}</i>\n\n"
+        kb_rows.append([InlineKeyboardButton(text=f"Купить {item['name']} ({item['price']})", callback_data=f"shop_buy:{item_id}")])
+    markup = InlineKeyboardMarkup(inline_keyboard=kb_rows) if kb_rows else None
+    return head, f" {currency}\n\n" + items, markup
+
+
+def shop(balance: Any) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    head, tail, markup = _cached("shop", _build_shop)
+    return f"{head}{escape_html(balance)}{tail}", markup
@@ -0,0 +1,120 @@
+"""Anti-spam middlewares for incoming updates.
+
+`DedupMiddleware` (outer, on `dp.update`) drops updates Telegram delivers twice
+and repeated taps of the same inline button, e.g. a double-tapped shop item.
+`ThrottlingMiddleware` (inner, on messages and callback queries) gives every
+user a token bucket per handler; a refused command costs one prebuilt reply
+at most and never reaches the store or the chart renderer.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, Update
+
+from .config import (
+    CREATOR_ID, THROTTLE_RATE, THROTTLE_BURST, THROTTLE_HEAVY_RATE, THROTTLE_HEAVY_BURST,
+    THROTTLE_MAX_BUCKETS, DEDUP_TTL
+)
+from .metrics import THROTTLED, DUPLICATE_UPDATES
+from .outbox import TokenBucket, answer
+
+# handlers that render charts or files
+HEAVY_HANDLERS = frozenset({"cmd_leaderboardpic", "cmd_mystats", "admin_export"})
+
+# webhook retries can come much later than a double tap
+_UPDATE_TTL = 60.0
+_MAX_SEEN = 100000
+
+_THROTTLED_TEXT = "⏳ Слишком часто! Подожди немного."
+
+
+class TTLSet:
+    """Keys remembered for a fixed time; the oldest are dropped first when full."""
+
+    def __init__(self, ttl: float, max_size: int = _MAX_SEEN):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def add(self, key: Hashable, now: float) -> bool:
+        """Remember `key`; False if it was already there."""
+        # one TTL for all keys: insertion order is expiry order
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+        if key in self._expires:
+            return False
+        self._expires[key] = now + self.ttl
+        if len(self._expires) > self.max_size:
+            self._expires.popitem(last=False)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+class DedupMiddleware(BaseMiddleware):
+    def __init__(self, tap_ttl: float = DEDUP_TTL):
+        self._updates = TTLSet(_UPDATE_TTL)
+        self._taps = TTLSet(tap_ttl)
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Update, data: Dict[str, Any]) -> Any:
+        now = time.monotonic()
+        if not self._updates.add(event.update_id, now):
+            DUPLICATE_UPDATES.inc()
+            return None
+        query = event.callback_query
+        if query is not None and query.message is not None:
+            if not self._taps.add((query.from_user.id, query.message.message_id, query.data), now):
+                DUPLICATE_UPDATES.inc()
+                # still stop the button's loading spinner
+                await query.answer()
+                return None
+        return await handler(event, data)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST,
+                 heavy_rate: float = THROTTLE_HEAVY_RATE, heavy_burst: int = THROTTLE_HEAVY_BURST,
+                 max_buckets: int = THROTTLE_MAX_BUCKETS):
+        self.limits = {False: (rate, burst), True: (heavy_rate, heavy_burst)}
+        self.max_buckets = max_buckets
+        # (user_id, handler) -> bucket, least recently used first
+        self._buckets: "OrderedDict[Tuple[int, str], TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _bucket(self, key: Tuple[int, str]) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*self.limits[key[1] in HEAVY_HANDLERS])
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        user = getattr(event, "from_user", None)
+        if user is None or user.id == CREATOR_ID:
+            return await handler(event, data)
+        name = getattr(getattr(data.get("handler"), "callback", None), "__name__", "unknown")
+        bucket = self._bucket((user.id, name))
+        now = time.monotonic()
+        wait = bucket.delay(now)
+        if wait == 0:
+            bucket.consume()
+            return await handler(event, data)
+        THROTTLED.inc(handler=name)
+        # blocked_until marks that this user was already told; until then refusals are silent
+        if now >= bucket.blocked_until:
+            bucket.blocked_until = now + wait
+            if isinstance(event, CallbackQuery):
+                await event.answer(_THROTTLED_TEXT)
+            elif isinstance(event, Message):
+                await answer(event, _THROTTLED_TEXT)
+        elif isinstance(event, CallbackQuery):
+            await event.answer()
+        return None
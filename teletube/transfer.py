@@ -0,0 +1,233 @@
+"""Streaming export/import of user records as JSONL or CSV.
+
+The format follows the file extension (`.csv`, anything else is JSONL). Rows
+carry `user_id` plus every `UserRecord` field; in CSV the dict fields are JSON
+text and an empty cell means the field's default. Legacy keys kept in
+`UserRecord.extra` are extra keys of a JSONL row and the JSON `extra` column of CSV. Records are converted and written in chunks of
+`BULK_CHUNK_SIZE`: the async variants used by admin commands do the file I/O
+in a worker thread and yield to the event loop between chunks, and no variant
+builds a second copy of the whole store. In cluster mode `export_store`
+also writes the users of the other shards, which they send over in chunks.
+"""
+import asyncio
+import csv
+import itertools
+import json
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+from .cluster import shard_of
+from .config import BULK_CHUNK_SIZE
+from .models import FIELDS, UserRecord, encode, decode
+from .storage import StorageBackend
+
+Row = Tuple[int, UserRecord]
+
+_COLUMNS = ('user_id',) + FIELDS + ('extra',)
+_JSON_FIELDS = ('active_event', 'cooldown_notification_task')
+_DEFAULTS = UserRecord(created_at=0.0)
+_FIELD_SET = frozenset(FIELDS)
+
+
+def is_csv(path: str) -> bool:
+    return path.lower().endswith('.csv')
+
+
+def _to_row(uid: int, ud: UserRecord) -> Dict[str, Any]:
+    row = {'user_id': uid}
+    row.update(ud.to_dict())
+    return row
+
+
+def _from_row(row: Dict[str, Any]) -> Row:
+    record = UserRecord()
+    extra = {}
+    for name, value in row.items():
+        if name in _FIELD_SET:
+            setattr(record, name, value)
+        elif name != 'user_id':
+            extra[name] = value
+    record.extra = extra or None
+    return int(row['user_id']), record
+
+
+def _csv_cell(name: str, value: Any) -> Any:
+    if value is None:
+        return ''
+    if name in _JSON_FIELDS:
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _csv_value(name: str, cell: str) -> Any:
+    if cell == '':
+        return getattr(_DEFAULTS, name)
+    if name in _JSON_FIELDS:
+        return json.loads(cell)
+    default = getattr(_DEFAULTS, name)
+    if isinstance(default, int):
+        return int(cell)
+    if isinstance(default, float):
+        return float(cell)
+    return cell
+
+
+class Writer:
+    def __init__(self, path: str):
+        self.csv = is_csv(path)
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        if self.csv:
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(_COLUMNS)
+
+    def format(self, rows: Iterable[Row]) -> List[Any]:
+        """Plain data for `write()`; runs on the caller's thread while the records can't change."""
+        if self.csv:
+            return [[uid] + [_csv_cell(name, getattr(ud, name)) for name in FIELDS]
+                    + [json.dumps(ud.extra, ensure_ascii=False) if ud.extra else ''] for uid, ud in rows]
+        return [json.dumps(_to_row(uid, ud), ensure_ascii=False) + '\n' for uid, ud in rows]
+
+    def write(self, formatted: List[Any]):
+        if self.csv:
+            self._csv.writerows(formatted)
+        else:
+            self._file.writelines(formatted)
+
+    def close(self):
+        self._file.close()
+
+
+class Reader:
+    def __init__(self, path: str):
+        self.csv = is_csv(path)
+        self._file = open(path, 'r', encoding='utf-8', newline='')
+        self._rows: Iterator = csv.DictReader(self._file) if self.csv else self._file
+
+    def read(self, limit: int = BULK_CHUNK_SIZE) -> List[Row]:
+        """Up to `limit` rows; an empty list at the end of the file."""
+        out = []
+        for raw in self._rows:
+            if self.csv:
+                row = json.loads(raw['extra']) if raw.get('extra') else {}
+                row.update((k, _csv_value(k, v)) for k, v in raw.items() if k in _FIELD_SET)
+                row['user_id'] = raw['user_id']
+                out.append(_from_row(row))
+            elif raw.strip():
+                out.append(_from_row(json.loads(raw)))
+            if len(out) >= limit:
+                break
+        return out
+
+    def close(self):
+        self._file.close()
+
+
+async def store_chunks(store, chunk_size: int = BULK_CHUNK_SIZE) -> AsyncIterator[List[Row]]:
+    """The users of `store` in chunks; other updates are served between chunks."""
+    user_ids = [uid for uid, _ in store.users()]
+    for start in range(0, len(user_ids), chunk_size):
+        # users deleted since the id list was taken are skipped
+        rows = [(uid, store.peek(uid)) for uid in user_ids[start:start + chunk_size]]
+        yield [(uid, ud) for uid, ud in rows if ud is not None]
+        await asyncio.sleep(0)
+
+
+async def dump_store(store, chunk_size: int = BULK_CHUNK_SIZE) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """`store_chunks` encoded for another process (a shard answering an export)."""
+    async for rows in store_chunks(store, chunk_size):
+        yield [(uid, encode(ud)) for uid, ud in rows]
+
+
+async def export_store(store, path: str, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    loop = asyncio.get_running_loop()
+    writer = await loop.run_in_executor(None, Writer, path)
+    count = 0
+    try:
+        async for rows in store_chunks(store, chunk_size):
+            await loop.run_in_executor(None, writer.write, writer.format(rows))
+            count += len(rows)
+        if store.remote is not None:
+            async for part in store.remote.parts("dump", chunk_size):
+                rows = [(uid, decode(raw)) for uid, raw in part]
+                await loop.run_in_executor(None, writer.write, writer.format(rows))
+                count += len(rows)
+    finally:
+        await loop.run_in_executor(None, writer.close)
+    return count
+
+
+async def import_store(store, path: str, chunk_size: int = BULK_CHUNK_SIZE) -> Tuple[int, int, int]:
+    """Insert or overwrite the users in `path`; users not in the file are kept.
+
+    In cluster mode only the users this shard owns are put into `store`; the
+    others go to `store.forward` (their owners), or are skipped without it.
+    Returns (imported here, forwarded, skipped).
+    """
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(None, Reader, path)
+    count = forwarded = skipped = 0
+    try:
+        while True:
+            rows = await loop.run_in_executor(None, reader.read, chunk_size)
+            if not rows:
+                break
+            if store.shard is not None:
+                index, shards = store.shard
+                others = [(uid, record) for uid, record in rows if shard_of(uid, shards) != index]
+                if others:
+                    rows = [(uid, record) for uid, record in rows if shard_of(uid, shards) == index]
+                    if store.forward is not None:
+                        store.forward(others)
+                        forwarded += len(others)
+                    else:
+                        skipped += len(others)
+            for uid, record in rows:
+                await store.put(uid, record)
+            count += len(rows)
+    finally:
+        reader.close()
+    return count, forwarded, skipped
+
+
+def export_backend(backend: StorageBackend, path: str, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Offline export (the bot is stopped): the backend's records are the only copy in memory."""
+    data = backend.load_all()
+    writer = Writer(path)
+    try:
+        rows = iter(data.items())
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.write(writer.format(chunk))
+    finally:
+        writer.close()
+    return len(data)
+
+
+def import_backend(path: str, backend: StorageBackend, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Offline import into `backend`, merged with what it already holds.
+
+    Incremental backends get one write per chunk and hold nothing else in
+    memory. A JSON database is a single document: it is loaded once, updated
+    in place chunk by chunk and rewritten at the end (a rewrite per chunk would
+    make the import quadratic).
+    """
+    data = None if backend.incremental else backend.load_all()
+    count = 0
+    reader = Reader(path)
+    try:
+        while True:
+            rows = reader.read(chunk_size)
+            if not rows:
+                break
+            chunk = dict(rows)
+            if data is None:
+                backend.write(backend.prepare(chunk, chunk))
+            else:
+                data.update(chunk)
+            count += len(chunk)
+    finally:
+        reader.close()
+    if data is not None:
+        backend.write(backend.prepare(data, data))
+    return count
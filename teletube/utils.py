@@ -7,8 +7,10 @@ from .config import (
     POPULARITY_RANDOM_MIN, POPULARITY_RANDOM_MAX,
     BONUS_SUBSCRIBERS_MIN, BONUS_SUBSCRIBERS_MAX,
     POPULARITY_THRESHOLD_BONUS, NEGATIVE_POPULARITY_THRESHOLD
-    , DEFAULT_CURRENCY_NAME
+    , DEFAULT_CURRENCY_NAME, VIEWS_PER_POPULARITY_POINT,
+    DAILY_BONUS_AMOUNT, DAILY_BONUS_STREAK_MULTIPLIER
 )
+from .keywords import TitleScorer
 
 
 def load_keywords(filename: str = KEYWORDS_FILE) -> List[str]:
@@ -23,63 +25,88 @@ def load_keywords(filename: str = KEYWORDS_FILE) -> List[str]:
         return []
 
 
-def evaluate_video_popularity(video_title: str, base_popularity_modifier: int = 0, user_subs: int = 0) -> int:
+title_scorer = TitleScorer(KEYWORDS_FILE, load_keywords)
+
+
+POPULARITY_FLOOR = -30
+POPULARITY_CEIL = 100
+# extra subscribers for a video above POPULARITY_THRESHOLD_BONUS
+VIDEO_BONUS_SUBS_RANGE = (BONUS_SUBSCRIBERS_MIN, BONUS_SUBSCRIBERS_MAX)
+
+
+def title_score(video_title: str) -> int:
+    """Deterministic part of a video's popularity: keywords, length and title quality."""
     title = video_title.strip().lower()
-    keywords = load_keywords()
 
-    keyword_bonus = sum(KEYWORD_BONUS_POINTS for k in keywords if k in title)
+    keyword_hits, title_quality = title_scorer.score(title)
+    keyword_bonus = keyword_hits * KEYWORD_BONUS_POINTS
 
     words = len(title.split())
     length_bonus = min(5, words // 2)
 
-    title_quality = 0
-    if any(word in title for word in ['новый', 'лучший', 'топ', 'обзор', 'туториал', 'гайд']):
-        title_quality += 3
-    if any(word in title for word in ['2024', '2025', 'новинка', 'эксклюзив']):
-        title_quality += 2
     if len(title) > 20:
         title_quality += 1
 
-    volatility = 1.0 + max(0, 20 - min(user_subs, 200)) / 40.0
+    return keyword_bonus + length_bonus + title_quality
+
 
-    base_score = keyword_bonus + length_bonus + title_quality + base_popularity_modifier
+def popularity_volatility(user_subs: int) -> float:
+    # small channels swing harder
+    return 1.0 + max(0, 20 - min(user_subs, 200)) / 40.0
+
+
+def evaluate_video_popularity(video_title: str, base_popularity_modifier: int = 0, user_subs: int = 0) -> int:
+    base_score = title_score(video_title) + base_popularity_modifier
 
     rand_factor = random.randint(POPULARITY_RANDOM_MIN, POPULARITY_RANDOM_MAX)
 
     raw_score = base_score + rand_factor
 
-    adjusted_score = int(round(raw_score * volatility))
+    adjusted_score = int(round(raw_score * popularity_volatility(user_subs)))
 
-    final_score = max(-30, min(100, adjusted_score))
+    final_score = max(POPULARITY_FLOOR, min(POPULARITY_CEIL, adjusted_score))
 
     return final_score
 
 
-def get_random_event(user_subscribers: int) -> Optional[Dict[str, Any]]:
-    r = random.random()
+def estimate_video_views(popularity: int, user_subs: int) -> int:
+    return max(0, popularity) * (max(0, user_subs) + 50) * VIEWS_PER_POPULARITY_POINT
+
 
-    if r < 0.05 and user_subscribers >= 10:
-        bonus = random.randint(25, 75)
-        return {"type": "event_modifier", "modifier": bonus, "target": "next_video_popularity",
-                "message": f"🎉 Вирусный взрыв! +{bonus} к популярности следующего видео!"}
+def daily_bonus_amount(streak: int) -> int:
+    return int(DAILY_BONUS_AMOUNT * (DAILY_BONUS_STREAK_MULTIPLIER ** (streak - 1)))
 
-    if 0.05 <= r < 0.15:
-        bonus = random.randint(5, 15)
-        return {"type": "event_modifier", "modifier": bonus, "target": "next_video_popularity",
-                "message": f"✨ Местный хайп: +{bonus} к следующему видео."}
 
-    if 0.15 <= r < 0.20 and user_subscribers > 30:
-        malus = random.randint(3, 8)
-        return {"type": "event_modifier", "modifier": -malus, "target": "next_video_popularity",
-                "message": f"📉 Технические проблемы: -{malus} к следующему видео."}
+# Events that may follow a published video. One r = random.random() is drawn and
+# the row whose [start, end) band contains it applies if the user has at least
+# `min_subs` subscribers; its value is drawn uniformly from `range`.
+RANDOM_EVENTS: List[Dict[str, Any]] = [
+    {"band": (0.00, 0.05), "min_subs": 10, "type": "event_modifier", "field": "modifier", "range": (25, 75),
+     "message": "🎉 Вирусный взрыв! +{value} к популярности следующего видео!"},
+    {"band": (0.05, 0.15), "min_subs": 0, "type": "event_modifier", "field": "modifier", "range": (5, 15),
+     "message": "✨ Местный хайп: +{value} к следующему видео."},
+    {"band": (0.15, 0.20), "min_subs": 31, "type": "event_modifier", "field": "modifier", "range": (-8, -3),
+     "message": "📉 Технические проблемы: {value} к следующему видео."},
+    {"band": (0.20, 0.25), "min_subs": 50, "type": "currency_bonus", "field": "amount", "range": (10, 30),
+     "message": "💰 Бонус за активность: +{value} " + DEFAULT_CURRENCY_NAME + "!"},
+    {"band": (0.25, 0.30), "min_subs": 100, "type": "cooldown_reduction", "field": "hours", "range": (1, 3),
+     "message": "⚡ Ускорение: кулдаун уменьшен на {value} часа!"},
+]
 
-    if 0.20 <= r < 0.25 and user_subscribers >= 50:
-        return {"type": "currency_bonus", "amount": random.randint(10, 30),
-                "message": f"💰 Бонус за активность: +{random.randint(10, 30)} {DEFAULT_CURRENCY_NAME}!"}
 
-    if 0.25 <= r < 0.30 and user_subscribers >= 100:
-        return {"type": "cooldown_reduction", "hours": random.randint(1, 3),
-                "message": f"⚡ Ускорение: кулдаун уменьшен на {random.randint(1, 3)} часа!"}
+def get_random_event(user_subscribers: int) -> Optional[Dict[str, Any]]:
+    r = random.random()
+
+    for ev in RANDOM_EVENTS:
+        start, end = ev["band"]
+        if start <= r < end:
+            if user_subscribers < ev["min_subs"]:
+                return None
+            value = random.randint(*ev["range"])
+            event = {"type": ev["type"], ev["field"]: value, "message": ev["message"].format(value=value)}
+            if ev["type"] == "event_modifier":
+                event["target"] = "next_video_popularity"
+            return event
 
     return None
 
@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from .config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    WEBHOOK_MAX_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates over HTTP and feeds them to the dispatcher.
+
+    At most `max_concurrency` updates are processed at once. When the pool is
+    full the request waits for a free slot before it is acknowledged, so
+    Telegram (or a load balancer) sees the back-pressure instead of the bot
+    piling up unbounded tasks. On shutdown new updates get 503 (Telegram
+    redelivers them later) and the ones already accepted are drained.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH,
+                 max_concurrency: int = WEBHOOK_MAX_CONCURRENCY):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle)
+        self.app.router.add_get("/healthz", self.health)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if self._closing:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("bad webhook payload: %s", e)
+            return web.Response(status=400)
+        await self._slots.acquire()
+        if self._closing:
+            self._slots.release()
+            return web.Response(status=503)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.Response(status=503 if self._closing else 200, text=f"in_flight {len(self)}\n")
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error("update %s failed: %s", update.update_id, e)
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        """Stop accepting updates and wait for the accepted ones to finish."""
+        self._closing = True
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            if pending:
+                logger.warning("webhook drain timed out, cancelling %d updates", len(pending))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def serve(dp: Dispatcher, bot: Bot, host: str = WEBAPP_HOST, port: int = WEBAPP_PORT,
+                url: Optional[str] = WEBHOOK_URL, server: Optional[WebhookServer] = None):
+    """Run the webhook server until SIGINT/SIGTERM or cancellation, then drain."""
+    if server is None:
+        server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("webhook server listening on %s:%s%s", host, port, server.path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: KeyboardInterrupt cancels the task instead
+            pass
+
+    try:
+        await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+        if url:
+            # several instances may share the URL, so it is set on start but never deleted on stop
+            await bot.set_webhook(url=url.rstrip("/") + server.path, secret_token=server.secret,
+                                  allowed_updates=dp.resolve_used_update_types())
+        await stop.wait()
+    finally:
+        logger.info("webhook server stopping, draining %d updates", len(server))
+        await server.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError):
+                pass
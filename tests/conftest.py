@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def bot_state(tmp_path, monkeypatch):
+    """The process-wide store, history and season windows, emptied and moved into `tmp_path`."""
+    from teletube.db import store
+    from teletube.history import history
+    from teletube.seasons import seasons
+    from teletube.storage import JsonBackend
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "_backend", JsonBackend(str(tmp_path / "database.json")))
+    monkeypatch.setattr(store, "_loaded", False)
+    monkeypatch.setattr(history, "path", str(tmp_path / "history"))
+    monkeypatch.setattr(seasons, "_loaded", False)
+    yield store
+    history.close()
@@ -0,0 +1,82 @@
+import asyncio
+import random
+
+import teletube.achievements as achievements
+from teletube.achievements import (
+    ACHIEVEMENT_BITS, ACTIVITY_METRICS, METRICS, AchievementIndex, achievement_index, achievements_definition,
+    check_and_grant_achievements, mask_from_ids, unlocked_ids
+)
+from teletube.models import UserRecord
+from teletube.utils import estimate_video_views
+
+NOW = 1_700_000_000.0
+
+
+def naive_unlocked(ud: UserRecord, metrics=None) -> int:
+    """Every definition checked one by one, as before the index."""
+    new = 0
+    for aid, adef in achievements_definition.items():
+        for cond, threshold in adef.items():
+            if cond in METRICS and (metrics is None or cond in metrics) and METRICS[cond](ud, NOW) >= threshold:
+                new |= 1 << ACHIEVEMENT_BITS[aid]
+    return new & ~ud.achievements_mask
+
+
+def random_user(rng: random.Random) -> UserRecord:
+    ud = UserRecord("u", subscribers=rng.choice([0, 99, 100, 101, 2500, 20000]), video_count=rng.randint(0, 120),
+                    days_active=rng.randint(0, 40), best_video_views=rng.choice([0, 99999, 100000]),
+                    created_at=NOW - rng.uniform(0, 10) * 86400)
+    ud.achievements_mask = rng.getrandbits(len(ACHIEVEMENT_BITS))
+    return ud
+
+
+def test_index_agrees_with_checking_every_definition():
+    rng = random.Random(3)
+    for _ in range(2000):
+        ud = random_user(rng)
+        assert achievement_index.newly_unlocked(ud, now=NOW) == naive_unlocked(ud)
+        assert achievement_index.newly_unlocked(ud, ACTIVITY_METRICS, now=NOW) == naive_unlocked(ud, ACTIVITY_METRICS)
+
+
+def test_prefix_masks_hold_the_lowest_thresholds():
+    # a subset of the real definitions (bits are global), given out of threshold order
+    index = AchievementIndex({aid: achievements_definition[aid]
+                              for aid in ("popular_choice", "first_hundred", "newbie_blogger")})
+    bits = {aid: 1 << bit for aid, bit in ACHIEVEMENT_BITS.items()}
+    assert index._thresholds["condition_subs"] == [100, 500]
+    assert index._reached["condition_subs"] == [0, bits["first_hundred"], bits["first_hundred"] | bits["popular_choice"]]
+    # thresholds are inclusive
+    assert index.newly_unlocked(UserRecord(subscribers=100), now=NOW) == bits["first_hundred"]
+    assert index.newly_unlocked(UserRecord(subscribers=99, video_count=1), now=NOW) == bits["newbie_blogger"]
+    assert index.newly_unlocked(UserRecord(subscribers=10 ** 6, video_count=10 ** 6), now=NOW) == \
+        bits["first_hundred"] | bits["popular_choice"] | bits["newbie_blogger"]
+
+
+def test_mask_bits_follow_definition_order():
+    ids = list(achievements_definition)
+    assert [ACHIEVEMENT_BITS[aid] for aid in ids] == list(range(len(ids)))
+    some = ids[1::3]
+    assert unlocked_ids(mask_from_ids(some)) == some
+    assert mask_from_ids(["no_such_achievement"]) == 0
+
+
+def test_granting_pays_once_and_a_viral_video_counts(monkeypatch):
+    posted = []
+    monkeypatch.setattr(achievements.outbox, "post", lambda method, **kwargs: posted.append(method.text))
+    # popularity 100 on a 50-subscriber channel: 100 * 100 * VIEWS_PER_POPULARITY_POINT (10) views
+    views = estimate_video_views(100, 50)
+    assert views == 100000
+    assert estimate_video_views(-5, 50) == 0
+    ud = UserRecord("u", video_count=1, best_video_views=views)
+
+    async def run():
+        first = await check_and_grant_achievements(ud, None, 1, metrics=("condition_videos", "condition_video_views"))
+        again = await check_and_grant_achievements(ud, None, 1, metrics=("condition_videos", "condition_video_views"))
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert set(unlocked_ids(ud.achievements_mask)) == {"newbie_blogger", "viral_hit"}
+    assert ud.currency == achievements_definition["newbie_blogger"]["reward_coins"] + \
+        achievements_definition["viral_hit"]["reward_coins"]
+    assert len(first) == 2 and again == []
+    assert posted == first
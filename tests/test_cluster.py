@@ -0,0 +1,97 @@
+import asyncio
+import json
+import time
+
+ADMIN = 1001
+TOKEN = "123456:cluster-test"
+
+
+def admin_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": ADMIN, "type": "private"},
+            "from": {"id": ADMIN, "is_bot": False, "first_name": "admin", "username": "admin"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+
+async def fake_api(replies: asyncio.Queue):
+    """Bot API stand-in: sent messages and documents go to `replies`."""
+    from aiohttp import web
+
+    async def handle(request):
+        method = request.match_info["method"]
+        form = await request.post()
+        if method == "sendDocument":
+            # aiogram uploads the file as a separate part named in "attach://<name>"
+            upload = form[form["document"].partition("attach://")[2]]
+            replies.put_nowait(upload.file.read().decode("utf-8"))
+        elif method == "sendMessage":
+            replies.put_nowait(form["text"])
+        result = {"message_id": 1, "date": int(time.time()), "chat": {"id": ADMIN, "type": "private"}}
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def test_export_and_bulk_reach_every_shard(tmp_path, monkeypatch):
+    from aiogram.types import Update
+    from teletube import cluster
+    from teletube.models import UserRecord, encode
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cluster, "DATABASE_URL", str(tmp_path / "database.json"))
+    monkeypatch.setattr(cluster, "HISTORY_DIR", str(tmp_path / "history"))
+    for name, value in {"BOT_TOKEN": TOKEN, "CREATOR_ID": str(ADMIN), "LOG_LEVEL": "WARNING",
+                        "METRICS_PORT": "0", "CLUSTER_SUMMARY_INTERVAL": "0.2"}.items():
+        monkeypatch.setenv(name, value)
+
+    async def run():
+        replies: asyncio.Queue = asyncio.Queue()
+        api, port = await fake_api(replies)
+        monkeypatch.setenv("TELEGRAM_API_SERVER", f"http://127.0.0.1:{port}")
+        router = cluster.Router(2)
+        router.start()
+        update_ids = iter(range(1, 100))
+
+        async def command(text: str) -> str:
+            update = Update.model_validate(admin_update(next(update_ids), text))
+            router.route(update)
+            return await asyncio.wait_for(replies.get(), 120)
+
+        def exported(dump: str) -> dict:
+            return {row["user_id"]: row for row in map(json.loads, dump.splitlines())}
+
+        try:
+            for shard in range(2):
+                rows = [(uid, encode(UserRecord(f"u{uid}", subscribers=uid * 10, currency=uid)))
+                        for uid in range(1, 21) if uid % 2 == shard]
+                router.inboxes[shard].put(("put", rows))
+
+            users = exported(await command("/CHEATexport"))
+            assert sorted(users) == list(range(1, 21))
+            assert users[7]["subscribers"] == 70
+
+            # the first three of the whole bot, two of them on the other shard
+            assert await command("/CHEATbulk top3 currency =1000") == "Изменено юзеров: 3"
+            users = exported(await command("/CHEATexport"))
+            assert sorted(uid for uid, row in users.items() if row["currency"] == 1000) == [18, 19, 20]
+
+            assert await command("/CHEATbulk all subscribers =0") == "Изменено юзеров: 20"
+            users = exported(await command("/CHEATexport"))
+            assert {row["subscribers"] for row in users.values()} == {0}
+        finally:
+            await router.close()
+            await api.cleanup()
+
+    asyncio.run(run())
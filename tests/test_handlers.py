@@ -0,0 +1,120 @@
+import asyncio
+
+from aiogram.types import Message
+
+import teletube.handlers as handlers
+from teletube.metrics import STORE_CHANGES, current_handler
+
+USER_ID = 42
+
+
+def message(text: str) -> Message:
+    return Message.model_validate({
+        "message_id": 1, "date": 0, "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "user", "username": "user"}, "text": text,
+    })
+
+
+def test_a_stalled_reply_does_not_hold_the_users_lock(bot_state, monkeypatch):
+    store = bot_state
+    delivered = asyncio.Event()
+    sent = []
+
+    async def answer(msg, text, **kwargs):
+        sent.append(text)
+        # a reply stuck behind a flood wait
+        await delivered.wait()
+
+    monkeypatch.setattr(handlers, "answer", answer)
+
+    async def run():
+        first = asyncio.create_task(handlers.cmd_daily(message("/daily"), None))
+        second = asyncio.create_task(handlers.cmd_daily(message("/daily"), None))
+        await asyncio.sleep(0.05)
+        # both replies are waiting for delivery, neither holds the user
+        assert len(sent) == 2 and "Уже получили" in sent[1]
+        assert await asyncio.wait_for(streak(), 1) == 1
+        delivered.set()
+        await asyncio.gather(first, second)
+        await store.close()
+
+    async def streak():
+        async with store.user(USER_ID) as ud:
+            return ud.daily_bonus_streak
+
+    asyncio.run(run())
+
+
+def test_each_command_saves_a_user_at_most_once(bot_state, monkeypatch):
+    store = bot_state
+    sent = []
+
+    async def answer(msg, text, **kwargs):
+        sent.append(text)
+
+    monkeypatch.setattr(handlers, "answer", answer)
+
+    async def changes(handler, text: str) -> int:
+        before = STORE_CHANGES.get(handler=handler.__name__)
+        token = current_handler.set(handler.__name__)
+        try:
+            await handler(message(text), None)
+        finally:
+            current_handler.reset(token)
+        return int(STORE_CHANGES.get(handler=handler.__name__) - before)
+
+    async def run():
+        # a new user, the video, its cooldown reminder and achievements: one save
+        assert await changes(handlers.cmd_addvideo, "/addvideo первое видео") == 1
+        assert store.peek(USER_ID).cooldown_notification_task is not None
+        # refused by the cooldown
+        assert await changes(handlers.cmd_addvideo, "/addvideo второе видео") == 0
+        assert await changes(handlers.cmd_myprofile, "/myprofile") == 0
+        assert await changes(handlers.cmd_daily, "/daily") == 1
+        assert await changes(handlers.cmd_daily, "/daily") == 0
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_side_effects_of_a_video_wait_for_the_commit(bot_state, monkeypatch):
+    import teletube.achievements as achievements
+    from teletube.history import history
+    from teletube.scheduler import scheduler
+    from teletube.seasons import seasons
+
+    store = bot_state
+    posted = []
+    # earlier tests leave reminders in the process-wide scheduler
+    monkeypatch.setattr(scheduler, "_pending", {})
+    monkeypatch.setattr(scheduler, "_heap", [])
+    monkeypatch.setattr(handlers, "answer", lambda msg, text, **kwargs: asyncio.sleep(0))
+    monkeypatch.setattr(achievements.outbox, "post", lambda method, **kwargs: posted.append(method.text))
+    grant = handlers.grant_achievements
+
+    def failing_grant(ud, metrics=None):
+        grant(ud, metrics)
+        raise RuntimeError("grant failed")
+
+    async def run():
+        monkeypatch.setattr(handlers, "grant_achievements", failing_grant)
+        try:
+            await handlers.cmd_addvideo(message("/addvideo первое видео"), None)
+        except RuntimeError:
+            pass
+        # rolled back: no reminder, notice, history row or season score either
+        ud = store.peek(USER_ID)
+        assert (ud.video_count, ud.achievements_mask, ud.cooldown_notification_task) == (0, 0, None)
+        assert USER_ID not in scheduler._pending
+        assert posted == [] and len(history.user_events(USER_ID)) == 0
+        assert seasons.top('day', 10) == []
+
+        monkeypatch.setattr(handlers, "grant_achievements", grant)
+        await handlers.cmd_addvideo(message("/addvideo первое видео"), None)
+        ud = store.peek(USER_ID)
+        assert ud.video_count == 1
+        assert scheduler._pending[USER_ID] == (ud.cooldown_notification_task['ends_at'], USER_ID)
+        assert posted and len(history.user_events(USER_ID)) == 1
+        await store.close()
+
+    asyncio.run(run())
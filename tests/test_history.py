@@ -0,0 +1,29 @@
+from teletube.history import History, VIDEO, DAILY
+
+
+def test_rows_are_visible_while_the_writer_appends_and_seals(tmp_path):
+    h = History(str(tmp_path), chunk_rows=64)
+    for i in range(1000):
+        h.record(i % 7, VIDEO if i % 2 else DAILY, i, subs_delta=1, ts=1000.0 + i)
+        # queued, active or sealed: every row is counted exactly once
+        assert len(h) == i + 1
+        if i % 97 == 0:
+            assert len(h.user_events(i % 7)) == i // 7 + 1
+    h.flush()
+    assert len(h.events_since(1500.0)) == 500
+    h.close()
+
+    reopened = History(str(tmp_path), chunk_rows=64)
+    assert len(reopened) == 1000
+    events = reopened.user_events(3)
+    assert events['ts'].tolist() == [1000.0 + i for i in range(3, 1000, 7)]
+    assert events['subscribers'].tolist() == list(range(3, 1000, 7))
+    reopened.close()
+
+
+def test_close_writes_queued_rows(tmp_path):
+    h = History(str(tmp_path), chunk_rows=10)
+    for i in range(25):
+        h.record(1, VIDEO, i, ts=float(i))
+    h.close()
+    assert len(History(str(tmp_path), chunk_rows=10).user_events(1)) == 25
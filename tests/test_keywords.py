@@ -0,0 +1,81 @@
+import os
+import random
+
+import pytest
+
+from teletube import utils
+from teletube.keywords import TitleScorer, AhoCorasick, QUALITY_WORDS, FRESH_WORDS
+from teletube.utils import load_keywords, title_score
+
+
+def linear_score(title: str, keywords):
+    """The scan the automaton replaced: one substring test per keyword and quality word."""
+    hits = sum(1 for k in keywords if k in title)
+    quality = (3 if any(w in title for w in QUALITY_WORDS) else 0) + (2 if any(w in title for w in FRESH_WORDS) else 0)
+    return hits, quality
+
+
+def write_keywords(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def scorer(tmp_path, monkeypatch):
+    path = str(tmp_path / "keywords.txt")
+    write_keywords(path, ["Хайп", "хайпа", "айп", "па", "хайп", "# комментарий", "", "обзор", "2025"])
+    scorer = TitleScorer(path, load_keywords)
+    monkeypatch.setattr(utils, "title_scorer", scorer)
+    return scorer
+
+
+@pytest.mark.parametrize("title", [
+    "хайпанули",                     # overlapping keywords end inside each other
+    "хайп хайп хайп",                # repeats in the title count once per keyword
+    "обзор хайпа 2025",              # keywords that are quality words too
+    "новинка: лучший туториал",      # quality and fresh words only
+    "папа",
+    "",
+])
+def test_automaton_matches_the_linear_scan(scorer, title):
+    keywords = load_keywords(scorer.filename)
+    # the duplicate 'хайп' line (after folding 'Хайп') counts twice, as it did
+    assert keywords.count("хайп") == 2
+    assert scorer.score(title) == linear_score(title, keywords)
+
+
+def test_title_score_folds_case(scorer):
+    keywords = load_keywords(scorer.filename)
+    title = "  ХАЙПАНУЛИ на Обзоре НОВЫЙ рекорд  "
+    hits, quality = linear_score(title.strip().lower(), keywords)
+    words = len(title.split())
+    expected = hits * utils.KEYWORD_BONUS_POINTS + min(5, words // 2) + quality + (len(title.strip()) > 20)
+    assert title_score(title) == expected
+    assert title_score(title) == title_score(title.lower())
+
+
+def test_random_overlapping_patterns_agree():
+    rng = random.Random(7)
+    for _ in range(200):
+        keywords = ["".join(rng.choice("аб") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 12))]
+        text = "".join(rng.choice("аб ") for _ in range(rng.randint(0, 30)))
+        automaton = AhoCorasick((k, k) for k in set(keywords))
+        assert sorted(automaton.matches(text)) == sorted(k for k in set(keywords) if k in text)
+
+
+def test_edited_file_is_reloaded(scorer):
+    assert scorer.score("стрим")[0] == 0
+    first = scorer.automaton()
+    assert scorer.automaton() is first
+    write_keywords(scorer.filename, ["стрим"])
+    assert scorer.score("стрим") == (1, 0)
+    assert scorer.score("хайп") == (0, 0)
+    assert scorer.automaton() is not first
+
+    # same size: only the mtime tells this edit apart
+    size = os.path.getsize(scorer.filename)
+    mtime = os.stat(scorer.filename).st_mtime_ns
+    write_keywords(scorer.filename, ["влоги"])
+    os.utime(scorer.filename, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert os.path.getsize(scorer.filename) == size
+    assert scorer.score("влоги стрим") == (1, 0)
@@ -0,0 +1,23 @@
+import random
+
+from teletube.leaderboard import LeaderboardIndex, count_above
+
+
+def test_cluster_rank_error_is_bounded_by_the_peers_steps():
+    rnd = random.Random(5)
+    shards = [LeaderboardIndex() for _ in range(3)]
+    everyone = {}
+    for uid in range(30000):
+        subs = int(rnd.paretovariate(1.2) * 10)
+        shards[uid % 3].update(uid, subs)
+        everyone[uid] = subs
+    summaries = [s.summary(20) for s in shards]
+    bound = sum(s['step'] - 1 for s in summaries[1:])
+    worst = 0
+    for uid in rnd.sample(range(0, 30000, 3), 300):
+        subs = everyone[uid]
+        exact = sum(1 for v in everyone.values() if v > subs)
+        estimate = shards[0].rank(uid) - 1 + sum(count_above(p, subs) for p in summaries[1:])
+        assert estimate <= exact
+        worst = max(worst, exact - estimate)
+    assert worst <= bound
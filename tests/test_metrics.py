@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from teletube.metrics import HANDLER_ERRORS, HANDLER_IN_FLIGHT, HANDLER_SECONDS, HandlerMetricsMiddleware, Registry, \
+    current_handler
+
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    h = Registry().histogram("t_seconds", "Test.", buckets=(0.5, 0.1, 1.0))
+    assert h.buckets == (0.1, 0.5, 1.0)
+    for value in (0.05, 0.1, 0.3, 0.5, 0.5, 2.0):
+        h.observe(value)
+    # a value equal to a bound belongs to that bucket, as `le` says
+    assert h.series[()][0] == [2, 3, 0, 1]
+    assert (h.count(), h.mean()) == (6, pytest.approx(3.45 / 6))
+
+    assert h.quantile(0.0) == 0.1
+    assert h.quantile(1 / 3) == 0.1
+    assert h.quantile(0.5) == 0.5
+    assert h.quantile(5 / 6) == 0.5
+    assert h.quantile(0.99) == float("inf")
+
+    # series without observations
+    labelled = Registry().histogram("t_seconds", "Test.", ("handler",))
+    labelled.observe(0.2, handler="a")
+    assert (labelled.quantile(0.5, handler="b"), labelled.mean(handler="b"), labelled.count(handler="b")) == (0.0, 0.0, 0)
+
+
+def test_text_exposition():
+    registry = Registry()
+    counter = registry.counter("t_total", "Things.", ("kind",))
+    gauge = registry.gauge("t_live", "Read at scrape time.", func=lambda: 7)
+    histogram = registry.histogram("t_seconds", "Latency.", ("handler",), buckets=(0.1, 1.0))
+    counter.inc(kind='say "hi"\n')
+    counter.inc(2, kind="a\\b")
+    histogram.observe(0.05, handler="cmd_start")
+    histogram.observe(3, handler="cmd_start")
+    histogram.observe(0.5, handler="admin")
+    with pytest.raises(ValueError):
+        registry.counter("t_total", "Again.")
+    assert gauge.get() == 0
+
+    assert registry.expose() == "\n".join([
+        "# HELP t_total Things.",
+        "# TYPE t_total counter",
+        't_total{kind="a\\\\b"} 2',
+        't_total{kind="say \\"hi\\"\\n"} 1',
+        "# HELP t_live Read at scrape time.",
+        "# TYPE t_live gauge",
+        "t_live 7",
+        "# HELP t_seconds Latency.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{handler="admin",le="0.1"} 0',
+        't_seconds_bucket{handler="admin",le="1.0"} 1',
+        't_seconds_bucket{handler="admin",le="+Inf"} 1',
+        't_seconds_sum{handler="admin"} 0.5',
+        't_seconds_count{handler="admin"} 1',
+        't_seconds_bucket{handler="cmd_start",le="0.1"} 1',
+        't_seconds_bucket{handler="cmd_start",le="1.0"} 1',
+        't_seconds_bucket{handler="cmd_start",le="+Inf"} 2',
+        't_seconds_sum{handler="cmd_start"} 3.05',
+        't_seconds_count{handler="cmd_start"} 2',
+    ]) + "\n"
+
+
+def test_a_failing_gauge_is_left_out():
+    registry = Registry()
+    registry.gauge("t_broken", "Fails.", func=lambda: 1 / 0)
+    assert registry.expose() == "# HELP t_broken Fails.\n# TYPE t_broken gauge\n"
+
+
+def test_middleware_names_the_running_handler():
+    class Handler:
+        def __init__(self, callback):
+            self.callback = callback
+
+    seen = []
+
+    async def cmd_metrics_test(event, data):
+        seen.append((current_handler.get(), HANDLER_IN_FLIGHT.get(handler="cmd_metrics_test")))
+        # tasks started by the handler inherit its name
+        await asyncio.create_task(record())
+        if event == "fail":
+            raise RuntimeError(event)
+
+    async def record():
+        seen.append(current_handler.get())
+
+    async def run():
+        middleware = HandlerMetricsMiddleware()
+        data = {"handler": Handler(cmd_metrics_test)}
+        await middleware(cmd_metrics_test, "ok", data)
+        with pytest.raises(RuntimeError):
+            await middleware(cmd_metrics_test, "fail", data)
+
+    errors = HANDLER_ERRORS.get(handler="cmd_metrics_test")
+    calls = HANDLER_SECONDS.count(handler="cmd_metrics_test")
+    asyncio.run(run())
+    assert seen == [("cmd_metrics_test", 1), "cmd_metrics_test"] * 2
+    assert current_handler.get() == "background"
+    assert HANDLER_SECONDS.count(handler="cmd_metrics_test") == calls + 2
+    assert HANDLER_ERRORS.get(handler="cmd_metrics_test") == errors + 1
+    assert HANDLER_IN_FLIGHT.get(handler="cmd_metrics_test") == 0
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from teletube.achievements import mask_from_ids, unlocked_ids
+from teletube.models import FIELDS, SCHEMA_VERSION, UserRecord, decode, encode
+
+
+def test_encode_decode_round_trip():
+    record = UserRecord("name", subscribers=12, last_used_timestamp=1.5, video_count=3,
+                        active_event={"type": "event_modifier", "modifier": 5}, currency=40,
+                        achievements_mask=0b101, last_daily_bonus_date="2025-01-02", daily_bonus_streak=2,
+                        total_subs_from_videos=20, cooldown_notification_task={"ends_at": 9.0, "chat_id": 1},
+                        created_at=100.0, days_active=4, last_active_date="2025-01-03", best_video_views=900)
+    raw = encode(record)
+    assert raw[0] == SCHEMA_VERSION and len(raw) == len(FIELDS) + 1
+    # what the backends store: through JSON and back
+    assert decode(json.loads(json.dumps(raw))) == record
+
+    record.extra = {"legacy": [1, 2]}
+    raw = encode(record)
+    assert raw[-1] == {"legacy": [1, 2]}
+    assert decode(json.loads(json.dumps(raw))).extra == {"legacy": [1, 2]}
+
+
+def test_v1_dicts_are_migrated():
+    ids = ["newbie_blogger", "rising_star"]
+    legacy = {"username": "old", "subscribers": 7, "currency": 3, "achievements_unlocked": ids,
+              "referrer": 42, "settings": {"lang": "ru"}}
+    record = decode(legacy)
+    assert (record.username, record.subscribers, record.currency) == ("old", 7, 3)
+    assert record.achievements_mask == mask_from_ids(ids)
+    assert set(unlocked_ids(record.achievements_mask)) == set(ids)
+    # unknown keys are kept, and written back with the record
+    assert record.extra == {"referrer": 42, "settings": {"lang": "ru"}}
+    assert decode(encode(record)) == record
+    # missing fields get their defaults; a v1 record without unknown keys has no extra
+    plain = decode({"username": "bare"})
+    assert (plain.video_count, plain.achievements_mask, plain.extra) == (0, 0, None)
+    # legacy ids the bot no longer knows are dropped, not an error
+    assert decode({"achievements_unlocked": ["gone"]}).achievements_mask == 0
+
+
+def test_records_from_a_newer_schema_are_refused():
+    raw = encode(UserRecord("future"))
+    raw[0] = SCHEMA_VERSION + 1
+    with pytest.raises(ValueError, match="schema"):
+        decode(raw)
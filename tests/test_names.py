@@ -0,0 +1,47 @@
+import asyncio
+
+from teletube.db import NameIndex, UserStore
+from teletube.models import UserRecord
+from teletube.storage import JsonBackend
+
+
+def test_a_shared_name_stays_reachable_after_one_holder_renames(bot_state):
+    store = bot_state
+
+    async def run():
+        # usernames fall back to first names, so two users can both be "Alex"
+        store.get_user(1, "Alex")
+        store.get_user(2, "alex")
+        assert store.resolve("@ALEX") == 1
+        store.get_user(1, "alex_new")
+        assert store.resolve("@alex") == 2
+        assert store.find_username("Alex_New") == 1
+        # an import overwriting the record renames too
+        await store.put(2, UserRecord("bob"))
+        assert store.find_username("alex") is None
+        assert store.find_username("@bob") == 2
+        await store.flush()
+
+    asyncio.run(run())
+
+    # rebuilt from the backend, holders in load order
+    reloaded = UserStore(JsonBackend("database.json"))
+    reloaded.load()
+    reloaded.get_user(3, "bob")
+    assert reloaded.find_username("bob") == 2
+    reloaded.get_user(2, "carol")
+    assert reloaded.find_username("bob") == 3
+
+
+def test_name_index_keeps_every_holder():
+    index = NameIndex()
+    for uid in (5, 3, 9):
+        index.rename(uid, None, "@Same")
+    index.rename(3, None, "same")  # already holding it: keeps its place
+    assert index.find("same") == 5
+    index.rename(5, "same", None)
+    assert index.find("@SAME") == 3
+    index.rename(3, "Same", "other")
+    index.rename(9, "same", "")
+    assert index.find("same") is None and index._ids == {"other": {3: None}}
+    assert index.find("") is None
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from teletube.outbox import Outbox, PRIORITY_REPLY, PRIORITY_NOTIFY, PRIORITY_REMINDER
+
+
+class RecordingSession(BaseSession):
+    """Answers every sendMessage and records (seconds since start, chat_id, text, parse_mode).
+
+    `flood[chat_id]` is how many calls to that chat fail with a 1 s flood wait first.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self.flood = {}
+        self.attempts = 0
+        self.start = time.monotonic()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.attempts += 1
+        if self.flood.get(method.chat_id):
+            self.flood[method.chat_id] -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        # an unset parse_mode is aiogram's Default placeholder
+        mode = method.parse_mode if isinstance(method.parse_mode, str) else None
+        self.sent.append((time.monotonic() - self.start, method.chat_id, method.text, mode))
+        return Message.model_validate({"message_id": len(self.sent), "date": int(time.time()), "text": method.text,
+                                       "chat": {"id": method.chat_id, "type": "private"}}, context={"bot": bot})
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def bot():
+    return Bot(token="123456:outbox-test", session=RecordingSession())
+
+
+def message(bot, chat_id, text, **kwargs):
+    return SendMessage(chat_id=chat_id, text=text, **kwargs).as_(bot)
+
+
+def run(outbox: Outbox, make_futures):
+    async def main():
+        futures = make_futures()
+        try:
+            return await asyncio.gather(*futures, return_exceptions=True)
+        finally:
+            await outbox.close()
+    return asyncio.run(main())
+
+
+def test_coalescing_respects_parse_mode_markup_and_length(bot):
+    outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="ok", callback_data="ok")]])
+    emoji = "😀" * 2000  # 2000 characters, 4000 UTF-16 code units
+
+    results = run(outbox, lambda: [
+        outbox.post(message(bot, 1, "one", parse_mode="HTML"), PRIORITY_REPLY, coalesce=True),
+        outbox.post(message(bot, 1, "two", parse_mode="HTML"), PRIORITY_NOTIFY, coalesce=True),
+        outbox.post(message(bot, 1, "plain"), PRIORITY_NOTIFY, coalesce=True),
+        outbox.post(message(bot, 1, "keyboard", parse_mode="HTML", reply_markup=keyboard), PRIORITY_NOTIFY,
+                    coalesce=True),
+        outbox.post(message(bot, 1, "alone", parse_mode="HTML"), PRIORITY_NOTIFY),
+        outbox.post(message(bot, 2, "other chat", parse_mode="HTML"), PRIORITY_NOTIFY, coalesce=True),
+        outbox.post(message(bot, 3, emoji), PRIORITY_REPLY, coalesce=True),
+        outbox.post(message(bot, 3, "😀" * 100), PRIORITY_NOTIFY, coalesce=True),
+    ])
+
+    sent = sorted((chat, text, mode) for _, chat, text, mode in bot.session.sent)
+    assert sent == sorted([
+        (1, "one\ntwo", "HTML"), (1, "plain", None), (1, "keyboard", "HTML"), (1, "alone", "HTML"),
+        (2, "other chat", "HTML"), (3, emoji, None), (3, "😀" * 100, None),
+    ])
+    # both callers of a merged message get its result
+    assert results[0] is results[1]
+    assert all(len(text.encode("utf-16-le")) // 2 <= 4096 for _, _, text, _ in bot.session.sent)
+
+
+def test_higher_priority_goes_first(bot):
+    outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000)
+    run(outbox, lambda: [
+        outbox.post(message(bot, 1, "reminder"), PRIORITY_REMINDER),
+        outbox.post(message(bot, 2, "notice"), PRIORITY_NOTIFY),
+        outbox.post(message(bot, 3, "reply"), PRIORITY_REPLY),
+        outbox.post(message(bot, 4, "second reply"), PRIORITY_REPLY),
+    ])
+    assert [text for _, _, text, _ in bot.session.sent] == ["reply", "second reply", "notice", "reminder"]
+
+
+def test_a_busy_chat_does_not_hold_up_or_spend_the_global_rate(bot):
+    # two sends per second overall; chat 1 may send one message every 0.2 s
+    outbox = Outbox(global_rate=2, chat_rate=5, chat_burst=1)
+    run(outbox, lambda: [
+        outbox.post(message(bot, 1, "a1"), PRIORITY_REPLY),
+        outbox.post(message(bot, 1, "a2"), PRIORITY_REPLY),
+        outbox.post(message(bot, 2, "b1"), PRIORITY_REPLY),
+    ])
+    sent = {text: at for at, _, text, _ in bot.session.sent}
+    assert [text for _, _, text, _ in bot.session.sent] == ["a1", "b1", "a2"]
+    # a2 waiting for its chat took no global token, so b1 went out at once
+    assert sent["b1"] < 0.15
+    assert sent["a2"] >= 0.15
+
+
+def test_flood_wait_requeues_and_blocks_only_that_chat(bot):
+    outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=3)
+    bot.session.flood[1] = 1
+    results = run(outbox, lambda: [
+        outbox.post(message(bot, 1, "flooded"), PRIORITY_REPLY),
+        outbox.post(message(bot, 2, "other"), PRIORITY_REPLY),
+    ])
+    sent = {text: at for at, _, text, _ in bot.session.sent}
+    assert sent["other"] < 0.5
+    assert 0.9 <= sent["flooded"] < 2.5
+    assert isinstance(results[0], Message) and results[0].text == "flooded"
+
+
+def test_max_retries_surfaces_the_flood_wait_to_the_caller(bot):
+    outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000, max_retries=1)
+    bot.session.flood[1] = 5
+
+    async def main():
+        try:
+            with pytest.raises(TelegramRetryAfter):
+                await outbox.send(message(bot, 1, "never"))
+        finally:
+            await outbox.close()
+
+    asyncio.run(main())
+    assert bot.session.attempts == 2
+    assert bot.session.sent == []
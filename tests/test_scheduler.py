@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import teletube.scheduler as scheduler_module
+from teletube.models import UserRecord
+from teletube.scheduler import CooldownScheduler
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, method, priority=None, coalesce=False):
+        self.sent.append(method.chat_id)
+
+
+def test_rescheduled_and_cancelled_reminders_leave_only_stale_heap_entries(bot_state):
+    s = CooldownScheduler()
+    now = time.time()
+    s.schedule(1, 101, now + 100)
+    s.schedule(1, 101, now - 1)           # earlier: the old entry stays in the heap
+    s.schedule(2, 102, now - 5)
+    s.schedule(2, 102, now + 100)         # later: the due entry is stale now
+    s.schedule(3, 103, now - 2)
+    s.cancel(3)
+    assert len(s) == 2
+    assert s._pop_due(now) == [(1, 101, now - 1)]
+    assert s._pop_due(now + 1000) == [(2, 102, now + 100)]
+    assert s._pop_due(now + 2000) == [] and len(s) == 0
+
+    # rescheduling one user over and over does not grow the heap without bound
+    for i in range(5000):
+        s.schedule(4, 104, now + i)
+    assert len(s._heap) <= 2 * len(s) + 1025
+
+
+def test_start_rehydrates_and_fires_overdue_reminders_in_batches(bot_state, monkeypatch):
+    store = bot_state
+    fake = FakeOutbox()
+    monkeypatch.setattr(scheduler_module, "outbox", fake)
+    now = time.time()
+
+    async def run():
+        for uid in range(1, 11):
+            # overdue while the bot was stopped
+            await store.put(uid, UserRecord(f"u{uid}", cooldown_notification_task={'ends_at': now - uid, 'chat_id': 1000 + uid}))
+        # written before chat_id was stored: the private chat is the user's id
+        await store.put(11, UserRecord("legacy", cooldown_notification_task={'ends_at': now - 1}))
+        await store.put(12, UserRecord("later", cooldown_notification_task={'ends_at': now + 3600, 'chat_id': 1012}))
+        await store.put(13, UserRecord("none"))
+
+        s = CooldownScheduler(batch_size=3)
+        assert s._pop_due(now) == []
+        s.start(bot=None)
+        assert len(s) == 12
+        for _ in range(100):
+            if len(fake.sent) == 11:
+                break
+            await asyncio.sleep(0.01)
+        await s.close()
+        return s
+
+    s = asyncio.run(run())
+    assert sorted(fake.sent) == [11] + list(range(1001, 1011))
+    assert len(s) == 1
+    # delivered reminders are cleared from the records, the pending one is kept
+    assert all(store.peek(uid).cooldown_notification_task is None for uid in range(1, 12))
+    assert store.peek(12).cooldown_notification_task == {'ends_at': now + 3600, 'chat_id': 1012}
+
+
+def test_due_reminders_are_popped_at_most_a_batch_at_a_time(bot_state):
+    s = CooldownScheduler(batch_size=4)
+    now = time.time()
+    for uid in range(10):
+        s.schedule(uid, uid, now - 10 + uid)
+    batches = []
+    while True:
+        due = s._pop_due(now)
+        if not due:
+            break
+        batches.append([uid for uid, _, _ in due])
+    # oldest first, in batches of four
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
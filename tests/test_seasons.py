@@ -0,0 +1,51 @@
+import asyncio
+import json
+from datetime import date
+
+from teletube.history import History, VIDEO
+from teletube.seasons import Seasons, _day_start
+
+
+def _shard(path, events):
+    h = History(str(path))
+    for user_id, delta, ts in events:
+        h.record(user_id, VIDEO, 0, subs_delta=delta, ts=ts)
+    h.flush()
+    return h, Seasons(h, season_days=7, archive_top=3)
+
+
+def test_start_archives_an_empty_season_once(bot_state, tmp_path, monkeypatch):
+    h, s = _shard(tmp_path / "h", [])
+    asyncio.run(s.start())
+    with open(s.archive_path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    current = s.windows['season'].id
+    assert [(e['season'], e['players'], e['top']) for e in entries] == [(current - 1, 0, [])]
+    assert s.archive(1) == []
+
+    # the marker keeps the next start from replaying the previous season
+    since = []
+    restarted = Seasons(h, season_days=7, archive_top=3)
+    monkeypatch.setattr(h, "events_since", lambda ts: since.append(ts) or History.events_since(h, ts))
+    asyncio.run(restarted.start())
+    assert since == [_day_start(restarted.windows['season'].first_day(current))]
+    h.close()
+
+
+def test_last_season_is_merged_across_shards(bot_state, tmp_path, monkeypatch):
+    today = date.today().toordinal()
+    ts = _day_start(today - 7) + 3600
+    h1, s1 = _shard(tmp_path / "h1", [(1, 50, ts), (2, 10, ts), (3, 5, ts)])
+    h2, s2 = _shard(tmp_path / "h2", [(4, 30, ts), (5, 70, ts)])
+    s1.load()
+    s2.load()
+    monkeypatch.setattr(bot_state, "peers", {1: s2.summary(10)})
+
+    last = s1.archive(1)[0]
+    assert last['season'] == s1.windows['season'].id - 1
+    assert last['players'] == 5
+    assert [(uid, score) for uid, _, score in last['top']] == [(5, 70), (1, 50), (4, 30)]
+    # the shard's own archive keeps only its players
+    assert s1._read_archive()[-1]['players'] == 3
+    h1.close()
+    h2.close()
@@ -0,0 +1,63 @@
+"""The vectorized simulator against the scalar rules the handlers use.
+
+With pytest-benchmark installed (requirements-dev.txt), `pytest tests/test_simulator.py --benchmark-only`
+also times both paths; `benchmarks/simulator.py` prints the same comparison.
+"""
+import random
+import statistics
+
+import numpy as np
+import pytest
+
+from teletube.simulator import Simulation, vector_popularity, volatility_table
+from teletube.utils import evaluate_video_popularity, title_score
+
+try:
+    import pytest_benchmark
+except ImportError:
+    pytest_benchmark = None
+
+needs_benchmark = pytest.mark.skipif(pytest_benchmark is None, reason="pytest-benchmark is not installed")
+
+TITLES = ("мой влог", "Новый обзор 2025: лучший гайд", "хайп хайп популярное")
+SAMPLES = 20000
+
+
+@pytest.mark.parametrize("subs", [0, 15, 500])
+@pytest.mark.parametrize("title", TITLES)
+def test_vector_popularity_has_the_scalar_distribution(title, subs):
+    random.seed(1)
+    scalar = [evaluate_video_popularity(title, 0, subs) for _ in range(SAMPLES)]
+    vector = vector_popularity(np.random.default_rng(2), np.full(SAMPLES, title_score(title), dtype=np.int32),
+                               np.full(SAMPLES, subs, dtype=np.int32), volatility_table())
+    s_mean, s_sd = statistics.fmean(scalar), statistics.pstdev(scalar)
+    # difference of the means in standard errors; both sides are seeded
+    z = abs(s_mean - float(vector.mean())) / (s_sd * (2 / SAMPLES) ** 0.5)
+    assert z < 4
+    assert float(vector.std()) == pytest.approx(s_sd, rel=0.05)
+    assert (int(vector.min()), int(vector.max())) == (min(scalar), max(scalar))
+
+
+def test_simulation_is_reproducible():
+    first = Simulation(2000, seed=3).run(10).report()
+    assert Simulation(2000, seed=3).run(10).report() == first
+
+
+@needs_benchmark
+def test_bench_scalar_popularity(benchmark):
+    benchmark(evaluate_video_popularity, TITLES[1], 0, 42)
+
+
+@needs_benchmark
+def test_bench_vector_popularity(benchmark):
+    rng = np.random.default_rng(1)
+    base = np.full(100000, title_score(TITLES[1]), dtype=np.int32)
+    subs = np.full(100000, 42, dtype=np.int32)
+    result = benchmark(vector_popularity, rng, base, subs, volatility_table())
+    assert len(result) == 100000
+
+
+@needs_benchmark
+def test_bench_simulation_day(benchmark):
+    sim = Simulation(100000, seed=1)
+    benchmark(sim.step_day)
@@ -0,0 +1,69 @@
+import asyncio
+
+import teletube.stats as stats
+from teletube.models import UserRecord
+from teletube.stats import HOURS_KEPT, Aggregates, RingCounter, adjustment
+
+
+def test_ring_slots_are_reused_after_a_full_turn():
+    ring = RingCounter(4)
+    ring.add(10, 2)
+    ring.add(11)
+    ring.add(10)
+    assert (ring.get(10), ring.get(11), ring.get(12)) == (3, 1, 0)
+    # slot 14 lands where 10 was: the old hour is dropped, not added to
+    ring.add(14, 5)
+    assert (ring.get(10), ring.get(14)) == (0, 5)
+    assert ring.sum(14, 4) == 1 + 5  # hours 11..14
+    # asking for more slots than are kept sums what is kept
+    assert ring.sum(14, 100) == ring.sum(14, 4)
+
+
+def test_videos_24h_counts_the_last_24_hours(monkeypatch):
+    now = [1000]
+    monkeypatch.setattr(stats, "current_hour", lambda: now[0])
+    agg = Aggregates()
+    agg.change(None, (0, 0, 0))
+    for hour in range(1000, 1000 + HOURS_KEPT + 10):
+        now[0] = hour
+        # one video an hour, and a second one every fourth hour
+        agg.change((0, 0, 0), (0, 1 + (hour % 4 == 0), 0))
+    totals = agg.totals()
+    assert totals["videos_1h"] == 1 + (now[0] % 4 == 0)
+    assert totals["videos_24h"] == 24 + sum(h % 4 == 0 for h in range(now[0] - 23, now[0] + 1))
+    # an idle day later nothing is left in the window, stale slots included
+    now[0] += 24
+    assert agg.totals()["videos_24h"] == 0 and agg.totals()["videos_1h"] == 0
+    now[0] += HOURS_KEPT
+    assert agg.totals()["videos_24h"] == 0
+
+
+def test_minted_and_spent_follow_the_currency_direction():
+    agg = Aggregates()
+    agg.change(None, (0, 0, 10))
+    agg.change((0, 0, 10), (5, 1, 4))
+    agg.change(None, (1, 0, 0))
+    totals = agg.totals()
+    assert (totals["users"], totals["subscribers"], totals["video_count"], totals["currency"]) == (2, 6, 1, 4)
+    assert (totals["minted_24h"], totals["spent_24h"], totals["videos_24h"]) == (10, 6, 1)
+
+
+def test_imports_and_admin_grants_move_only_the_totals(bot_state):
+    store = bot_state
+
+    async def run():
+        await store.put(1, UserRecord("imported", subscribers=50, video_count=30, currency=1000))
+        await store.put(1, UserRecord("imported", subscribers=60, video_count=40, currency=5000))
+        with adjustment():
+            async with store.user(1) as ud:
+                ud.currency += 300
+        # a player's own video and purchase still count
+        async with store.user(1) as ud:
+            ud.video_count += 1
+            ud.currency -= 100
+
+    asyncio.run(run())
+    totals = store.totals()
+    assert (totals["video_count"], totals["currency"], totals["subscribers"]) == (41, 5200, 60)
+    assert (totals["videos_24h"], totals["minted_24h"], totals["spent_24h"]) == (1, 0, 100)
+    assert store.check_stats()
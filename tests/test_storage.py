@@ -0,0 +1,29 @@
+import sqlite3
+
+from teletube.models import UserRecord
+from teletube.storage import SqliteBackend
+
+
+def test_sqlite_drops_the_unused_indexes_of_older_databases(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    # the schema databases were created with before
+    conn.executescript("""
+        CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT,
+                            subscribers INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+        CREATE INDEX idx_users_subscribers ON users (subscribers DESC);
+        CREATE INDEX idx_users_username ON users (username COLLATE NOCASE);
+    """)
+    conn.close()
+
+    backend = SqliteBackend(path)
+    backend.write(backend.prepare({1: UserRecord("a", subscribers=5)}, {}))
+    indexes = backend._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+    assert indexes == []
+    assert backend.load_all()[1].subscribers == 5
+
+    # /CHEATDeleteDatabase empties the table, the file stays
+    backend.clear()
+    assert backend.load_all() == {}
+    backend.close()
+    assert (tmp_path / "old.db").exists()
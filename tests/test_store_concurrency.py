@@ -0,0 +1,81 @@
+"""Many concurrent `store.user()` transactions on shared and separate users, against every backend."""
+import asyncio
+import random
+
+import pytest
+
+from teletube.db import UserStore
+from teletube.storage import create_backend
+
+BACKENDS = ["json://database.json", "journal://database.json", "sqlite:///teletube.db"]
+HOT_USERS = 10
+COLD_USERS = 2000
+OPERATIONS = 8000
+
+
+class Boom(Exception):
+    pass
+
+
+async def hammer(url: str):
+    rnd = random.Random(url)
+    store = UserStore(create_backend(url), flush_interval=0.005, flush_threshold=50)
+    await store.start()
+    currency = {}
+    subscribers = {}
+
+    async def change(user_id: int, coins: int, subs: int, fail: bool):
+        async with store.user(user_id, f"user{user_id}") as ud:
+            # read, yield to the other transactions, write back: lost updates would show up
+            before = ud.currency
+            ud.subscribers += subs
+            await asyncio.sleep(0)
+            ud.currency = before + coins
+            if fail:
+                ud.currency += 10 ** 6
+                await asyncio.sleep(0)
+                raise Boom
+
+    async def guarded(user_id: int, coins: int, subs: int, fail: bool):
+        try:
+            await change(user_id, coins, subs, fail)
+        except Boom:
+            assert fail
+
+    tasks = []
+    for _ in range(OPERATIONS):
+        hot = rnd.random() < 0.5
+        user_id = rnd.randrange(HOT_USERS) if hot else HOT_USERS + rnd.randrange(COLD_USERS)
+        coins, subs, fail = rnd.randint(-5, 20), rnd.randint(0, 3), rnd.random() < 0.1
+        currency.setdefault(user_id, 0)
+        subscribers.setdefault(user_id, 0)
+        if not fail:
+            currency[user_id] += coins
+            subscribers[user_id] += subs
+        tasks.append(guarded(user_id, coins, subs, fail))
+    await asyncio.gather(*tasks)
+
+    assert {uid: store.peek(uid).currency for uid in currency} == currency
+    assert {uid: store.peek(uid).subscribers for uid in subscribers} == subscribers
+    assert store.check_stats()
+    totals = store.totals()
+    assert totals['users'] == len(currency)
+    assert totals['currency'] == sum(currency.values())
+    assert totals['subscribers'] == sum(subscribers.values())
+    best = sorted(subscribers.items(), key=lambda e: (-e[1], e[0]))[:20]
+    assert [(uid, ud.subscribers) for uid, ud in store.top_users(20)] == best
+    # locks are dropped once nobody waits for them
+    assert not store._user_locks
+    await store.close()
+
+    reloaded = UserStore(create_backend(url))
+    assert {uid: reloaded.peek(uid).currency for uid in currency} == currency
+    assert {uid: reloaded.peek(uid).subscribers for uid in subscribers} == subscribers
+    assert reloaded.check_stats()
+    await reloaded.close()
+
+
+@pytest.mark.parametrize("url", BACKENDS)
+def test_concurrent_transactions_are_exact(url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    asyncio.run(hammer(url))
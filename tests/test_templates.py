@@ -0,0 +1,102 @@
+import pytest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+from teletube import config, templates
+from teletube.utils import escape_html
+
+
+# the handlers' f-strings before the templates, with the commands added since (/mystats, periods) in /help
+
+def old_start(first_name):
+    kb = ReplyKeyboardMarkup(keyboard=[
+        [KeyboardButton(text="/addvideo Название Видео")],
+        [KeyboardButton(text="/myprofile"), KeyboardButton(text="/shop")],
+        [KeyboardButton(text="/leaderboard"), KeyboardButton(text="/achievements")],
+        [KeyboardButton(text="/daily"), KeyboardButton(text="/help")]
+    ], resize_keyboard=True)
+    return f"🚀 Привет, {escape_html(first_name or '')}! Ты в игре <b>{escape_html(config.BOT_NAME)}</b>!\nИспользуй /help или кнопки.", kb
+
+
+def old_help():
+    return (
+        f"🌟 <b>{escape_html(config.BOT_NAME)}!</b>\n\n"
+        "Публикуй видео, копи валюту и прокачивайся!\n\n"
+        "<b>Команды:</b>\n"
+        f"🎬 <code>/addvideo {escape_html('<название>')}</code>\n"
+        f"🏆 <code>/leaderboard</code>  <code>/leaderboardpic</code>\n"
+        f"📅 <code>/leaderboard day|week|season|last</code>\n"
+        f"👤 <code>/myprofile</code>  <code>/mystats</code>\n"
+        f"🛍️ <code>/shop</code>\n"
+        f"🎁 <code>/daily</code>\n"
+        f"🏅 <code>/achievements</code>\n"
+        f"❓ <code>/help</code>\n\n"
+        f"Механика: публикация раз в {config.COOLDOWN_HOURS:.1f} ч. Популярность зависит от заголовка, слов-ключей и удачи. Есть события и магазин.\n\n"
+    )
+
+
+def old_shop(bal):
+    txt = f"🛍️ <b>Магазин {escape_html(config.BOT_NAME)}</b>\nБаланс: {escape_html(bal)} {escape_html(config.DEFAULT_CURRENCY_NAME)}\n\n"
+    kb_rows = []
+    for item_id, item in config.shop_items.items():
+        txt += f"🔹 <b>{escape_html(item['name'])}</b> - {escape_html(item['price'])} {escape_html(config.DEFAULT_CURRENCY_NAME)}\n   <i>{escape_html(item['description'])}</i>\n\n"
+        kb_rows.append([InlineKeyboardButton(text=f"Купить {item['name']} ({item['price']})", callback_data=f"shop_buy:{item_id}")])
+    markup = InlineKeyboardMarkup(inline_keyboard=kb_rows) if kb_rows else None
+    return txt, markup
+
+
+@pytest.fixture(params=["default", "html"])
+def settings(request, monkeypatch):
+    if request.param == "html":
+        # names that need escaping, and a shop item added at runtime
+        monkeypatch.setattr(config, "BOT_NAME", "Tele<Tube> & \"Co\"")
+        monkeypatch.setattr(config, "DEFAULT_CURRENCY_NAME", "<монет>")
+        monkeypatch.setattr(config, "COOLDOWN_HOURS", 0.25)
+        items = dict(config.shop_items)
+        items["x&y"] = {"name": "<b>Буст</b>", "price": 10, "description": "a < b & c > d"}
+        monkeypatch.setattr(config, "shop_items", items)
+    templates.invalidate()
+    yield
+    templates.invalidate()
+
+
+@pytest.mark.parametrize("first_name", ["Вася", "<script>&amp;", "", None])
+def test_start_is_unchanged(settings, first_name):
+    text, kb = templates.start(first_name)
+    old_text, old_kb = old_start(first_name)
+    assert text.encode() == old_text.encode()
+    assert kb == old_kb
+    assert templates.start(first_name)[1] is kb
+
+
+def test_help_is_unchanged(settings):
+    assert templates.help_text().encode() == old_help().encode()
+
+
+@pytest.mark.parametrize("balance", [0, 12345, -7])
+def test_shop_is_unchanged(settings, balance):
+    text, markup = templates.shop(balance)
+    old_text, old_markup = old_shop(balance)
+    assert text.encode() == old_text.encode()
+    assert markup == old_markup
+
+
+def test_an_empty_shop_has_no_keyboard(monkeypatch):
+    monkeypatch.setattr(config, "shop_items", {})
+    templates.invalidate()
+    try:
+        assert templates.shop(5) == old_shop(5)
+        assert templates.shop(5)[1] is None
+    finally:
+        templates.invalidate()
+
+
+def test_invalidate_picks_up_changed_settings(monkeypatch):
+    templates.invalidate()
+    before = templates.help_text()
+    monkeypatch.setattr(config, "BOT_NAME", "Renamed")
+    # cached until invalidated
+    assert templates.help_text() is before
+    templates.invalidate()
+    assert templates.help_text() == old_help() != before
+    monkeypatch.undo()
+    templates.invalidate()
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import Update
+
+import teletube.throttling as throttling
+from teletube.config import CREATOR_ID
+from teletube.throttling import DedupMiddleware, ThrottlingMiddleware, TTLSet
+
+
+class CallbackSession(BaseSession):
+    """Records the text of every callback query answer; nothing else is expected."""
+
+    def __init__(self):
+        super().__init__()
+        self.answers = []
+
+    async def make_request(self, bot, method, timeout=None):
+        assert isinstance(method, AnswerCallbackQuery)
+        self.answers.append(method.text)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def message_update(update_id: int, text: str, user_id: int = 1) -> Update:
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"}, "text": text,
+    }})
+
+
+def tap_update(update_id: int, data: str, message_id: int = 7, user_id: int = 1) -> Update:
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "c", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+        "message": {"message_id": message_id, "date": 0, "chat": {"id": user_id, "type": "private"}, "text": "shop"},
+    }})
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Feeds updates through a dispatcher wired like main.build_dispatcher; returns (run, handled, replies, bot)."""
+    handled, replies = [], []
+
+    async def fake_answer(message, text, **kwargs):
+        replies.append((message.chat.id, text))
+
+    monkeypatch.setattr(throttling, "answer", fake_answer)
+    dp = Dispatcher()
+    dp.update.outer_middleware(DedupMiddleware(tap_ttl=2))
+    throttle = ThrottlingMiddleware(rate=0.001, burst=2, heavy_rate=0.001, heavy_burst=1)
+    dp.message.middleware(throttle)
+    dp.callback_query.middleware(throttle)
+
+    async def cmd_ping(message):
+        handled.append(("ping", message.from_user.id))
+
+    async def cmd_leaderboardpic(message):
+        handled.append(("pic", message.from_user.id))
+
+    async def cb_shop_buy(query):
+        handled.append(("buy", query.data))
+        await query.answer()
+
+    dp.message.register(cmd_ping, F.text == "/ping")
+    dp.message.register(cmd_leaderboardpic, F.text == "/lppic")
+    dp.callback_query.register(cb_shop_buy)
+    bot = Bot(token="123456:throttling-test", session=CallbackSession())
+
+    def run(*updates):
+        async def main():
+            for update in updates:
+                await dp.feed_update(bot, update)
+        asyncio.run(main())
+
+    run.throttle = throttle
+    return run, handled, replies, bot
+
+
+def test_repeated_commands_get_one_refusal_then_silence(feed):
+    run, handled, replies, _ = feed
+    run(*(message_update(i, "/ping") for i in range(1, 6)))
+    # burst of two, then one refusal for the wait period, then silence
+    assert handled == [("ping", 1)] * 2
+    assert replies == [(1, throttling._THROTTLED_TEXT)]
+
+    # buckets are per user and per handler; heavy handlers have their own limits
+    run(message_update(10, "/ping", user_id=2), message_update(11, "/lppic"), message_update(12, "/lppic"))
+    assert handled[2:] == [("ping", 2), ("pic", 1)]
+    assert replies[1:] == [(1, throttling._THROTTLED_TEXT)]
+
+
+def test_the_admin_is_never_throttled(feed):
+    run, handled, replies, _ = feed
+    run(*(message_update(i, "/ping", user_id=CREATOR_ID) for i in range(1, 11)))
+    assert len(handled) == 10 and replies == []
+    assert len(run.throttle) == 0
+
+
+def test_redelivered_updates_and_double_taps_are_dropped(feed):
+    run, handled, _, bot = feed
+    run(message_update(1, "/ping"), message_update(1, "/ping"))
+    assert handled == [("ping", 1)]
+
+    run(tap_update(20, "buy:boost"), tap_update(21, "buy:boost"), tap_update(22, "buy:other", user_id=2),
+        tap_update(23, "buy:boost", message_id=8))
+    # the double tap is dropped but its spinner still stopped; other data or another message is a new tap
+    assert handled[1:] == [("buy", "buy:boost"), ("buy", "buy:other"), ("buy", "buy:boost")]
+    assert bot.session.answers == [None] * 4
+
+
+def test_buckets_are_evicted_least_recently_used_first():
+    throttle = ThrottlingMiddleware(max_buckets=3)
+    first = throttle._bucket((1, "cmd_ping"))
+    throttle._bucket((2, "cmd_ping"))
+    throttle._bucket((3, "cmd_ping"))
+    assert throttle._bucket((1, "cmd_ping")) is first  # used again: now the most recent
+    throttle._bucket((4, "cmd_ping"))
+    assert len(throttle) == 3
+    assert list(throttle._buckets) == [(3, "cmd_ping"), (1, "cmd_ping"), (4, "cmd_ping")]
+    # an evicted user starts over with a full bucket
+    assert throttle._bucket((2, "cmd_ping")).tokens == throttle.limits[False][1]
+    assert (3, "cmd_ping") not in throttle._buckets
+    # heavy handlers get the heavy limits
+    assert throttle._bucket((1, "cmd_leaderboardpic")).capacity == throttle.limits[True][1]
+
+
+def test_ttl_set_forgets_keys_after_the_ttl_and_when_full():
+    seen = TTLSet(ttl=10, max_size=3)
+    assert seen.add("a", 0) and not seen.add("a", 9.9)
+    assert seen.add("a", 10)  # expired exactly at the TTL
+    assert seen.add("b", 11) and seen.add("c", 12) and len(seen) == 3
+    assert seen.add("d", 13)  # full: the oldest ("a") is dropped
+    assert len(seen) == 3 and seen.add("a", 13)
+    # everything expires together once the TTL has passed
+    assert seen.add("e", 100) and len(seen) == 1
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from teletube.db import UserStore
+from teletube.models import UserRecord
+from teletube.storage import JsonBackend, create_backend
+from teletube.transfer import Writer, import_backend, import_store
+
+
+def write_export(path: str, count: int):
+    writer = Writer(path)
+    writer.write(writer.format((uid, UserRecord(f"user{uid}", subscribers=uid)) for uid in range(count)))
+    writer.close()
+
+
+def test_import_keeps_only_this_shards_users(tmp_path):
+    source = str(tmp_path / "users.csv")
+    write_export(source, 100)
+    forwarded = []
+
+    async def run():
+        store = UserStore(JsonBackend(str(tmp_path / "database.json")))
+        store.shard = (1, 3)
+        result = await import_store(store, source, chunk_size=7)
+        assert sorted(uid for uid, _ in store.users()) == list(range(1, 100, 3))
+        store.forward = forwarded.extend
+        assert await import_store(store, source, chunk_size=7) == (33, 67, 0)
+        await store.close()
+        return result
+
+    assert asyncio.run(run()) == (33, 0, 67)
+    assert sorted(uid for uid, _ in forwarded) == [uid for uid in range(100) if uid % 3 != 1]
+    assert all(record.subscribers == uid for uid, record in forwarded)
+
+
+@pytest.mark.parametrize("url", ["journal://database.json", "sqlite:///teletube.db", "json://database.json"])
+def test_offline_import_writes_chunks_and_merges(url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_export("users.jsonl", 100)
+    backend = create_backend(url)
+    backend.write(backend.prepare({500: UserRecord("old")}, {500: UserRecord("old")}))
+    # users per write
+    writes = []
+    prepare = backend.prepare
+    monkeypatch.setattr(backend, "prepare", lambda changed, data: writes.append(len(changed)) or prepare(changed, data))
+
+    assert import_backend("users.jsonl", backend, chunk_size=30) == 100
+    assert writes == ([30, 30, 30, 10] if backend.incremental else [101])
+    data = backend.load_all()
+    backend.close()
+    assert sorted(data) == list(range(100)) + [500]
+    assert data[42].subscribers == 42 and data[500].username == "old"
+
+
+@pytest.mark.parametrize("name", ["users.jsonl", "users.csv"])
+def test_export_round_trip_keeps_legacy_keys(name, tmp_path):
+    from teletube.models import decode
+    from teletube.transfer import Reader
+
+    legacy = decode({'username': 'old', 'subscribers': 5, 'achievements_unlocked': [], 'referrer': 42,
+                     'flags': {'beta': True}})
+    plain = UserRecord("new", currency=3, active_event={"message": "x"})
+    path = str(tmp_path / name)
+    writer = Writer(path)
+    writer.write(writer.format([(1, legacy), (2, plain)]))
+    writer.close()
+
+    reader = Reader(path)
+    rows = dict(reader.read())
+    reader.close()
+    assert rows[1].extra == {'referrer': 42, 'flags': {'beta': True}}
+    assert rows[1] == legacy
+    assert rows[2].extra is None
+    assert rows[2] == plain
@@ -0,0 +1,116 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from teletube.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "s3cret"
+
+
+def update(update_id: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "u"}, "text": "/ping",
+    }}
+
+
+def with_server(body, max_concurrency: int = 2):
+    """Runs `body(server, client, handled, gate)` against a webhook whose handler waits for `gate`."""
+    handled = []
+
+    async def main():
+        gate = asyncio.Event()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def cmd_ping(message):
+            await gate.wait()
+            handled.append(message.message_id)
+
+        server = WebhookServer(dp, Bot(token="123456:webhook-test"), secret=SECRET, path="/hook",
+                               max_concurrency=max_concurrency)
+        client = TestClient(TestServer(server.app))
+        await client.start_server()
+        try:
+            await body(server, client, handled, gate)
+        finally:
+            gate.set()
+            await server.drain(timeout=1)
+            await client.close()
+
+    asyncio.run(main())
+
+
+def post(client, update_id: int, secret: str = SECRET):
+    return client.post("/hook", json=update(update_id), headers={SECRET_HEADER: secret})
+
+
+def test_a_wrong_or_missing_secret_is_refused():
+    async def body(server, client, handled, gate):
+        assert (await post(client, 1, secret="wrong")).status == 401
+        assert (await client.post("/hook", json=update(2))).status == 401
+        assert (await post(client, 3)).status == 200
+        assert (await post(client, 4, secret="")).status == 401
+        gate.set()
+        await server.drain()
+        assert handled == [3]
+
+    with_server(body)
+
+
+def test_bad_payloads_get_400():
+    async def body(server, client, handled, gate):
+        response = await client.post("/hook", data="not json", headers={SECRET_HEADER: SECRET})
+        assert response.status == 400
+        assert len(server) == 0
+
+    with_server(body)
+
+
+def test_a_full_pool_holds_requests_and_refuses_them_once_draining():
+    async def body(server, client, handled, gate):
+        assert (await post(client, 1)).status == 200
+        assert (await post(client, 2)).status == 200
+        assert len(server) == 2
+        # the pool is full: the third request is not acknowledged until a slot frees up
+        held = asyncio.ensure_future(post(client, 3))
+        await asyncio.sleep(0.1)
+        assert not held.done()
+
+        # shutting down while it waits: it gets 503 so Telegram redelivers it
+        drain = asyncio.ensure_future(server.drain(timeout=5))
+        await asyncio.sleep(0.05)
+        assert (await post(client, 4)).status == 503
+        assert (await client.get("/healthz")).status == 503
+        gate.set()
+        await drain
+        assert (await held).status == 503
+        assert sorted(handled) == [1, 2] and len(server) == 0
+
+    with_server(body)
+
+
+def test_a_held_request_is_accepted_when_a_slot_frees_up():
+    async def body(server, client, handled, gate):
+        await post(client, 1)
+        held = asyncio.ensure_future(post(client, 2))
+        await asyncio.sleep(0.1)
+        assert not held.done()
+        gate.set()
+        assert (await held).status == 200
+        await server.drain()
+        assert handled == [1, 2]
+
+    with_server(body, max_concurrency=1)
+
+
+def test_drain_cancels_updates_that_outlive_the_timeout():
+    async def body(server, client, handled, gate):
+        await post(client, 1)
+        health = await client.get("/healthz")
+        assert health.status == 200 and await health.text() == "in_flight 1\n"
+        await server.drain(timeout=0.1)
+        assert len(server) == 0 and handled == []
+
+    with_server(body)